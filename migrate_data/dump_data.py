@@ -2,18 +2,62 @@
 import sys
 sys.path.append('.')
 
-import subprocess
-from migrate_data.env import get_app_env, get_data_dir, get_data_filename, python, pythonpath, manage_py, models
-
-app_env = get_app_env()
-env = {
-    'DJANGO_GALLERY_ENVIRONMENT': app_env,
-    'PYTHONPATH': pythonpath,
-}
-subprocess.call(['mkdir', '-p', get_data_dir(app_env)])
-for model in models:
-    filename = get_data_filename(app_env, model)
-    print "dumping %s to %s" % (model, filename)
-    output = open(filename, 'w')
-    subprocess.Popen([python, manage_py, 'dumpdata', '--indent', '2', model], env=env, stdout=output)
+import os
+import json
+from migrate_data.env import get_app_env, get_data_dir, get_data_filename, setup_django, models
+
+# Objects read per query
+chunk_size = 500
+
+if __name__ == '__main__':
+    app_env = get_app_env()
+    setup_django(app_env)
+
+from django.apps import apps
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def iter_chunks(model):
+    '''Yields the model's objects in lists of up to chunk_size, in pk order.'''
+    queryset = model._default_manager.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            break
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def dump(app_env, name):
+    '''Dumps the model's objects to its JSON lines file, as dumpdata would, but one
+       object per line.  Returns (filename, count).'''
+    data_dir = get_data_dir(app_env)
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    (app_label, model_name) = name.split('.')
+    model = apps.get_model(app_label, model_name)
+    filename = get_data_filename(app_env, name, 'jsonl')
+    print "dumping %s to %s" % (name, filename)
+
+    count = 0
+    output = open('%s.tmp' % filename, 'w')
+    for chunk in iter_chunks(model):
+        for obj in serializers.serialize('python', chunk):
+            output.write(json.dumps(obj, cls=DjangoJSONEncoder))
+            output.write('\n')
+        count += len(chunk)
     output.close()
+    os.rename('%s.tmp' % filename, filename)
+    print "dumped %s %s objs" % (count, name)
+    return (filename, count)
+
+
+if __name__ == '__main__':
+    for name in models:
+        dump(app_env, name)
@@ -1,4 +1,5 @@
 import sys
+import json
 import os.path
 
 python='./.virtualenv/bin/python'
@@ -24,8 +25,52 @@ def get_app_env(target=False):
 def get_data_dir(app_env):
     return os.path.join(data_dir, app_env)
 
-def get_data_filename(app_env, model):
-    return os.path.join(get_data_dir(app_env), '%s.json' % model)
+def get_data_filename(app_env, model, extension='json'):
+    return os.path.join(get_data_dir(app_env), '%s.%s' % (model, extension))
+
+def get_dump_filename(app_env, model):
+    '''Returns the model's dump file: JSON lines from dump_data.py, or JSON from dumpdata.'''
+    filename = get_data_filename(app_env, model, 'jsonl')
+    if not os.path.exists(filename):
+        filename = get_data_filename(app_env, model)
+    return filename
+
+def get_map_filename(app_env, model):
+    '''Returns the model's pk map: <model>.map.bin, or <model>.map.json from earlier loads.'''
+    filename = get_data_filename(app_env, '%s.map' % model, 'bin')
+    if not os.path.exists(filename):
+        json_filename = get_data_filename(app_env, '%s.map' % model)
+        if os.path.exists(json_filename):
+            filename = json_filename
+    return filename
+
+def read_objects(filename):
+    '''Yields the dumped objects in the file, reading JSON lines files a line at a time.'''
+    with open(filename, 'r') as input_file:
+        if filename.endswith('.jsonl'):
+            for line in input_file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for obj in json.load(input_file):
+                yield obj
+
+def count_objects(filename):
+    '''Returns the number of dumped objects in the file.'''
+    if filename.endswith('.jsonl'):
+        with open(filename, 'r') as input_file:
+            return sum(1 for line in input_file if line.strip())
+    return sum(1 for obj in read_objects(filename))
+
+def setup_django(app_env):
+    '''Sets up Django with the gallery settings for the given environment.'''
+    for path in pythonpath.split(':'):
+        sys.path.append(path)
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'gallery.settings'
+    os.environ['DJANGO_GALLERY_ENVIRONMENT'] = app_env
+
+    import django
+    django.setup()
 
 models=[
     "database_files.file",
@@ -46,6 +91,8 @@ model_fields={
     },
     "artwork.artwork": {
         'author': 'lti.user',
+        'code_blob': None,
+        'preview': None,
     },
     "exhibitions.exhibition": {
         'cohort': '_cohort_',
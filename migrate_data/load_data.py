@@ -1,170 +1,480 @@
 #!/bin/env python
 import sys
 sys.path.append('.')
-from migrate_data.env import get_app_env, get_data_filename, pythonpath, models, model_fields
+sys.path.append('./redirect')
+from migrate_data.env import get_app_env, get_data_filename, get_dump_filename, get_map_filename, read_objects, count_objects, setup_django, models, model_fields
 import os
 import re
 import json
 import copy
+import time
 import datetime
+import itertools
+import contextlib
 
-for path in pythonpath.split(':'):
-    sys.path.append(path)
-(source_env, target_env) = get_app_env(target=True)
-os.environ['DJANGO_SETTINGS_MODULE'] = 'gallery.settings'
-os.environ['DJANGO_GALLERY_ENVIRONMENT'] = target_env
+# Objects inserted per query in bulk mode, or per transaction otherwise
+batch_size = 500
 
-import django
-django.setup()
+if __name__ == '__main__':
+    # Insert objects in batches, rather than one at a time
+    bulk = '--bulk' in sys.argv
+    if bulk:
+        sys.argv.remove('--bulk')
+
+    # Skip the objects loaded by a previous run, from their checkpoint logs
+    resume = '--resume' in sys.argv
+    if resume:
+        sys.argv.remove('--resume')
+
+    (source_env, target_env) = get_app_env(target=True)
+    setup_django(target_env)
 
 from django.apps import apps
-from django.db import connection
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Model, Case, When, Value, F, PositiveIntegerField
+from django.db.models.signals import pre_save, post_save
+from django.core.management.color import no_style
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django_adelaidex.lti.models import User, Cohort
+from redirect.pkmaps import PkMap
+
+def get_cohort(source_env):
+    # Get or create cohort
+    try:
+        cohort = Cohort.objects.get(oauth_key=source_env)
+        created = False
+    except Cohort.DoesNotExist:
+        oauth_secret = get_random_string(50,'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)')
+        cohort = Cohort.objects.create(
+            title = source_env,
+            oauth_key=source_env, 
+            oauth_secret=oauth_secret,
+        )
+        created = True
+
+    if created:
+        print "Created cohort for %s" % source_env
+    else:
+        print "Found cohort for %s" % source_env
+
+    return cohort
+
+
+def get_edge_user(source_env):
+    # Get or create cuid:student user
+    try:
+        edge_user = User.objects.get(username="cuid:student")
+        created = False
+    except User.DoesNotExist:
+        edge_user = User.objects.create(
+          cohort=None,
+          username="cuid:student", 
+          first_name="edge-instructor", 
+          last_name="", 
+          is_active=True, 
+          time_zone="Australia/Adelaide", 
+          is_superuser=False, 
+          is_staff=True, 
+          last_login="2015-10-02T01:10:17Z", 
+          password="", 
+          email="jill.vogel@adelaide.edu.au", 
+          date_joined="2015-07-20T00:27:55Z"
+        )
+        created = True
+
+    if created:
+        print "Created edge user for %s" % source_env
+    else:
+        print "Found edge user for %s" % source_env
+
+    return edge_user
+
 
-# Get or create cohort
-try:
-    cohort = Cohort.objects.get(oauth_key=source_env)
-    created = False
-except Cohort.DoesNotExist:
-    oauth_secret = get_random_string(50,'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)')
-    cohort = Cohort.objects.create(
-        title = source_env,
-        oauth_key=source_env, 
-        oauth_secret=oauth_secret,
-    )
-    created = True
-
-if created:
-    print "Created cohort for %s" % source_env
-else:
-    print "Found cohort for %s" % source_env
-
-# Get or create cuid:student user
-try:
-    edge_user = User.objects.get(username="cuid:student")
-    created = False
-except User.DoesNotExist:
-    edge_user = User.objects.create(
-      cohort=None,
-      username="cuid:student", 
-      first_name="edge-instructor", 
-      last_name="", 
-      is_active=True, 
-      time_zone="Australia/Adelaide", 
-      is_superuser=False, 
-      is_staff=True, 
-      last_login="2015-10-02T01:10:17Z", 
-      password="", 
-      email="jill.vogel@adelaide.edu.au", 
-      date_joined="2015-07-20T00:27:55Z"
-    )
-    created = True
-
-if created:
-    print "Created edge user for %s" % source_env
-else:
-    print "Found edge user for %s" % source_env
-
-
-pk_map = {}
 file_re = re.compile('^(?P<prefix>\D*)(?P<pk>\d+)(?P<suffix>.*)$')
-error_objs = []
-
-for name in models:
-#for name in ['lti.user', 'artwork.artwork', 'exhibitions.exhibition', 'submissions.submission', 'votes.vote']:
-    (app_label, model_name) = name.split('.')
-    model = apps.get_model(app_label, model_name)
-    if model.objects.count():
-        last_obj = model.objects.latest('id')
-        next_id = last_obj.id + 1
+
+
+# Objects are inserted without calling save() or sending signals, so their
+# effects are repeated by these, keyed by model:
+#   prepare(new_obj), before each object is inserted
+#   inserted(new_objs), after each batch is committed
+code_blobs = {}
+
+def prepare_artwork(artwork):
+    '''As Artwork.save: move non-empty code into the content-addressed store, if enabled.'''
+    from artwork.models import ArtworkCode
+    code = artwork.code
+    if settings.ARTWORK_CODE_STORE and code:
+        sha1 = ArtworkCode.hash(code)
+        if sha1 not in code_blobs:
+            code_blobs[sha1] = ArtworkCode.objects.intern(code)
+        artwork.code_blob = code_blobs[sha1]
     else:
-        next_id = 1
-
-    # Read JSON data file
-    filename = get_data_filename(source_env, name)
-    print "Reading %s from %s" % (name, filename)
-    input_file = open(filename, 'r')
-    input_objs = json.load(input_file)
-    input_file.close()
-
-    print "load %s %s objs, starting at %s" % (len(input_objs), name, next_id)
-    pk_map[name] = {}
-    for obj in input_objs:
-        fields = copy.copy(obj['fields'])
+        artwork.code_blob = None
+    artwork.code = code
+
+def exhibitions_inserted(exhibitions):
+    '''As exhibitions post_save: invalidate cached visible_ids, and resize new images.'''
+    from exhibitions.models import Exhibition
+    from exhibitions.images import generate_variants
+    Exhibition.invalidate_visible_ids()
+    for exhibition in exhibitions:
+        if exhibition.image:
+            try:
+                generate_variants(exhibition.id, exhibition.image.name)
+            except Exception as e:
+                print "Unable to resize image for exhibition %s: %s" % (exhibition.id, e)
+
+def submissions_inserted(submissions):
+    '''As submissions post_save: set artwork.shared, and update exhibition code archives.'''
+    from artwork.models import Artwork
+    from submissions.models import update_archive
+    # The last submission of each artwork wins, as if saved in turn
+    Artwork.objects.filter(id__in=[s.artwork_id for s in submissions]).update(shared=Case(
+        *[When(id=s.artwork_id, then=Value(s.id)) for s in reversed(submissions)],
+        default=F('shared'),
+        output_field=PositiveIntegerField()
+    ))
+    for exhibition_id in set(s.exhibition_id for s in submissions):
+        update_archive(exhibition_id)
+
+def votes_inserted(votes):
+    '''As votes post_save: add thumbs up votes to their submission's score.'''
+    from submissions.models import Submission
+    from votes.models import Vote
+    scores = {}
+    for vote in votes:
+        if vote.status == Vote.THUMBS_UP:
+            scores[vote.submission_id] = scores.get(vote.submission_id, 0) + 1
+    by_score = {}
+    for (submission_id, score) in scores.items():
+        by_score.setdefault(score, []).append(submission_id)
+    for (score, submission_ids) in by_score.items():
+        Submission.objects.filter(id__in=submission_ids).update(score=F('score') + score)
+
+bulk_handlers = {
+    'artwork.artwork': (prepare_artwork, None),
+    'exhibitions.exhibition': (None, exhibitions_inserted),
+    'submissions.submission': (None, submissions_inserted),
+    'votes.vote': (None, votes_inserted),
+}
+
+
+def can_bulk_load(name, model):
+    '''Models whose save() or signals have effects not repeated by bulk_handlers
+       must be created one at a time.'''
+    if name in bulk_handlers:
+        return True
+    return ((model.save.__func__ is Model.save.__func__) and
+            not pre_save.has_listeners(model) and
+            not post_save.has_listeners(model))
+
+
+@contextlib.contextmanager
+def dumped_timestamps(model):
+    '''Stops auto_now and auto_now_add fields replacing the dumped timestamps.'''
+    auto_fields = [(field, field.auto_now, field.auto_now_add) for field in model._meta.fields
+                   if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    for (field, auto_now, auto_now_add) in auto_fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield [field for (field, auto_now, auto_now_add) in auto_fields]
+    finally:
+        for (field, auto_now, auto_now_add) in auto_fields:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def get_next_id(model):
+    '''Returns the id after the model's last row.  In a transaction, the last
+       row is locked until it ends, which on MySQL also stops other inserts
+       after it.'''
+    last_ids = list(model.objects.select_for_update().order_by('-id').values_list('id', flat=True)[:1])
+    return (last_ids[0] + 1) if last_ids else 1
+
+
+def read_checkpoint(filename, model):
+    '''Returns the pk map logged to the checkpoint file, for the rows which exist.
+       Batches are logged before they're committed, so the ids of a batch which
+       wasn't may be logged again by the objects inserted after it; the last
+       object logged with a new pk is the one in its row.'''
+    logged = {}
+    logged_by = {}
+    with open(filename, 'r') as log_file:
+        for line in log_file:
+            try:
+                (old_pk, new_pk) = json.loads(line)
+            except ValueError:
+                # Partly written
+                continue
+            previous = logged_by.get(new_pk)
+            if previous is not None and logged.get(previous) == new_pk:
+                del logged[previous]
+            logged[old_pk] = new_pk
+            logged_by[new_pk] = old_pk
+
+    new_pks = sorted(set(logged.values()))
+    existing = set()
+    for i in range(0, len(new_pks), batch_size):
+        existing.update(model.objects.filter(id__in=new_pks[i:i + batch_size]).values_list('id', flat=True))
+    return dict((old_pk, new_pk) for (old_pk, new_pk) in logged.items() if new_pk in existing)
+
+
+class Loader(object):
+    '''Loads the objects dumped from source_env into this database, mapping
+       their pks to new ones.
+
+       Each model's pk mappings are appended to its checkpoint log as they're
+       loaded, so if resume is set, the objects a previous run loaded are skipped.
+       Objects are loaded batch_size at a time, each batch logged in its
+       transaction before it's committed.'''
+
+    def __init__(self, source_env, bulk=False, resume=False):
+        self.source_env = source_env
+        self.bulk = bulk
+        self.resume = resume
+        self.pk_map = {}
+        self.checkpoint_file = None
+        self.error_objs = []
+        self.cohort = get_cohort(source_env)
+        self.edge_user = get_edge_user(source_env)
+
+    def get_pk_map(self, fmodel):
+        '''Returns the model's pk map, loading it from file if not found.'''
+        if not fmodel in self.pk_map:
+            filename = get_map_filename(self.source_env, fmodel)
+            print "Reading %s pk map from %s" % (fmodel, filename)
+            self.pk_map[fmodel] = PkMap.load(filename)
+        return self.pk_map[fmodel]
+
+    def remap_fields(self, name, fields):
+        '''Removes the unwanted fields, sets the cohort, and replaces foreign keys
+           and database file names with their new pks.'''
         mfields = model_fields.get(name, {})
+        for (field, fmodel) in mfields.iteritems():
+            # Remove indicated fields
+            if fmodel is None:
+                fields.pop(field, None)
+
+            # Set cohort
+            elif fmodel == '_cohort_':
+                fields[field] = self.cohort
+
+            # database files are special
+            elif fmodel == 'database_files.file':
+                old_img = fields[field]
+                match = file_re.search(old_img)
+                old_pk = match.group('pk')
+                new_pk = self.get_pk_map(fmodel)[str(old_pk)]
+                fields[field] = '%s%s%s' % (match.group('prefix'), new_pk, match.group('suffix'))
+
+            # all other fields are foreign keys
+            else:
+                old_pk = fields[field]
+                new_pk = self.get_pk_map(fmodel)[str(old_pk)]
+                del fields[field]
+                fields['%s_id'%field] = new_pk
+
+    def is_edge_user(self, name, fields):
+        return (name == 'lti.user') and (fields.get('username', '') == self.edge_user.username)
+
+    def error(self, obj, e):
+        obj['exception'] = str(e)
+        self.error_objs.append(obj)
+
+    def load_model(self, name, input_objs, count):
+        '''Loads the model's dumped objects, and writes its pk map.'''
+        (app_label, model_name) = name.split('.')
+        model = apps.get_model(app_label, model_name)
+        if model.objects.count():
+            last_obj = model.objects.latest('id')
+            next_id = last_obj.id + 1
+        else:
+            next_id = 1
+
+        print "load %s %s objs, starting at %s" % (count, name, next_id)
+        self.open_checkpoint(name, model)
+        if self.pk_map[name]:
+            print "skipping %s %s objs already loaded" % (len(self.pk_map[name]), name)
+            loaded = self.pk_map[name]
+            input_objs = (obj for obj in input_objs if str(obj['pk']) not in loaded)
+            count = max(count - len(loaded), 0)
+
+        start = time.time()
+        try:
+            if self.bulk and can_bulk_load(name, model):
+                self.bulk_load(name, model, input_objs, count)
+            else:
+                self.load(name, model, input_objs)
+        finally:
+            self.checkpoint_file.close()
+            self.checkpoint_file = None
+        elapsed = time.time() - start
+        print "loaded %s %s objs in %.1fs, %.0f rows/s" % (
+            len(self.pk_map[name]), name, elapsed, count / max(elapsed, 0.001))
+
+        PkMap(self.pk_map[name].items()).save(get_data_filename(self.source_env, '%s.map' % name, 'bin'))
+
+    def open_checkpoint(self, name, model):
+        '''Opens the model's checkpoint log, reading its pk map if resuming.'''
+        filename = get_data_filename(self.source_env, '%s.map' % name, 'log')
+        if self.resume and os.path.exists(filename):
+            print "Reading %s checkpoint from %s" % (name, filename)
+            self.pk_map[name] = read_checkpoint(filename, model)
+            self.checkpoint_file = open(filename, 'a')
+            # End any partly written line
+            self.checkpoint_file.write('\n')
+        else:
+            self.pk_map[name] = {}
+            self.checkpoint_file = open(filename, 'w')
+
+    def checkpoint(self, pks):
+        '''Appends the (old pk, new pk) pairs to the checkpoint log.'''
+        self.checkpoint_file.write(''.join('%s\n' % json.dumps([str(old_pk), new_pk])
+                                           for (old_pk, new_pk) in pks))
+        self.checkpoint_file.flush()
+        os.fsync(self.checkpoint_file.fileno())
+
+    def load(self, name, model, input_objs):
+        '''Creates each object in turn, batch_size at a time in a transaction,
+           which logs them before it commits.'''
+        input_objs = iter(input_objs)
+        while True:
+            batch = list(itertools.islice(input_objs, batch_size))
+            if not batch:
+                break
+            loaded = []
+            with transaction.atomic():
+                for obj in batch:
+                    self.load_object(name, model, obj, loaded)
+                self.checkpoint(loaded)
+
+    def load_object(self, name, model, obj, loaded):
+        '''Creates the object, appending its (old pk, new pk) to loaded.'''
+        fields = copy.copy(obj['fields'])
 
         try:
-            if (name == 'lti.user') and (fields.get('username', '') == edge_user.username):
-                new_obj = edge_user
+            if self.is_edge_user(name, fields):
+                new_obj = self.edge_user
             else:
-                for (field, fmodel) in mfields.iteritems():
-                    #print "assessing %s: %s" % (field, fmodel)
-
-                    # Remove indicated fields
-                    if fmodel is None:
-                        #print "removed %s" % field
-                        del fields[field]
-
-                    # Set cohort
-                    elif fmodel == '_cohort_':
-                        #print "set cohort"
-                        fields[field] = cohort
-                    else:
-                        #print "set foreign key"
-
-                        # Load pk map from file if not found
-                        if not fmodel in pk_map:
-                            filename = get_data_filename(source_env, '%s.map' % fmodel)
-                            print "Reading %s pk map from %s" % (fmodel, filename)
-                            map_file = open(filename, 'r')
-                            pk_map[fmodel] = json.load(map_file)
-                            map_file.close()
-
-                        # database files are special
-                        if fmodel == 'database_files.file':
-                            old_img = fields[field]
-                            match = file_re.search(old_img)
-                            old_pk = match.group('pk')
-                            new_pk = pk_map[fmodel][str(old_pk)]
-                            fields[field] = '%s%s%s' % (match.group('prefix'), new_pk, match.group('suffix'))
-                        # all other fields are foreign keys
-                        else:
-                            old_pk = fields[field]
-                            new_pk = pk_map[fmodel][str(old_pk)]
-                            del fields[field]
-                            fields['%s_id'%field] = new_pk
-
-                #print "Creating %s from (%s)" % (name, fields)
-                new_obj = model.objects.create(**fields)
-
-                # Force update the date fields
-                if ('created_at' in fields) and ('modified_at' in fields):
-                    date_format = '%Y-%m-%dT%TZ'
-                    sql = "UPDATE %s SET created_at=str_to_date('%s','%s'), modified_at=str_to_date('%s','%s') WHERE id=%s" % ( 
-                        new_obj._meta.db_table,
-                        fields['created_at'], date_format,
-                        fields['modified_at'], date_format,
-                        new_obj.id,
-                    )
-                    cursor = connection.cursor()
-                    cursor.execute(sql)
-
-            pk_map[name][str(obj['pk'])] = new_obj.id
+                self.remap_fields(name, fields)
+
+                # In a savepoint, so an error doesn't end the batch's transaction
+                with transaction.atomic():
+                    #print "Creating %s from (%s)" % (name, fields)
+                    new_obj = model.objects.create(**fields)
+
+                    # Force update the date fields
+                    if ('created_at' in fields) and ('modified_at' in fields):
+                        date_format = '%Y-%m-%dT%TZ'
+                        sql = "UPDATE %s SET created_at=str_to_date('%s','%s'), modified_at=str_to_date('%s','%s') WHERE id=%s" % ( 
+                            new_obj._meta.db_table,
+                            fields['created_at'], date_format,
+                            fields['modified_at'], date_format,
+                            new_obj.id,
+                        )
+                        cursor = connection.cursor()
+                        cursor.execute(sql)
+
+            self.pk_map[name][str(obj['pk'])] = new_obj.id
+            loaded.append((obj['pk'], new_obj.id))
 
         except Exception as e:
-            obj['exception'] = str(e)
-            error_objs.append(obj)
-
-    filename = get_data_filename(source_env, '%s.map' % name)
-    map_file = open(filename, 'w')
-    json.dump(pk_map[name], map_file, indent=2)
-    map_file.close()
-
-if error_objs:
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = get_data_filename(source_env, timestamp)
-    print "%s errors, storing to %s" % (len(error_objs), filename)
-    err_file = open(filename, 'w')
-    json.dump(error_objs, err_file, indent=2)
-    err_file.close()
+            self.error(obj, e)
+
+    def bulk_load(self, name, model, input_objs, count):
+        '''Inserts the objects in batches of batch_size, each in a transaction,
+           with ids assigned after the table's last row when the batch is inserted.'''
+        (prepare, inserted) = bulk_handlers.get(name, (None, None))
+        stats = {'rows': 0, 'start': time.time()}
+
+        def create(batch):
+            '''Assigns the batch's ids, inserts it, and logs it, in a transaction.'''
+            with transaction.atomic():
+                next_id = get_next_id(model)
+                for (i, (obj, new_obj)) in enumerate(batch):
+                    new_obj.id = next_id + i
+                model.objects.bulk_create([new_obj for (obj, new_obj) in batch])
+
+                # Move the table's sequence past the assigned ids, where the database has one
+                with connection.cursor() as cursor:
+                    for statement in connection.ops.sequence_reset_sql(no_style(), [model]):
+                        cursor.execute(statement)
+
+                # Logged once inserted, so objects which fail aren't, but before the commit
+                self.checkpoint([(obj['pk'], new_obj.id) for (obj, new_obj) in batch])
+
+        def insert(batch):
+            try:
+                create(batch)
+                created = batch
+            except Exception:
+                # Insert one at a time, to find the objects in error
+                created = []
+                for (obj, new_obj) in batch:
+                    try:
+                        create([(obj, new_obj)])
+                        created.append((obj, new_obj))
+                    except Exception as e:
+                        self.error(obj, e)
+
+            for (obj, new_obj) in created:
+                self.pk_map[name][str(obj['pk'])] = new_obj.id
+            if inserted and created:
+                inserted([new_obj for (obj, new_obj) in created])
+
+            stats['rows'] += len(batch)
+            elapsed = time.time() - stats['start']
+            print "  %s: %s of %s rows, %.0f rows/s" % (
+                name, stats['rows'], count, stats['rows'] / max(elapsed, 0.001))
+            sys.stdout.flush()
+
+        with dumped_timestamps(model) as timestamp_fields:
+            batch = []
+            for obj in input_objs:
+                fields = copy.copy(obj['fields'])
+
+                try:
+                    if self.is_edge_user(name, fields):
+                        self.pk_map[name][str(obj['pk'])] = self.edge_user.id
+                        self.checkpoint([(obj['pk'], self.edge_user.id)])
+                        continue
+
+                    self.remap_fields(name, fields)
+                    new_obj = model(**fields)
+                    for field in timestamp_fields:
+                        if getattr(new_obj, field.attname) is None:
+                            setattr(new_obj, field.attname, timezone.now())
+                    if prepare:
+                        prepare(new_obj)
+                except Exception as e:
+                    self.error(obj, e)
+                    continue
+
+                batch.append((obj, new_obj))
+                if len(batch) >= batch_size:
+                    insert(batch)
+                    batch = []
+            if batch:
+                insert(batch)
+
+    def write_errors(self):
+        if self.error_objs:
+            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = get_data_filename(self.source_env, timestamp)
+            print "%s errors, storing to %s" % (len(self.error_objs), filename)
+            err_file = open(filename, 'w')
+            json.dump(self.error_objs, err_file, indent=2)
+            err_file.close()
+
+
+if __name__ == '__main__':
+    loader = Loader(source_env, bulk=bulk, resume=resume)
+    for name in models:
+    #for name in ['lti.user', 'artwork.artwork', 'exhibitions.exhibition', 'submissions.submission', 'votes.vote']:
+        # Read the dumped objects as they're loaded
+        filename = get_dump_filename(source_env, name)
+        print "Reading %s from %s" % (name, filename)
+        loader.load_model(name, read_objects(filename), count_objects(filename))
+    loader.write_errors()
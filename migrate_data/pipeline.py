@@ -0,0 +1,135 @@
+#!/bin/env python
+'''Migrates a cohort from source_env to target_env, as dump_data.py and
+load_data.py --bulk would, but loading the models while the others are dumped:
+
+  dump:  each model is dumped by a worker process connected to source_env
+  load:  the models are loaded in order of their foreign keys, as their dumps
+         finish, parsing the dumped lines and mapping their pks
+
+The load parses the dumped lines itself.  Parsing is a small part of the load,
+and the load would still have to unpickle the objects parsed by other processes,
+which costs it about a third as much as parsing them.
+'''
+import os
+import sys
+sys.path.append('.')
+import time
+import collections
+import multiprocessing
+from migrate_data.env import get_app_env, get_data_dir, setup_django, read_objects, models, model_fields
+
+
+def get_dependencies():
+    '''Returns the models each model has foreign keys to, from model_fields.'''
+    dependencies = {}
+    for name in models:
+        dependencies[name] = set(fmodel for fmodel in model_fields.get(name, {}).values()
+                                 if fmodel not in (None, '_cohort_'))
+    return dependencies
+
+
+def get_load_order(dependencies):
+    '''Returns the models ordered so each is loaded after the models it depends on,
+       otherwise in the order of models.'''
+    order = []
+    remaining = list(models)
+    while remaining:
+        ready = [name for name in remaining if not dependencies[name] & set(remaining)]
+        if not ready:
+            raise ValueError('Circular foreign keys between %s' % ', '.join(remaining))
+        order.append(ready[0])
+        remaining.remove(ready[0])
+    return order
+
+
+def dump(app_env, name):
+    '''Dump stage: run in the dump pool, set up for app_env.'''
+    from migrate_data import dump_data
+    start = time.time()
+    (filename, count) = dump_data.dump(app_env, name)
+    return (filename, count, time.time() - start, time.time())
+
+
+class Pipeline(object):
+
+    def __init__(self, source_env, target_env, processes, resume=False):
+        self.source_env = source_env
+        self.target_env = target_env
+        self.processes = processes
+        self.resume = resume
+        self.order = get_load_order(get_dependencies())
+        self.counts = {}
+        self.timings = collections.OrderedDict(
+            (name, {'dump': 0.0, 'load': 0.0, 'wait': 0.0}) for name in self.order)
+
+    def wait(self, name, result):
+        '''Returns the stage's result, counting the time the load waited for it.'''
+        start = time.time()
+        value = result.get()
+        self.timings[name]['wait'] += time.time() - start
+        return value
+
+    def run(self):
+        self.start = self.dumped = time.time()
+
+        # Created before the dump workers, which share it
+        data_dir = get_data_dir(self.source_env)
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+
+        # Workers are forked before Django is set up here, for the target
+        dump_pool = multiprocessing.Pool(min(self.processes, len(self.order)),
+                                         initializer=setup_django, initargs=(self.source_env,))
+        dumps = dict((name, dump_pool.apply_async(dump, (self.source_env, name)))
+                     for name in self.order)
+        dump_pool.close()
+
+        setup_django(self.target_env)
+        from migrate_data.load_data import Loader
+        loader = Loader(self.source_env, bulk=True, resume=self.resume)
+
+        for name in self.order:
+            (filename, count, seconds, finished) = self.wait(name, dumps[name])
+            self.counts[name] = count
+            self.timings[name]['dump'] = seconds
+            self.dumped = max(self.dumped, finished)
+
+            start = time.time()
+            loader.load_model(name, read_objects(filename), count)
+            self.timings[name]['load'] = time.time() - start
+        loader.write_errors()
+
+        dump_pool.join()
+        self.finished = time.time()
+
+    def report(self):
+        '''Prints the time spent in each stage, per model.  The dump times are
+           summed across processes; wait is the load waiting for them.'''
+        print
+        print "%-24s %8s %9s %9s %9s" % ('model', 'rows', 'dump', 'load', 'wait')
+        totals = collections.Counter()
+        for (name, timing) in self.timings.items():
+            print "%-24s %8s %8.1fs %8.1fs %8.1fs" % (
+                name, self.counts.get(name, 0), timing['dump'], timing['load'], timing['wait'])
+            totals.update(timing)
+        print "%-24s %8s %8.1fs %8.1fs %8.1fs" % (
+            'total', sum(self.counts.values()), totals['dump'], totals['load'], totals['wait'])
+        print
+        print "dumps finished after %.1fs, migrated in %.1fs with %s processes" % (
+            self.dumped - self.start, self.finished - self.start, self.processes)
+
+
+if __name__ == '__main__':
+    processes = multiprocessing.cpu_count()
+    for arg in list(sys.argv):
+        if arg.startswith('--processes='):
+            processes = int(arg.split('=', 1)[1])
+            sys.argv.remove(arg)
+    resume = '--resume' in sys.argv
+    if resume:
+        sys.argv.remove('--resume')
+
+    (source_env, target_env) = get_app_env(target=True)
+    pipeline = Pipeline(source_env, target_env, processes, resume=resume)
+    pipeline.run()
+    pipeline.report()
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+
+from artwork.models import Artwork, ArtworkCode
+
+
+class Command(BaseCommand):
+    help = 'Moves artwork code into the content-addressed code store, and reports the space saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--migrate', action='store_true', default=False,
+            help='Move code stored on artwork rows into the code store')
+        parser.add_argument('--prune', action='store_true', default=False,
+            help='Delete stored code no longer referenced by any artwork')
+        parser.add_argument('--chunk-size', type=int, default=500,
+            help='Number of artworks to migrate per transaction')
+
+    def handle(self, *args, **options):
+        if options['migrate']:
+            if not settings.ARTWORK_CODE_STORE:
+                # Saving the artworks would move their code back onto the rows
+                raise CommandError('Enable CODE_STORE in the [ARTWORK] settings before migrating')
+            self.migrate(options['chunk_size'])
+        if options['prune']:
+            self.prune()
+        self.report()
+
+    def migrate(self, chunk_size):
+        moved = 0
+        qs = Artwork.objects.filter(code_blob__isnull=True).exclude(code='')
+        while True:
+            rows = list(qs.order_by('id').values_list('id', 'code')[:chunk_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                for (pk, code) in rows:
+                    # Use update() to leave modified_at untouched
+                    blob = ArtworkCode.objects.intern(code)
+                    Artwork.objects.filter(id=pk).update(code='', code_blob=blob)
+            moved += len(rows)
+            self.stdout.write('Moved %d artworks into the code store' % moved)
+
+    def prune(self):
+        orphans = ArtworkCode.objects.annotate(
+            artwork_count=Count('artwork')).filter(artwork_count=0)
+        deleted = ArtworkCode.objects.filter(
+            id__in=list(orphans.values_list('id', flat=True))).delete()[0]
+        self.stdout.write('Pruned %d unreferenced code blobs' % deleted)
+
+    def report(self):
+        inline = Artwork.objects.filter(code_blob__isnull=True).aggregate(
+            count=Count('id'), size=Sum(Length('code')))
+        referenced = Artwork.objects.filter(code_blob__isnull=False).aggregate(
+            count=Count('id'), size=Sum(Length('code_blob__code')))
+        stored = ArtworkCode.objects.aggregate(
+            count=Count('id'), size=Sum(Length('code')))
+
+        inline_size = inline['size'] or 0
+        referenced_size = referenced['size'] or 0
+        stored_size = stored['size'] or 0
+
+        # Without the store, every artwork would hold its own copy of the code
+        logical_size = inline_size + referenced_size
+        actual_size = inline_size + stored_size
+        saved = logical_size - actual_size
+        percent = (100.0 * saved / logical_size) if logical_size else 0
+
+        self.stdout.write('Artworks with inline code: %d (%d chars)' % (inline['count'], inline_size))
+        self.stdout.write('Artworks with stored code: %d (%d chars)' % (referenced['count'], referenced_size))
+        self.stdout.write('Stored code blobs: %d (%d chars)' % (stored['count'], stored_size))
+        self.stdout.write('Space saved: %d chars (%.1f%%)' % (saved, percent))
@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+
+from artwork.models import Artwork
+from artwork.serializers import ArtworkCodeSerializer
+from artwork.views import ArtworkView
+
+
+class Command(BaseCommand):
+    help = 'Compares the code export throughput of the code.pde template and ArtworkCodeSerializer.'
+
+    template_name = ArtworkView.prepend_template_path('code.pde')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000,
+            help='Number of artworks to export')
+        parser.add_argument('--repeat', type=int, default=3,
+            help='Number of times to export each artwork; the fastest run is reported')
+
+    def handle(self, *args, **options):
+        artworks = list(Artwork.objects.select_related('author').order_by('-id')[:options['limit']])
+        if not artworks:
+            self.stdout.write('No artwork to export')
+            return
+
+        def render_template():
+            for artwork in artworks:
+                render_to_string(self.template_name, {'object': artwork, 'BASE_URL': ''})
+
+        def serialize():
+            serializer = ArtworkCodeSerializer()
+            for artwork in artworks:
+                serializer.serialize(artwork)
+
+        results = []
+        for (name, export) in (('template', render_template), ('serializer', serialize)):
+            elapsed = min(self.time(export) for i in range(options['repeat']))
+            results.append(elapsed)
+            self.stdout.write('%-10s %8.3fs %10.0f artworks/s' % (
+                name, elapsed, len(artworks) / elapsed if elapsed else 0))
+
+        (template_time, serializer_time) = results
+        if serializer_time:
+            self.stdout.write('Serializer is %.1fx faster, over %d artworks' % (
+                template_time / serializer_time, len(artworks)))
+
+    def time(self, export):
+        start = time.time()
+        export()
+        return time.time() - start
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import artwork.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artwork', '0002_auto_20150106_0530'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtworkCode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha1', models.CharField(max_length=40, unique=True)),
+                ('code', models.TextField()),
+            ],
+            options={
+                'db_table': 'artwork_code',
+            },
+        ),
+        migrations.AlterField(
+            model_name='artwork',
+            name='code',
+            field=artwork.models.StoredCodeField(),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='code_blob',
+            field=models.ForeignKey(blank=True, default=None, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='artwork.ArtworkCode'),
+        ),
+    ]
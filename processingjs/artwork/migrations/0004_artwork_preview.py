@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('artwork', '0003_artworkcode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='preview',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='not required'),
+        ),
+    ]
@@ -1,23 +1,124 @@
-from django.db import models
+import base64
+import hashlib
+import binascii
+from django.db import models, IntegrityError, transaction
 from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.forms import HiddenInput
 from django.conf import settings
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
+from django.utils.translation import ugettext_lazy as _
 from rulez import registry
 
+from gallery.images import UploadedImageField
+
+
+class ArtworkCodeManager(models.Manager):
+
+    def intern(self, code):
+        '''Returns the stored ArtworkCode for the given code, creating it if required.'''
+        sha1 = ArtworkCode.hash(code)
+        try:
+            return self.get(sha1=sha1)
+        except ArtworkCode.DoesNotExist:
+            pass
+        try:
+            with transaction.atomic():
+                return self.create(sha1=sha1, code=code)
+        except IntegrityError:
+            # Stored concurrently by another request
+            return self.get(sha1=sha1)
+
+
+class ArtworkCode(models.Model):
+    '''Content-addressed artwork code, shared by all artworks with identical code.'''
+    class Meta:
+        db_table = 'artwork_code'
+
+    sha1 = models.CharField(max_length=40, unique=True)
+    code = models.TextField()
+
+    objects = ArtworkCodeManager()
+
+    def __unicode__(self):
+        return self.sha1
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+    @staticmethod
+    def hash(code):
+        return hashlib.sha1(code.encode('utf-8')).hexdigest()
+
+
+class StoredCodeDescriptor(object):
+    '''Reads artwork code from the row, or from ArtworkCode if stored there.'''
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        code = instance.__dict__.get(self.field.attname)
+        if not code and instance.code_blob_id:
+            code = instance.code_blob.code
+        return code
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class StoredCodeField(models.TextField):
+    '''TextField whose value is left empty on the row when it is held in ArtworkCode.
+
+       Only model instances read the stored code.  Queries on the column, such as
+       filter(code=...), values('code') and raw SQL, see '' for stored artwork, so
+       must also check code_blob__code.
+    '''
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(StoredCodeField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, StoredCodeDescriptor(self))
+
+    def pre_save(self, model_instance, add):
+        value = super(StoredCodeField, self).pre_save(model_instance, add)
+        if model_instance.code_blob_id:
+            return ''
+        return value
+
+
+class ArtworkManager(models.Manager):
+
+    def get_queryset(self):
+        queryset = super(ArtworkManager, self).get_queryset()
+        if settings.ARTWORK_CODE_STORE:
+            # Fetch stored code along with the artwork
+            queryset = queryset.select_related('code_blob')
+        return queryset
+
 
 class Artwork(models.Model):
     class Meta:
         db_table = 'artwork'
 
     title = models.CharField(max_length=500)
-    code = models.TextField()
+    code = StoredCodeField()
+    code_blob = models.ForeignKey(ArtworkCode, null=True, blank=True, default=None,
+        editable=False, on_delete=models.PROTECT)
     author = models.ForeignKey(settings.AUTH_USER_MODEL)
     shared = models.PositiveIntegerField(default=0)
+    # Still of the rendered artwork, shown in lists until the artwork is played
+    preview = models.ImageField(upload_to='not required', null=True, blank=True,
+        editable=False)
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     modified_at = models.DateTimeField(auto_now=True, editable=False)
 
+    objects = ArtworkManager()
 
     def __unicode__(self):
         return self.title
@@ -25,6 +126,27 @@ class Artwork(models.Model):
     def __str__(self):
         return unicode(self).encode('utf-8')
 
+    def save(self, *args, **kwargs):
+        # Move non-empty code into the content-addressed store, if enabled
+        code = self.code
+        if settings.ARTWORK_CODE_STORE and code:
+            self.code_blob = ArtworkCode.objects.intern(code)
+        else:
+            self.code_blob = None
+        self.code = code
+        super(Artwork, self).save(*args, **kwargs)
+
+    def save_preview(self, content):
+        '''Stores the preview image, replacing any previous one.
+
+           Only the preview column is updated, so modified_at is unchanged.
+        '''
+        previous = self.preview.name
+        self.preview.save('artwork%d.png' % self.id, content, save=False)
+        Artwork.objects.filter(id=self.id).update(preview=self.preview.name)
+        if previous and previous != self.preview.name:
+            self.preview.storage.delete(previous)
+
     def get_absolute_url(self):
         if self.shared:
             return reverse('submission-view', kwargs={'pk': self.shared})
@@ -77,6 +199,13 @@ registry.register('can_see', Artwork)
 registry.register('can_save', Artwork)
 
 
+@receiver(post_delete, sender=Artwork)
+def artwork_post_delete(sender, instance=None, **kwargs):
+    '''Delete the preview image, if any'''
+    if instance and instance.preview:
+        instance.preview.storage.delete(instance.preview.name)
+
+
 class ArtworkForm(forms.ModelForm):
     class Meta:
         model = Artwork
@@ -84,3 +213,36 @@ class ArtworkForm(forms.ModelForm):
         widgets = {
             'code': HiddenInput
         }
+
+
+class ArtworkPreviewForm(forms.Form):
+    '''Validates an artwork preview, posted as a PNG data URL captured from the canvas.'''
+    data_url_prefix = 'data:image/png;base64,'
+
+    preview = forms.CharField()
+
+    default_error_messages = {
+        'invalid': _('Preview must be a PNG image data URL.'),
+        'too_large': _('Preview is too large: it may be up to %(max_bytes)s bytes.'),
+    }
+
+    def clean_preview(self):
+        data = self.cleaned_data['preview']
+        if not data.startswith(self.data_url_prefix):
+            raise ValidationError(self.default_error_messages['invalid'], code='invalid')
+        try:
+            content = base64.b64decode(data[len(self.data_url_prefix):])
+        except (TypeError, binascii.Error):
+            raise ValidationError(self.default_error_messages['invalid'], code='invalid')
+
+        if len(content) > settings.ARTWORK_PREVIEW_MAX_BYTES:
+            raise ValidationError(
+                self.default_error_messages['too_large'],
+                code='too_large',
+                params={'max_bytes': settings.ARTWORK_PREVIEW_MAX_BYTES},
+            )
+
+        # Large canvases are shrunk to the preview size
+        image_field = UploadedImageField(max_size=settings.ARTWORK_PREVIEW_SIZE)
+        image_field.formats = ('PNG',)
+        return image_field.clean(SimpleUploadedFile('preview.png', content))
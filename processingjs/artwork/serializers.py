@@ -0,0 +1,56 @@
+from datetime import datetime
+from django.conf import settings
+from django.utils import dateformat, timezone
+from django.utils.encoding import force_text
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+
+from django_adelaidex.util.context_processors import base_url
+
+
+def _render_value(value):
+    '''Converts a value to text as a template variable would be, with autoescaping.'''
+    return conditional_escape(force_text(localize(timezone.template_localtime(value))))
+
+
+class ArtworkCodeSerializer(object):
+    '''Renders artwork as a .pde file: its code, headed by comments describing it.
+
+       The output is identical to the artwork/code.pde template, but assembled
+       directly, so bulk downloads needn't render a template per artwork.
+    '''
+    downloaded_format = 'jS F Y H:i'
+    template = (
+        u'// Title: %(title)s\n'
+        u'// Author: %(author)s\n'
+        u'// Created: %(created_at)s\n'
+        u'// Downloaded: %(downloaded)s\n'
+        u'// URL: %(base_url)s%(url)s\n'
+        u'\n'
+        u'%(code)s\n'
+        u'\n'
+    )
+
+    def __init__(self, base_url='', now=None):
+        if now is None:
+            now = datetime.now(tz=timezone.get_current_timezone() if settings.USE_TZ else None)
+        self.base_url = _render_value(base_url)
+        self.downloaded = dateformat.format(now, self.downloaded_format)
+
+    @classmethod
+    def for_request(cls, request):
+        return cls(base_url=base_url(request).get('BASE_URL', ''))
+
+    def serialize_artwork(self, artwork, url):
+        return self.template % {
+            'title': _render_value(artwork.title),
+            'author': _render_value(artwork.author),
+            'created_at': _render_value(artwork.created_at),
+            'downloaded': self.downloaded,
+            'base_url': self.base_url,
+            'url': _render_value(url),
+            'code': force_text(artwork.code),
+        }
+
+    def serialize(self, artwork):
+        return self.serialize_artwork(artwork, artwork.get_absolute_url())
@@ -0,0 +1,10 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag
+def artwork_render_url():
+    '''Returns the URL of the cacheable artwork render shell.'''
+    from artwork.views import RenderShellArtworkView
+    return RenderShellArtworkView.get_url()
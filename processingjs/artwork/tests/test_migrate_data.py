@@ -0,0 +1,106 @@
+import os
+import sys
+import shutil
+import tempfile
+from django.conf import settings
+from django.test import TestCase
+from django.utils.six import StringIO
+
+# migrate_data lives alongside the app, and reads the redirect app's pk maps
+sys.path.append(os.path.dirname(settings.BASE_DIR))
+sys.path.append(os.path.join(os.path.dirname(settings.BASE_DIR), 'redirect'))
+from migrate_data import env, load_data
+
+from artwork.models import Artwork
+from django_adelaidex.util.test import UserSetUp
+
+
+class LoadDataTests(UserSetUp, TestCase):
+    '''migrate_data/load_data.py tests'''
+
+    def setUp(self):
+        super(LoadDataTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        (self.env_data_dir, env.data_dir) = (env.data_dir, self.data_dir)
+        os.makedirs(os.path.join(self.data_dir, 'source'))
+        (self.stdout, sys.stdout) = (sys.stdout, StringIO())
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        env.data_dir = self.env_data_dir
+        shutil.rmtree(self.data_dir)
+        super(LoadDataTests, self).tearDown()
+
+    def get_objs(self, *titles):
+        return [{'model': 'artwork.artwork', 'pk': pk,
+                 'fields': {'title': title, 'code': 'code %s' % pk, 'author': 1, 'shared': 0}}
+                for (pk, title) in enumerate(titles, 11)]
+
+    def load(self, objs, bulk=True, resume=False):
+        loader = load_data.Loader('source', bulk=bulk, resume=resume)
+        loader.pk_map['lti.user'] = {'1': self.user.id}
+        loader.load_model('artwork.artwork', iter(objs), len(objs))
+        return loader
+
+    def read_checkpoint(self):
+        filename = env.get_data_filename('source', 'artwork.artwork.map', 'log')
+        return load_data.read_checkpoint(filename, Artwork)
+
+    def test_bulk_resume_failed(self):
+        # The batch fails, so its objects are inserted one at a time
+        loader = self.load(self.get_objs('first', None, 'third'))
+        self.assertEquals([obj['pk'] for obj in loader.error_objs], [12])
+        logged = self.read_checkpoint()
+        self.assertEquals(sorted(logged.keys()), ['11', '13'])
+        self.assertEquals(Artwork.objects.get(id=logged['11']).title, 'first')
+        self.assertEquals(Artwork.objects.get(id=logged['13']).title, 'third')
+
+        # The failed object is retried, and the others skipped
+        loader = self.load(self.get_objs('first', 'second', 'third'), resume=True)
+        self.assertEquals(loader.error_objs, [])
+        self.assertEquals(Artwork.objects.count(), 3)
+        logged = self.read_checkpoint()
+        self.assertEquals(sorted(logged.keys()), ['11', '12', '13'])
+        self.assertEquals(Artwork.objects.get(id=logged['12']).title, 'second')
+
+    def test_resume_failed(self):
+        loader = self.load(self.get_objs('first', None, 'third'), bulk=False)
+        self.assertEquals([obj['pk'] for obj in loader.error_objs], [12])
+        self.assertEquals(sorted(self.read_checkpoint().keys()), ['11', '13'])
+
+        loader = self.load(self.get_objs('first', 'second', 'third'), bulk=False, resume=True)
+        self.assertEquals(loader.error_objs, [])
+        self.assertEquals(Artwork.objects.count(), 3)
+        logged = self.read_checkpoint()
+        self.assertEquals(Artwork.objects.get(id=logged['12']).title, 'second')
+
+    def test_resume_interrupted(self):
+        objs = self.get_objs('first', 'second', 'third')
+        (batch_size, load_data.batch_size) = (load_data.batch_size, 2)
+        checkpoint = load_data.Loader.checkpoint
+        def interrupted(loader, pks):
+            if '13' in [str(old_pk) for (old_pk, new_pk) in pks]:
+                raise KeyboardInterrupt
+            checkpoint(loader, pks)
+        load_data.Loader.checkpoint = interrupted
+        try:
+            # The second batch isn't logged, so isn't committed
+            with self.assertRaises(KeyboardInterrupt):
+                self.load(objs, bulk=False)
+            self.assertEquals(sorted(Artwork.objects.values_list('title', flat=True)), ['first', 'second'])
+        finally:
+            load_data.Loader.checkpoint = checkpoint
+            load_data.batch_size = batch_size
+
+        self.load(objs, bulk=False, resume=True)
+        self.assertEquals(sorted(Artwork.objects.values_list('title', flat=True)), ['first', 'second', 'third'])
+        self.assertEquals(sorted(self.read_checkpoint().keys()), ['11', '12', '13'])
+
+    def test_read_checkpoint_reused(self):
+        artwork = Artwork.objects.create(title='reused', code='', author=self.user)
+        filename = env.get_data_filename('source', 'artwork.artwork.map', 'log')
+        with open(filename, 'w') as log_file:
+            # Ids logged by batches which weren't committed are logged again by later objects
+            log_file.write('["11", %d]\n["12", %d]\n["13", %d]\n["13", %d]\n["14' % (
+                artwork.id, artwork.id, artwork.id + 1, artwork.id))
+        self.assertEquals(self.read_checkpoint(), {'13': artwork.id})
@@ -1,8 +1,12 @@
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.db import IntegrityError
 from django.core.urlresolvers import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.six import StringIO
 
-from artwork.models import Artwork, ArtworkForm
+from artwork.models import Artwork, ArtworkCode, ArtworkForm
 from django_adelaidex.util.test import UserSetUp
 
 class ArtworkTests(UserSetUp, TestCase):
@@ -281,6 +285,63 @@ class ArtworkTests(UserSetUp, TestCase):
         self.assertEqual(shared_url, abs_url)
 
 
+class ArtworkCodeStoreTests(UserSetUp, TestCase):
+    """Artwork content-addressed code store tests."""
+
+    @override_settings(ARTWORK_CODE_STORE=True)
+    def test_store_code(self):
+        code = '// code goes here'
+        artwork1 = Artwork.objects.create(title='Artwork 1', code=code, author=self.user)
+        artwork2 = Artwork.objects.create(title='Artwork 2', code=code, author=self.user)
+
+        # Identical code is stored once
+        self.assertEqual(ArtworkCode.objects.count(), 1)
+        self.assertEqual(artwork1.code_blob, artwork2.code_blob)
+        self.assertEqual(artwork1.code, code)
+
+        # Artwork rows don't hold the code, but it's read transparently
+        self.assertEqual(Artwork.objects.filter(code='').count(), 2)
+        self.assertEqual(Artwork.objects.get(id=artwork1.id).code, code)
+
+        # Changed code gets its own blob
+        artwork2.code = '// changed code'
+        artwork2.save()
+        self.assertEqual(ArtworkCode.objects.count(), 2)
+        self.assertEqual(Artwork.objects.get(id=artwork2.id).code, '// changed code')
+
+    @override_settings(ARTWORK_CODE_STORE=True)
+    def test_store_disabled(self):
+        code = '// code goes here'
+        artwork = Artwork.objects.create(title='Artwork', code=code, author=self.user)
+        self.assertIsNotNone(artwork.code_blob)
+
+        # Saving with the store disabled moves the code back onto the row
+        with self.settings(ARTWORK_CODE_STORE=False):
+            artwork = Artwork.objects.get(id=artwork.id)
+            artwork.save()
+        self.assertIsNone(artwork.code_blob)
+        self.assertEqual(Artwork.objects.filter(code=code).count(), 1)
+
+    def test_migrate_command(self):
+        code = '/* Cloned from somewhere */\n// code goes here'
+        artwork1 = Artwork.objects.create(title='Artwork 1', code=code, author=self.user)
+        artwork2 = Artwork.objects.create(title='Artwork 2', code=code, author=self.user)
+        self.assertEqual(ArtworkCode.objects.count(), 0)
+
+        # Refused unless the store is enabled
+        with self.assertRaises(CommandError):
+            call_command('artwork_code_store', migrate=True, stdout=StringIO())
+        self.assertEqual(ArtworkCode.objects.count(), 0)
+
+        out = StringIO()
+        with self.settings(ARTWORK_CODE_STORE=True):
+            call_command('artwork_code_store', migrate=True, stdout=out)
+        self.assertEqual(ArtworkCode.objects.count(), 1)
+        self.assertEqual(Artwork.objects.get(id=artwork1.id).code, code)
+        self.assertEqual(Artwork.objects.get(id=artwork2.id).code, code)
+        self.assertIn('Space saved: %d chars (50.0%%)' % len(code), out.getvalue())
+
+
 class ArtworkModelFormTests(UserSetUp, TestCase):
     """model.ArtworkForm tests."""
 
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import re
+from django.test import TestCase
+from django.template.loader import render_to_string
+
+from artwork.models import Artwork
+from artwork.serializers import ArtworkCodeSerializer
+from artwork.views import ArtworkView
+from exhibitions.models import Exhibition
+from submissions.models import Submission
+from submissions.serializers import SubmissionCodeSerializer
+from submissions.views import SubmissionView
+from django_adelaidex.util.test import UserSetUp
+
+
+class ArtworkCodeSerializerTests(UserSetUp, TestCase):
+    """Artwork code serializer tests."""
+
+    base_url = 'http://testserver/?a=1&b=2'
+
+    def setUp(self):
+        super(ArtworkCodeSerializerTests, self).setUp()
+        self.artwork = Artwork.objects.create(
+            title=u'Tom & Jerry\'s <b>café</b>',
+            code=u'if (a < b && c > "d") {\n  // é\n}',
+            author=self.user)
+
+    def assertSameOutput(self, template_output, serializer_output):
+        # Ignore the download time, which may have ticked over between renders
+        downloaded = re.compile(r'^// Downloaded: .*$', re.MULTILINE)
+        self.assertEquals(len(downloaded.findall(serializer_output)), 1)
+        self.assertEquals(downloaded.sub('', serializer_output), downloaded.sub('', template_output))
+
+    def test_artwork(self):
+        template_output = render_to_string(ArtworkView.prepend_template_path('code.pde'),
+            {'object': self.artwork, 'BASE_URL': self.base_url})
+        serializer_output = ArtworkCodeSerializer(base_url=self.base_url).serialize(self.artwork)
+        self.assertSameOutput(template_output, serializer_output)
+        self.assertIn(self.artwork.code, serializer_output)
+
+    def test_submission(self):
+        exhibition = Exhibition.objects.create(
+            title='New Exhibition',
+            description='description goes here',
+            author=self.staff_user)
+        submission = Submission.objects.create(
+            artwork=self.artwork, exhibition=exhibition, submitted_by=self.user)
+
+        template_output = render_to_string(SubmissionView.prepend_template_path('code.pde'),
+            {'object': submission, 'BASE_URL': self.base_url})
+        serializer_output = SubmissionCodeSerializer(base_url=self.base_url).serialize(submission)
+        self.assertSameOutput(template_output, serializer_output)
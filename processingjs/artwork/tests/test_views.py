@@ -1,14 +1,23 @@
 from django.test import TestCase
 from django.test.client import Client
+from django.test.utils import override_settings
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
+from django.core.files.storage import default_storage
 
 from artwork.models import Artwork
+from artwork.views import RenderShellArtworkView
 from exhibitions.models import Exhibition
 from submissions.models import Submission
 from votes.models import Vote
 from django_adelaidex.util.test import UserSetUp
+from PIL import Image
 import re
+import io
+import base64
+import shutil
+import tempfile
+import zipfile
 
 
 class ArtworkListTests(UserSetUp, TestCase):
@@ -351,9 +360,9 @@ class ArtworkCodeViewTests(UserSetUp, TestCase):
         # Must login to see it
         response = self.assertLogin(client, artwork_url)
         self.assertEquals(response.get('Content-Disposition'), 'attachment;')
-        self.assertEquals(response.context['object'].code, artwork.code)
-        self.assertEquals(response.context['object'].title, artwork.title)
-        self.assertEquals(response.context['object'].author, artwork.author)
+        self.assertIn('// Title: %s' % artwork.title, response.content)
+        self.assertIn('// Author: %s' % artwork.author, response.content)
+        self.assertIn(artwork.code, response.content)
 
     def test_shared_artwork(self):
         
@@ -365,9 +374,9 @@ class ArtworkCodeViewTests(UserSetUp, TestCase):
 
         response = client.get(artwork_url)
         self.assertEquals(response.get('Content-Disposition'), 'attachment;')
-        self.assertEquals(response.context['object'].code, artwork.code)
-        self.assertEquals(response.context['object'].title, artwork.title)
-        self.assertEquals(response.context['object'].author, artwork.author)
+        self.assertIn('// Title: %s' % artwork.title, response.content)
+        self.assertIn('// Author: %s' % artwork.author, response.content)
+        self.assertIn(artwork.code, response.content)
 
     def test_artwork_404(self):
         
@@ -376,6 +385,36 @@ class ArtworkCodeViewTests(UserSetUp, TestCase):
         self.assertEquals(response.status_code, 404)
 
 
+class ArtworkCodeZipFileTests(UserSetUp, TestCase):
+    """Artwork code zip file view tests."""
+
+    def get_zip_file(self, response):
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/zip')
+        self.assertTrue(response.streaming)
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_zip_page(self):
+        client = Client()
+        for i in range(20):
+            Artwork.objects.create(title='Artwork %d' % i, code='// code %d' % i, shared=1, author=self.user)
+
+        # Current page only
+        zip_path = reverse('artwork-author-list-zip', kwargs={'author': self.user.id})
+        zip_file = self.get_zip_file(client.get(zip_path))
+        self.assertIsNone(zip_file.testzip())
+        self.assertEquals(len(zip_file.namelist()), 12)
+
+        # Whole list
+        zip_file = self.get_zip_file(client.get(zip_path, {'all': 1}))
+        self.assertEquals(len(zip_file.namelist()), 20)
+
+        artwork = Artwork.objects.latest('modified_at')
+        code = zip_file.read('artwork%d.pde' % artwork.id)
+        self.assertIn('// Title: %s' % artwork.title, code)
+        self.assertIn(artwork.code, code)
+
+
 class ArtworkViewRenderTests(UserSetUp, TestCase):
     """Artwork view render tests."""
 
@@ -395,6 +434,25 @@ class ArtworkViewRenderTests(UserSetUp, TestCase):
         # Template view doesn't care if the object doesn't exist
         self.assertEquals(response.status_code, 200)
 
+    def test_artwork_render_shell(self):
+
+        client = Client()
+        shell_path = RenderShellArtworkView.get_url()
+        response = client.get(shell_path)
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('max-age=%d' % RenderShellArtworkView.cache_max_age, response['Cache-Control'])
+        self.assertIn("connect-src 'none'", response['Content-Security-Policy'])
+        self.assertIn('id="artwork-rendered"', response.content)
+
+        # Browsers revalidate using the etag
+        response = client.get(shell_path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, 304)
+
+        # Outdated shell URLs get the current shell, with a short cache lifetime
+        response = client.get(reverse('artwork-render-shell', kwargs={'digest': '0'}))
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('max-age=0', response['Cache-Control'])
+
 
 class ArtworkDeleteTests(UserSetUp, TestCase):
     """Artwork delete view tests."""
@@ -765,3 +823,120 @@ class ArtworkEditTests(UserSetUp, TestCase):
         response = client.get(view_url)
         self.assertEquals(response.context['object'].title, artwork.title)
 
+
+class ArtworkPreviewTests(UserSetUp, TestCase):
+    """Artwork preview upload tests"""
+
+    def setUp(self):
+        super(ArtworkPreviewTests, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir)
+        super(ArtworkPreviewTests, self).tearDown()
+
+    @staticmethod
+    def data_url(size=(100, 100), format='PNG'):
+        image_data = io.BytesIO()
+        Image.new('RGB', size, 'red').save(image_data, format)
+        return 'data:image/%s;base64,%s' % (format.lower(), base64.b64encode(image_data.getvalue()))
+
+    def test_preview(self):
+        artwork = Artwork.objects.create(title='Title bar', code='// code goes here', author=self.user)
+        modified_at = artwork.modified_at
+        preview_url = reverse('artwork-preview', kwargs={'pk': artwork.id})
+        list_url = reverse('artwork-author-list', kwargs={'author': self.user.id, 'shared': 0})
+
+        client = Client()
+        self.assertLogin(client, list_url)
+
+        # Lists boot the iframe straight away until there's a preview
+        response = client.get(list_url)
+        self.assertIn('createArtworkIframe(', response.content)
+        self.assertNotIn('createArtworkStill(', response.content)
+
+        response = client.post(preview_url, {'preview': self.data_url()})
+        self.assertEquals(response.status_code, 200)
+
+        artwork = Artwork.objects.get(id=artwork.id)
+        self.assertEquals(response.json()['url'], artwork.preview.url)
+        self.assertEquals(Image.open(artwork.preview).size, (100, 100))
+        self.assertEquals(artwork.modified_at, modified_at)
+
+        # Lists show the preview instead
+        response = client.get(list_url)
+        self.assertIn(artwork.preview.url, response.content)
+        self.assertIn('createArtworkStill(', response.content)
+
+        # Replacing the preview removes the previous one
+        previous = artwork.preview.name
+        response = client.post(preview_url, {'preview': self.data_url(size=(50, 50))})
+        self.assertEquals(response.status_code, 200)
+        artwork = Artwork.objects.get(id=artwork.id)
+        self.assertEquals(Image.open(artwork.preview).size, (50, 50))
+        self.assertFalse(artwork.preview.storage.exists(previous))
+
+        # Deleting the artwork removes its preview
+        name = artwork.preview.name
+        artwork.delete()
+        self.assertFalse(default_storage.exists(name))
+
+    @override_settings(ARTWORK_PREVIEW_SIZE=200)
+    def test_large_preview(self):
+        artwork = Artwork.objects.create(title='Title bar', code='// code goes here', author=self.user)
+        preview_url = reverse('artwork-preview', kwargs={'pk': artwork.id})
+
+        client = Client()
+        self.assertLogin(client, reverse('artwork-edit', kwargs={'pk': artwork.id}))
+
+        # Large canvases are shrunk
+        response = client.post(preview_url, {'preview': self.data_url(size=(800, 400))})
+        self.assertEquals(response.status_code, 200)
+        artwork = Artwork.objects.get(id=artwork.id)
+        self.assertEquals(Image.open(artwork.preview).size, (200, 100))
+
+        # Too many bytes are rejected
+        with self.settings(ARTWORK_PREVIEW_MAX_BYTES=100):
+            response = client.post(preview_url, {'preview': self.data_url()})
+        self.assertEquals(response.status_code, 400)
+        self.assertIn('preview', response.json()['errors'])
+
+    def test_invalid_preview(self):
+        artwork = Artwork.objects.create(title='Title bar', code='// code goes here', author=self.user)
+        preview_url = reverse('artwork-preview', kwargs={'pk': artwork.id})
+
+        client = Client()
+        self.assertLogin(client, reverse('artwork-edit', kwargs={'pk': artwork.id}))
+
+        for preview in ('', 'not a data url', 'data:image/png;base64,not base64!',
+                        'data:image/png;base64,' + base64.b64encode('not an image'),
+                        self.data_url(format='JPEG').replace('image/jpeg', 'image/png')):
+            response = client.post(preview_url, {'preview': preview})
+            self.assertEquals(response.status_code, 400)
+            self.assertIn('preview', response.json()['errors'])
+        self.assertFalse(Artwork.objects.get(id=artwork.id).preview)
+
+    def test_not_author_preview(self):
+        otherUser = get_user_model().objects.create(username='other')
+        artwork = Artwork.objects.create(title='Title bar', code='// code goes here', author=otherUser)
+        shared = Artwork.objects.create(title='Shared', code='// code goes here', shared=1, author=self.user)
+        preview_url = reverse('artwork-preview', kwargs={'pk': artwork.id})
+        login_url = '%s?next=%s' % (reverse('login'), preview_url)
+
+        # Unauthenticated redirects to login
+        client = Client()
+        response = client.post(preview_url, {'preview': self.data_url()})
+        self.assertRedirects(response, login_url, status_code=302, target_status_code=200)
+
+        # Forbidden to non-authors, and for shared artwork
+        self.assertLogin(client, reverse('artwork-list'))
+        response = client.post(preview_url, {'preview': self.data_url()})
+        self.assertEquals(response.status_code, 403)
+        response = client.post(reverse('artwork-preview', kwargs={'pk': shared.id}),
+                               {'preview': self.data_url()})
+        self.assertEquals(response.status_code, 403)
+
+        self.assertFalse(Artwork.objects.get(id=artwork.id).preview)
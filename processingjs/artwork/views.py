@@ -1,16 +1,22 @@
-from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView, TemplateView, RedirectView
+from django.views.generic import View, ListView, CreateView, UpdateView, DetailView, DeleteView, TemplateView, RedirectView
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.contrib.auth import get_user_model
 from django.utils.decorators import method_decorator
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.template.loader import render_to_string
 from csp.decorators import csp_replace
+from csp.utils import build_policy
 from django.core.exceptions import PermissionDenied
 import os
+import hashlib
+import threading
 
-from django_adelaidex.util.mixins import TemplatePathMixin, LoggedInMixin, ObjectHasPermMixin, MethodObjectHasPermMixin
-from django_adelaidex.zipfile.mixins import ZipFileViewMixin
+from django_adelaidex.util.mixins import TemplatePathMixin, PostOnlyMixin, LoggedInMixin, ObjectHasPermMixin, MethodObjectHasPermMixin
 from gallery.views import ShareView
-from artwork.models import Artwork, ArtworkForm
+from gallery.streaming import StreamingZipFileViewMixin
+from artwork.models import Artwork, ArtworkForm, ArtworkPreviewForm
+from artwork.serializers import ArtworkCodeSerializer
 
 from exhibitions.models import Exhibition
 from submissions.models import Submission
@@ -22,6 +28,22 @@ class ArtworkView(TemplatePathMixin):
     template_dir = 'artwork'
 
 
+# CSP used to render artwork
+RENDER_CSP_REPLACE = dict(
+    # processingjs requires *.adelaide and unsafe-eval for scripts, css, and fonts
+    # (have to specify *.adelaide because of iframe security)
+    SCRIPT_SRC = tuple(settings.ARTWORK_CSP_SCRIPT_SRC),
+    STYLE_SRC =  tuple(settings.ARTWORK_CSP_STYLE_SRC),
+    FONT_SRC = ("'self'", "data:",),
+    # no objects, media, frames, or XHR requests allowed during render.
+    # (IMG_SRC covered by default policy)
+    OBJECT_SRC = ("'none'",),
+    MEDIA_SRC = ("'none'",),
+    FRAME_SRC = ("'none'",),
+    CONNECT_SRC=("'none'",),
+)
+
+
 class RenderArtworkView(TemplateView):
     template_name = ArtworkView.prepend_template_path('render.html')
 
@@ -29,23 +51,61 @@ class RenderArtworkView(TemplateView):
        to make them ok to allow inline and eval'd Javascript provided by students.
        We also disallow everything else, so that the rendered artwork can't include them.
     '''
-    @method_decorator(csp_replace(
-        # processingjs requires *.adelaide and unsafe-eval for scripts, css, and fonts
-        # (have to specify *.adelaide because of iframe security)
-        SCRIPT_SRC = tuple(settings.ARTWORK_CSP_SCRIPT_SRC),
-        STYLE_SRC =  tuple(settings.ARTWORK_CSP_STYLE_SRC),
-        FONT_SRC = ("'self'", "data:",),
-        # no objects, media, frames, or XHR requests allowed during render.
-        # (IMG_SRC covered by default policy)
-        OBJECT_SRC = ("'none'",),
-        MEDIA_SRC = ("'none'",),
-        FRAME_SRC = ("'none'",),
-        CONNECT_SRC=("'none'",),
-    ))
+    @method_decorator(csp_replace(**RENDER_CSP_REPLACE))
     def dispatch(self, *args, **kwargs):
         return super(RenderArtworkView, self).dispatch(*args, **kwargs)
 
 
+class RenderShellArtworkView(View):
+    '''Serves the same render.html as RenderArtworkView, for all artwork.
+
+       The artwork pk is passed in the URL fragment, so every artwork iframe
+       shares a single browser-cached response.  The page and its CSP header
+       are built once per process, and the URL changes whenever the page does.
+    '''
+    template_name = RenderArtworkView.template_name
+    cache_max_age = 365 * 24 * 60 * 60
+
+    _shell = None
+    _shell_lock = threading.Lock()
+
+    @classmethod
+    def get_shell(cls):
+        '''Returns the (content, digest, csp header) for the render shell'''
+        if cls._shell is None:
+            with cls._shell_lock:
+                if cls._shell is None:
+                    content = render_to_string(cls.template_name, {'pk': ''})
+                    content = content.encode('utf-8')
+                    digest = hashlib.md5(content).hexdigest()[:12]
+                    replace = dict((k.lower().replace('_', '-'), v)
+                                   for k, v in RENDER_CSP_REPLACE.items())
+                    cls._shell = (content, digest, build_policy(replace=replace))
+        return cls._shell
+
+    @classmethod
+    def get_url(cls):
+        (content, digest, policy) = cls.get_shell()
+        return reverse('artwork-render-shell', kwargs={'digest': digest})
+
+    def get(self, request, digest=None, *args, **kwargs):
+        (content, digest_now, policy) = self.get_shell()
+        etag = '"%s"' % digest_now
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='text/html; charset=utf-8')
+        response['ETag'] = etag
+        response['Content-Security-Policy'] = policy
+
+        # Links to an outdated shell get the current one, but only briefly
+        if digest == digest_now:
+            response['Cache-Control'] = 'public, max-age=%d' % self.cache_max_age
+        else:
+            response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+
+
 class StudioArtworkView(LoggedInMixin, RedirectView):
     permanent = False
 
@@ -55,14 +115,15 @@ class StudioArtworkView(LoggedInMixin, RedirectView):
 
 
 class ArtworkCodeView(MethodObjectHasPermMixin, ArtworkView, DetailView):
-    template_name = ArtworkView.prepend_template_path('code.pde')
+    serializer_class = ArtworkCodeSerializer
     content_type = 'text/plain'
     content_disposition = 'attachment;'
     method_user_perm = { 'GET': 'can_see' }
 
     def render_to_response(self, context, **response_kwargs):
-        response = super(ArtworkCodeView, self).render_to_response(
-                context, **response_kwargs)
+        serializer = self.serializer_class.for_request(self.request)
+        response = HttpResponse(serializer.serialize(self.object),
+                                content_type=self.content_type)
         response['Content-Disposition'] = self.content_disposition
         return response
 
@@ -134,8 +195,8 @@ class ListArtworkView(ArtworkView, ListView):
         return context
 
 
-class ListArtworkCodeZipFileView(ZipFileViewMixin, ListArtworkView):
-    object_template_name = ArtworkCodeView.template_name
+class ListArtworkCodeZipFileView(StreamingZipFileViewMixin, ListArtworkView):
+    serializer_class = ArtworkCodeSerializer
     object_filename = 'artwork%d.pde'
     zip_filename = 'code.zip'
 
@@ -222,6 +283,26 @@ class UpdateArtworkView(MethodObjectHasPermMixin, ArtworkView, UpdateView):
         return context
 
 
+class ArtworkPreviewView(PostOnlyMixin, LoggedInMixin, ArtworkView, DetailView):
+    '''Stores the still image captured by artwork-edit.js from the rendered artwork.'''
+
+    preview_form_class = ArtworkPreviewForm
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+
+        # Only authors can change the preview of un-shared artwork
+        if not self.object.can_save(request.user):
+            raise PermissionDenied
+
+        form = self.preview_form_class(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        self.object.save_preview(form.cleaned_data['preview'])
+        return JsonResponse({'url': self.object.preview.url})
+
+
 class DeleteArtworkView(LoggedInMixin, ObjectHasPermMixin, ArtworkView, DeleteView):
 
     template_name = ArtworkView.prepend_template_path('delete.html')
@@ -0,0 +1,289 @@
+import os
+import glob
+import json
+import time
+import shutil
+import struct
+import zipfile
+import logging
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.core.urlresolvers import get_script_prefix, set_script_prefix
+
+from gallery.streaming import ZipStream, chunked_iterator, zip_info
+from submissions.models import Submission
+from submissions.serializers import SubmissionCodeSerializer
+from submissions.views import ListSubmissionCodeZipFileView
+
+
+class ExhibitionArchive(object):
+    '''Zip file containing the code of every submission to an exhibition.
+
+       Archives are built in a background thread, and stored in
+       settings.EXHIBITION_ARCHIVE_DIR.  The filename includes the number of
+       submissions and their latest modification time, so a stored archive is
+       served until the exhibition's submissions change.
+
+       Each entry's comment records the version of the submission it was
+       rendered from, so an outdated archive can be brought up to date by
+       replacing only the changed entries.  Replaced and removed entries are
+       left in the file until they make up compact_ratio of it, when the
+       archive is rebuilt instead.
+    '''
+    object_filename = ListSubmissionCodeZipFileView.object_filename
+    stamp_format = '%Y%m%d%H%M%S%f'
+
+    # Builds running longer than this are assumed to have died.
+    build_timeout = 60 * 60
+
+    # Rebuild rather than update once this fraction of the archive is unused.
+    compact_ratio = 0.5
+
+    def __init__(self, exhibition, base_url='', script_prefix=None):
+        self.exhibition_id = getattr(exhibition, 'id', exhibition)
+        self.base_url = base_url
+        self.script_prefix = script_prefix or get_script_prefix()
+        self.path = self.get_path()
+        self._serializer = None
+
+    @property
+    def submissions(self):
+        return Submission.objects.filter(exhibition_id=self.exhibition_id)
+
+    @classmethod
+    def make_key(cls, stamp, count):
+        return '%s-%d' % (stamp, count)
+
+    def get_key(self):
+        '''Changes whenever a submission or its artwork is added, changed or removed.'''
+        latest = self.submissions.aggregate(
+            count=Count('id'),
+            submitted=Max('modified_at'),
+            modified=Max('artwork__modified_at'),
+        )
+        modified_at = max(latest['submitted'], latest['modified'])
+        stamp = modified_at.strftime(self.stamp_format) if modified_at else '0'
+        return self.make_key(stamp, latest['count'])
+
+    def get_versions(self):
+        '''Returns the current version of each submission, by id.'''
+        versions = {}
+        for (pk, submitted, modified) in self.submissions.values_list(
+                'id', 'modified_at', 'artwork__modified_at'):
+            versions[pk] = max(submitted, modified).strftime(self.stamp_format)
+        return versions
+
+    def get_path(self, key=None):
+        filename = 'exhibition%d-%s.zip' % (self.exhibition_id, key or self.get_key())
+        return os.path.join(settings.EXHIBITION_ARCHIVE_DIR, filename)
+
+    def get_archives(self):
+        '''Returns the paths of the stored archives for this exhibition, newest first.'''
+        pattern = os.path.join(settings.EXHIBITION_ARCHIVE_DIR,
+                               'exhibition%d-*.zip' % self.exhibition_id)
+        return sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+
+    @property
+    def lock_path(self):
+        return os.path.join(settings.EXHIBITION_ARCHIVE_DIR,
+                            'exhibition%d.lock' % self.exhibition_id)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def is_building(self):
+        try:
+            started = os.path.getmtime(self.lock_path)
+        except OSError:
+            return False
+        return (time.time() - started) < self.build_timeout
+
+    def get_status(self):
+        if self.exists():
+            return 'ready'
+        elif self.is_building():
+            return 'building'
+        return 'missing'
+
+    def render_submission(self, submission):
+        if self._serializer is None:
+            self._serializer = SubmissionCodeSerializer(base_url=self.base_url)
+        return self._serializer.serialize(submission)
+
+    def get_comment(self, dead_bytes=0):
+        '''Archive comment, storing what's needed to update it later.'''
+        return json.dumps({
+            'base_url': self.base_url,
+            'dead_bytes': dead_bytes,
+        })
+
+    def iter_submissions(self, ids, chunk_size=100):
+        '''Iterates over the given submissions, with their artwork.'''
+        ids = sorted(ids)
+        submissions = self.submissions.select_related('artwork', 'artwork__author')
+        for start in range(0, len(ids), chunk_size):
+            for submission in submissions.filter(id__in=ids[start:start + chunk_size]):
+                yield submission
+
+    def write(self, archive_file, versions):
+        '''Writes a new archive to the given file, one submission at a time.'''
+        submissions = self.submissions.select_related(
+            'artwork', 'artwork__author').order_by('id')
+        zip_stream = ZipStream()
+        for submission in chunked_iterator(submissions):
+            # Skip submissions added since the versions were read
+            if submission.id in versions:
+                archive_file.write(zip_stream.add(
+                    self.object_filename % submission.id,
+                    self.render_submission(submission),
+                    comment=versions[submission.id]))
+        archive_file.write(zip_stream.close(self.get_comment()))
+
+    def update(self, zip_path, versions):
+        '''Brings the archive copied to zip_path up to date with versions.
+
+           Returns False without changing it, if the archive needs compacting.
+        '''
+        zip_file = zipfile.ZipFile(zip_path, 'a', zipfile.ZIP_DEFLATED, allowZip64=True)
+        try:
+            try:
+                state = json.loads(zip_file.comment)
+            except ValueError:
+                state = {}
+            self.base_url = self.base_url or state.get('base_url', '')
+
+            # Entries dropped by earlier updates are already counted in dead_bytes
+            current = dict((self.object_filename % pk, version)
+                           for (pk, version) in versions.items())
+            stale = {}
+            for info in zip_file.infolist():
+                if current.get(info.filename) != info.comment:
+                    stale[info.filename] = self.entry_size(zip_file, info)
+            zip_file.fp.seek(zip_file.start_dir)
+
+            dead_bytes = state.get('dead_bytes', 0) + sum(stale.values())
+            if dead_bytes > zip_file.start_dir * self.compact_ratio:
+                return False
+
+            # Drop the stale entries from the directory, and overwrite it
+            zip_file.filelist = [info for info in zip_file.filelist
+                                 if info.filename not in stale]
+            for filename in stale:
+                del zip_file.NameToInfo[filename]
+            zip_file.fp.truncate(zip_file.start_dir)
+
+            added = [pk for pk in versions
+                     if self.object_filename % pk not in zip_file.NameToInfo]
+            for submission in self.iter_submissions(added):
+                info = zip_info(self.object_filename % submission.id,
+                                comment=versions[submission.id])
+                zip_file.writestr(info, self.render_submission(submission).encode('utf-8'))
+            zip_file.comment = self.get_comment(dead_bytes)
+        finally:
+            zip_file.close()
+        return True
+
+    @staticmethod
+    def entry_size(zip_file, info):
+        '''Returns the bytes taken by the entry's local header and data.'''
+        zip_file.fp.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader, zip_file.fp.read(zipfile.sizeFileHeader))
+        size = (zipfile.sizeFileHeader + header[zipfile._FH_FILENAME_LENGTH] +
+                header[zipfile._FH_EXTRA_FIELD_LENGTH] + info.compress_size)
+        if info.flag_bits & 0x08:
+            # Data descriptor, with signature
+            size += 16
+        return size
+
+    def _lock(self):
+        '''Returns True if this process may build the exhibition's archive.'''
+        if not os.path.isdir(settings.EXHIBITION_ARCHIVE_DIR):
+            os.makedirs(settings.EXHIBITION_ARCHIVE_DIR)
+        if os.path.exists(self.lock_path) and not self.is_building():
+            os.remove(self.lock_path)
+        try:
+            os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+    def build(self):
+        '''Brings the stored archive up to date, unless another thread or process is.
+
+           Updates a copy of the latest stored archive if there is one, so
+           only new and changed submissions are rendered.  Otherwise, or if
+           the latest archive needs compacting, builds a new one.
+        '''
+        if not self._lock():
+            return
+        try:
+            set_script_prefix(self.script_prefix)
+            versions = self.get_versions()
+            self.path = self.get_path(
+                self.make_key(max(versions.values()) if versions else '0', len(versions)))
+            if self.exists():
+                return
+
+            previous = self.get_archives()
+            tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            try:
+                updated = False
+                if previous:
+                    shutil.copyfile(previous[0], tmp_path)
+                    updated = self.update(tmp_path, versions)
+                if not updated:
+                    with open(tmp_path, 'wb') as archive_file:
+                        self.write(archive_file, versions)
+            except:
+                os.remove(tmp_path)
+                raise
+            os.rename(tmp_path, self.path)
+            self.remove_outdated()
+        finally:
+            self._unlock()
+
+    def build_async(self):
+        '''Starts building the archive in a background thread.'''
+        def run():
+            try:
+                self.build()
+            except Exception:
+                logging.exception('Error building %s' % self.path)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run, name='archive-%d' % self.exhibition_id)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    @classmethod
+    def update_on_commit(cls, exhibition):
+        '''Brings any stored archive for the exhibition up to date in the
+           background, once the current transaction commits.
+        '''
+        script_prefix = get_script_prefix()
+
+        def update():
+            archive = cls(exhibition, script_prefix=script_prefix)
+            if archive.get_archives() and not archive.exists():
+                archive.build_async()
+
+        transaction.on_commit(update)
+
+    def remove_outdated(self):
+        '''Removes previous archives for this exhibition.'''
+        for path in self.get_archives():
+            if path != self.path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
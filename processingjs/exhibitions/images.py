@@ -0,0 +1,103 @@
+import io
+import logging
+import threading
+from django.conf import settings
+from django.db import connection
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from gallery.images import has_transparency, encode
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def get_slots():
+    '''Returns the semaphore which limits the images resized at once in this process.'''
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(settings.EXHIBITION_IMAGE_THREADS)
+    return _slots
+
+
+def resize(data, widths):
+    '''Returns the image (width, height), and a list of (width, height,
+       extension, data) for each of the given widths narrower than the image.
+       Returns (None, []) if the data is not a valid image.
+
+       Images with transparency are saved as PNG, others as JPEG.
+    '''
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            image = source.convert('RGBA' if has_transparency(source) else 'RGB')
+    except (IOError, SyntaxError, ValueError):
+        return (None, [])
+
+    variants = []
+    for width in sorted(set(widths)):
+        if width >= image.size[0]:
+            break
+        height = max(1, int(round(image.size[1] * float(width) / image.size[0])))
+        variant = image.resize((width, height), Image.ANTIALIAS)
+        out = io.BytesIO()
+        extension = encode(variant, out)
+        variants.append((width, height, extension, out.getvalue()))
+    return (image.size, variants)
+
+
+def generate_variants(exhibition_id, source):
+    '''Creates the resized variants of the exhibition's image, named source.'''
+    from exhibitions.models import Exhibition, ImageVariant
+
+    exhibitions = Exhibition.objects.filter(id=exhibition_id, image=source)
+    exhibition = exhibitions.first()
+    if not exhibition:
+        return []
+
+    data = exhibition.image.read()
+    exhibition.image.close()
+    (size, resized) = resize(data, settings.EXHIBITION_IMAGE_WIDTHS)
+
+    ImageVariant.objects.filter(exhibition_id=exhibition_id, source=source).delete()
+    if not resized:
+        return []
+
+    (width, height) = size
+    variants = [ImageVariant.objects.create(
+        exhibition_id=exhibition_id, source=source, image=source, width=width, height=height)]
+    for (width, height, extension, variant_data) in resized:
+        variant = ImageVariant(exhibition_id=exhibition_id, source=source, width=width, height=height)
+        variant.image.save('exhibition%d-%dw.%s' % (exhibition_id, width, extension),
+                           ContentFile(variant_data), save=False)
+        variant.save()
+        variants.append(variant)
+
+    # Remove the variants if the image was changed while they were generated
+    if not exhibitions.exists():
+        ImageVariant.objects.filter(exhibition_id=exhibition_id, source=source).delete()
+        return []
+    return variants
+
+
+def generate_variants_async(exhibition_id, source):
+    '''Creates the resized variants of the exhibition's image in a background
+       thread.  Pillow releases the GIL while it decodes, resizes and encodes,
+       so the resizing doesn't hold up the request threads, and nothing is
+       forked from the wsgi daemon.
+    '''
+    def run():
+        try:
+            with get_slots():
+                generate_variants(exhibition_id, source)
+        except Exception:
+            logging.exception('Error resizing image %s for exhibition %d' % (source, exhibition_id))
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name='image-variants-%d' % exhibition_id)
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -1,20 +1,29 @@
-from django.db import models
-from django.db.models import Q
+import math
+import uuid
+from django.db import models, transaction
+from django.db.models import Q, Min
 from django.db.models.signals import post_init, post_save, post_delete
 from django.conf import settings
 from django.utils import timezone
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django.dispatch import receiver
+from django.core.cache import cache
 from rulez import registry
 from database_files.models import File
 from django_adelaidex.lti.models import Cohort
+from gallery.images import UploadedImageField
 
 
 class Exhibition(models.Model):
     class Meta:
         db_table = 'exhibitions'
 
+    # Cache keys for the released exhibition ids visible to each cohort.
+    # The generation is replaced whenever an exhibition is saved or deleted.
+    VISIBLE_IDS_GENERATION_KEY = 'exhibitions.visible_ids.generation'
+    VISIBLE_IDS_KEY = 'exhibitions.visible_ids.%s.%s'
+
     title = models.CharField(max_length=500)
     description = models.TextField()
     image = models.ImageField(upload_to='not required',
@@ -68,21 +77,88 @@ class Exhibition(models.Model):
         if not qs:
             qs = cls.objects
 
-        if not cls.can_save(user):
-            qs = qs.filter(Q(released_at__isnull=True) | Q(released_at__lte=timezone.now()))
-
         # Show "all cohorts" and "current cohort" exhibitions to non-superusers
         if not user or not user.is_authenticated() or not user.is_superuser:
             cohort = Cohort.objects.get_current(user)
-            qs = qs.filter(Q(cohort__isnull=True) | Q(cohort=cohort))
+            if cls.can_save(user):
+                qs = qs.filter(Q(cohort__isnull=True) | Q(cohort=cohort))
+            else:
+                # Released cohort exhibitions are cached until the next release
+                qs = qs.filter(pk__in=cls.visible_ids(cohort))
 
         return qs
 
+    @classmethod
+    def visible_ids(cls, cohort=None):
+        '''Returns the ids of the released exhibitions visible to the given cohort.
+
+           Results are cached until the next scheduled release date, or until
+           an exhibition is saved or deleted, whichever comes first.'''
+        generation = cache.get(cls.VISIBLE_IDS_GENERATION_KEY)
+        if generation is None:
+            generation = cls.invalidate_visible_ids()
+
+        key = cls.VISIBLE_IDS_KEY % (generation, cohort.id if cohort else 'none')
+        ids = cache.get(key)
+        if ids is None:
+            now = timezone.now()
+            qs = cls.objects.filter(Q(released_at__isnull=True) | Q(released_at__lte=now))
+            qs = qs.filter(Q(cohort__isnull=True) | Q(cohort=cohort))
+            ids = frozenset(qs.values_list('id', flat=True))
+
+            # Expire the cached set when the next exhibition is released
+            next_release = cls.objects.filter(
+                released_at__gt=now).aggregate(Min('released_at'))['released_at__min']
+            timeout = None
+            if next_release:
+                timeout = max(1, int(math.ceil((next_release - now).total_seconds())))
+            cache.set(key, ids, timeout)
+
+        return ids
+
+    @classmethod
+    def invalidate_visible_ids(cls):
+        '''Discards all cached visible_ids sets, and returns the new generation.'''
+        generation = uuid.uuid4().hex
+        cache.set(cls.VISIBLE_IDS_GENERATION_KEY, generation, None)
+        return generation
+
 
 registry.register('can_see', Exhibition)
 registry.register('can_save', Exhibition)
 
 
+class ImageVariant(models.Model):
+    '''Resized copy of an exhibition image, generated by exhibitions.images.
+
+       The original image is also listed, with its own size, so it can be
+       chosen by browsers; its image is the source.
+    '''
+    class Meta:
+        db_table = 'exhibition_image_variants'
+        ordering = ('width',)
+
+    exhibition = models.ForeignKey(Exhibition, related_name='image_variants')
+    # Name of the exhibition image this variant was resized from
+    source = models.CharField(max_length=255)
+    image = models.ImageField(upload_to='not required')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    def __unicode__(self):
+        return '%s (%dw)' % (self.source, self.width)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+
+@receiver(post_delete, sender=ImageVariant)
+def variant_post_delete(sender, instance=None, **kwargs):
+    '''Delete the variant image file, unless it's the original'''
+    if instance and instance.image and instance.image.name != instance.source:
+        instance.image.storage.delete(instance.image.name)
+
+
 @receiver(post_init, sender=Exhibition)
 def post_init(sender, instance=None, **kwargs):
     '''Store initial image, to detect changes in post_save, post_delete'''
@@ -91,25 +167,41 @@ def post_init(sender, instance=None, **kwargs):
 
 @receiver(post_delete, sender=Exhibition)
 def post_delete(sender, instance=None, **kwargs):
-    '''Delete orphan image, if any'''
+    '''Delete orphan image, if any, and invalidate cached visible_ids'''
     if instance:
+        Exhibition.invalidate_visible_ids()
         if instance.__init_image:
             instance.__init_image.storage.delete(instance.__init_image.name)
 
 @receiver(post_save, sender=Exhibition)
-def post_save(sender, instance=None, **kwargs):
-    '''Delete orphan image, if any'''
+def post_save(sender, instance=None, created=False, **kwargs):
+    '''Delete orphan image and its variants, if any, generate variants of a new image,
+       and invalidate cached visible_ids'''
     if instance:
+        Exhibition.invalidate_visible_ids()
         if instance.__init_image and (
           not instance.image 
           or (instance.image != instance.__init_image)):
             instance.__init_image.storage.delete(instance.__init_image.name)
+            for variant in instance.image_variants.exclude(source=instance.image.name or ''):
+                variant.delete()
+
+        if instance.image and (created or instance.image != instance.__init_image):
+            from exhibitions.images import generate_variants_async
+            (exhibition_id, source) = (instance.id, instance.image.name)
+            transaction.on_commit(lambda: generate_variants_async(exhibition_id, source))
+
+        # Detect changes from the saved image on the next save
+        instance.__init_image = instance.image
 
 
 class ExhibitionForm(forms.ModelForm):
     class Meta:
         model = Exhibition
         fields = ['title', 'description', 'image', 'cohort', 'released_at',]
+        field_classes = {
+            'image': UploadedImageField,
+        }
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
@@ -0,0 +1,23 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_srcset(exhibition, max_width):
+    '''Returns srcset and sizes attributes listing the resized variants of the
+       exhibition image, displayed at most max_width pixels wide.
+
+       Browsers then fetch the smallest variant that fits.
+    '''
+    if not exhibition.image:
+        return ''
+    variants = [variant for variant in exhibition.image_variants.all()
+                if variant.source == exhibition.image.name]
+    if len(variants) < 2:
+        return ''
+
+    srcset = ', '.join('%s %dw' % (variant.image.url, variant.width) for variant in variants)
+    width = min(int(max_width), max(variant.width for variant in variants))
+    return format_html(u'srcset="{}" sizes="{}px"', srcset, width)
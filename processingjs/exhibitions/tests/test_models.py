@@ -1,13 +1,18 @@
-from django.test import TestCase
-from django.db import IntegrityError
+import io
+from PIL import Image
+from django.test import TestCase, override_settings
+from django.db import IntegrityError, connection
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.core import files
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
+from django.template import Context, Template
 
 from django_adelaidex.util.test import UserSetUp
 from django_adelaidex.lti.models import Cohort
-from exhibitions.models import Exhibition, ExhibitionForm
+from exhibitions.models import Exhibition, ExhibitionForm, ImageVariant
+from exhibitions.images import generate_variants
 from database_files.models import File
 
 
@@ -156,6 +161,35 @@ class ExhibitionTests(UserSetUp, TestCase):
         self.assertEqual(super_qs.all()[1].id, today.id)
         self.assertEqual(super_qs.all()[2].id, tomorrow.id)
 
+    def test_visible_ids(self):
+        now = timezone.now()
+
+        yesterday = Exhibition.objects.create(
+            author=self.user,
+            title='Yesterday Exhibition',
+            description='description goes here',
+            released_at=now + timedelta(hours=-24))
+        tomorrow = Exhibition.objects.create(
+            author=self.user,
+            title='Tomorrow Exhibition',
+            description='description goes here',
+            released_at=now + timedelta(hours=24))
+
+        self.assertEqual(Exhibition.visible_ids(), frozenset([yesterday.id]))
+
+        # Second lookup is served from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(Exhibition.visible_ids(), frozenset([yesterday.id]))
+
+        # Saving an exhibition invalidates the cache
+        tomorrow.released_at = now + timedelta(hours=-1)
+        tomorrow.save()
+        self.assertEqual(Exhibition.visible_ids(), frozenset([yesterday.id, tomorrow.id]))
+
+        # And so does deleting one
+        yesterday.delete()
+        self.assertEqual(Exhibition.visible_ids(), frozenset([tomorrow.id]))
+
 
 class ExhibitionNoCohortTests(UserSetUp, TestCase):
     """Exhibition model tests, with no cohorts."""
@@ -654,9 +688,147 @@ class ExhibitionImageTests(UserSetUp, TestCase):
         self.assertEqual(File.objects.count(), 1)
 
 
+@override_settings(EXHIBITION_IMAGE_WIDTHS=[160, 320, 1280])
+class ExhibitionImageVariantTests(UserSetUp, TestCase):
+
+    @staticmethod
+    def create_image_file(mode='RGB', size=(800, 400), format='PNG'):
+        image_data = io.BytesIO()
+        Image.new(mode, size).save(image_data, format)
+        return ExhibitionImageTests.create_tmp_file(suffix='.png', data=image_data.getvalue())
+
+    def create_exhibition(self, tmp_file):
+        return Exhibition.objects.create(
+            author=self.user,
+            title='New Exhibition',
+            description='description goes here',
+            released_at=timezone.now(),
+            image=files.File(tmp_file),
+        )
+
+    def test_generate_variants(self):
+        exhibition = self.create_exhibition(self.create_image_file())
+        variants = generate_variants(exhibition.id, exhibition.image.name)
+
+        # Original, plus variants narrower than it
+        self.assertEqual([variant.width for variant in variants], [800, 160, 320])
+        self.assertEqual([variant.height for variant in variants], [400, 80, 160])
+        self.assertEqual(variants[0].image.name, exhibition.image.name)
+        self.assertEqual(File.objects.count(), 3)
+
+        variant = Image.open(variants[1].image)
+        self.assertEqual(variant.size, (160, 80))
+        self.assertEqual(variant.format, 'JPEG')
+
+        # Templates list the variants, up to the given display width
+        template = Template('{% load exhibition_images %}{% image_srcset exhibition 640 %}')
+        html = template.render(Context({'exhibition': exhibition}))
+        self.assertIn('%s 160w' % variants[1].image.url, html)
+        self.assertIn('%s 800w' % exhibition.image.url, html)
+        self.assertIn('sizes="640px"', html)
+
+    def test_transparent_variants(self):
+        exhibition = self.create_exhibition(self.create_image_file(mode='RGBA'))
+        variants = generate_variants(exhibition.id, exhibition.image.name)
+        self.assertEqual(Image.open(variants[1].image).format, 'PNG')
+
+    def test_invalid_image(self):
+        tmp_file = ExhibitionImageTests.create_tmp_file(suffix='.png', data=ExhibitionImageTests.PNG_IMAGE)
+        exhibition = self.create_exhibition(tmp_file)
+        self.assertEqual(generate_variants(exhibition.id, exhibition.image.name), [])
+        self.assertEqual(ImageVariant.objects.count(), 0)
+
+        template = Template('{% load exhibition_images %}{% image_srcset exhibition 640 %}')
+        self.assertEqual(template.render(Context({'exhibition': exhibition})), '')
+
+    def test_change_image(self):
+        exhibition = self.create_exhibition(self.create_image_file())
+        generate_variants(exhibition.id, exhibition.image.name)
+        self.assertEqual(File.objects.count(), 3)
+
+        exhibition = Exhibition.objects.get(pk=exhibition.id)
+        exhibition.image = files.File(self.create_image_file(size=(200, 100)))
+        exhibition.save()
+        self.assertEqual(ImageVariant.objects.count(), 0)
+        self.assertEqual(File.objects.count(), 1)
+
+        variants = generate_variants(exhibition.id, exhibition.image.name)
+        self.assertEqual([variant.width for variant in variants], [200, 160])
+
+        # Saving again keeps the new image's variants, without generating them again
+        scheduled = len(connection.run_on_commit)
+        exhibition.title = 'Renamed Exhibition'
+        exhibition.save()
+        self.assertEqual(len(connection.run_on_commit), scheduled)
+        self.assertEqual(ImageVariant.objects.count(), 2)
+        self.assertEqual(File.objects.count(), 2)
+
+    def test_delete_exhibition(self):
+        exhibition = self.create_exhibition(self.create_image_file())
+        generate_variants(exhibition.id, exhibition.image.name)
+        self.assertEqual(File.objects.count(), 3)
+
+        exhibition = Exhibition.objects.get(pk=exhibition.id)
+        exhibition.delete()
+        self.assertEqual(ImageVariant.objects.count(), 0)
+        self.assertEqual(File.objects.count(), 0)
+
+
 class ExhibitionModelFormTests(UserSetUp, TestCase):
     """model.ExhibitionForm tests."""
 
+    @staticmethod
+    def create_upload(name='image.jpg', mode='RGB', size=(800, 400), format='JPEG'):
+        image_data = io.BytesIO()
+        Image.new(mode, size).save(image_data, format)
+        return SimpleUploadedFile(name, image_data.getvalue())
+
+    @override_settings(EXHIBITION_IMAGE_MAX_SIZE=1000)
+    def test_image_upload(self):
+        form_data = {
+            'title': 'New exhibition',
+            'description': 'description goes here',
+        }
+
+        # Small images are stored as uploaded
+        form = ExhibitionForm(data=form_data, files={'image': self.create_upload()})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['image'].name, 'image.jpg')
+
+        # Large images are shrunk to fit
+        upload = self.create_upload(name='image.png', size=(3000, 1500), format='PNG')
+        form = ExhibitionForm(data=form_data, files={'image': upload})
+        self.assertTrue(form.is_valid())
+        image = form.cleaned_data['image']
+        self.assertEqual(image.name, 'image.jpg')
+        self.assertEqual(image.image.size, (1000, 500))
+        self.assertEqual(Image.open(image).size, (1000, 500))
+
+        form.instance.author_id = self.user.id
+        form.save()
+        exhibition = Exhibition.objects.get(id=form.instance.id)
+        self.assertEqual(Image.open(exhibition.image).size, (1000, 500))
+
+    @override_settings(EXHIBITION_IMAGE_MAX_PIXELS=10000)
+    def test_image_too_large(self):
+        form_data = {
+            'title': 'New exhibition',
+            'description': 'description goes here',
+        }
+        form = ExhibitionForm(data=form_data, files={'image': self.create_upload(size=(200, 100))})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['image'][0], 'Image is too large: it may have up to 10000 pixels.')
+
+    def test_image_invalid(self):
+        form_data = {
+            'title': 'New exhibition',
+            'description': 'description goes here',
+        }
+        upload = SimpleUploadedFile('image.png', ExhibitionImageTests.PNG_IMAGE)
+        form = ExhibitionForm(data=form_data, files={'image': upload})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
     def test_login(self):
         form_data = {
             'title': 'New exhibition',
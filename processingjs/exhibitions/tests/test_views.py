@@ -1,4 +1,10 @@
-from django.test import TestCase
+import io
+import os
+import json
+import shutil
+import zipfile
+import tempfile
+from django.test import TestCase, override_settings
 from django.test.client import Client
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
@@ -6,6 +12,9 @@ from django.utils import timezone
 from datetime import timedelta
 
 from exhibitions.models import Exhibition
+from exhibitions.archive import ExhibitionArchive
+from artwork.models import Artwork
+from submissions.models import Submission
 from django_adelaidex.lti.models import Cohort
 from django_adelaidex.util.test import UserSetUp
 
@@ -1547,3 +1556,152 @@ class ExhibitionDeleteCohortTests(ExhibitionCohortMixin, UserSetUp, TestCase):
         self.assertEquals(len(response.context['object_list']), 2)
         self.assertEquals(response.context['object_list'][0], self.exhibition_no_cohort)
         self.assertEquals(response.context['object_list'][1], self.exhibition_cohort1)
+
+
+class ExhibitionArchiveTests(UserSetUp, TestCase):
+    """Exhibition code archive view tests."""
+
+    def setUp(self):
+        super(ExhibitionArchiveTests, self).setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(EXHIBITION_ARCHIVE_DIR=self.archive_dir)
+        self.settings_override.enable()
+
+        self.exhibition = Exhibition.objects.create(
+            title='New Exhibition',
+            description='description goes here',
+            released_at=timezone.now(),
+            author=self.staff_user)
+        for i in range(3):
+            artwork = Artwork.objects.create(title='Artwork %d' % i, code='// code %d' % i, author=self.user)
+            Submission.objects.create(artwork=artwork, exhibition=self.exhibition, submitted_by=self.user)
+
+        self.build_async = ExhibitionArchive.build_async
+        self.builds = []
+        ExhibitionArchive.build_async = lambda archive: self.builds.append(archive)
+
+    def tearDown(self):
+        ExhibitionArchive.build_async = self.build_async
+        self.settings_override.disable()
+        shutil.rmtree(self.archive_dir)
+        super(ExhibitionArchiveTests, self).tearDown()
+
+    def test_students_cannot_download(self):
+        client = Client()
+        zip_url = reverse('exhibition-code-zip', kwargs={'pk': self.exhibition.id})
+        response = self.assertLogin(client, zip_url)
+        self.assertRedirects(response, reverse('exhibition-list'), status_code=302, target_status_code=200)
+        self.assertEquals(self.builds, [])
+
+    def test_staff_download(self):
+        client = Client()
+        zip_url = reverse('exhibition-code-zip', kwargs={'pk': self.exhibition.id})
+        status_url = reverse('exhibition-code-zip-status', kwargs={'pk': self.exhibition.id})
+
+        # First request starts the build
+        response = self.assertLogin(client, zip_url, user='staff')
+        self.assertEquals(response.status_code, 202)
+        self.assertEquals(json.loads(response.content)['status'], 'missing')
+        self.assertEquals(len(self.builds), 1)
+
+        self.builds[0].build()
+        response = client.get(status_url)
+        self.assertEquals(json.loads(response.content)['status'], 'ready')
+
+        # Later requests are served from the stored file
+        response = client.get(zip_url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/zip')
+        zip_file = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(zip_file.testzip())
+        self.assertEquals(len(zip_file.namelist()), 3)
+
+        submission = Submission.objects.latest('id')
+        code = zip_file.read('artwork%d.pde' % submission.id)
+        self.assertIn('// Title: %s' % submission.artwork.title, code)
+        self.assertIn(submission.artwork.code, code)
+        self.assertEquals(len(self.builds), 1)
+
+        # Changing an artwork requires a new archive, which replaces the old one
+        submission.artwork.code = '// new code'
+        submission.artwork.save()
+        response = client.get(status_url)
+        self.assertEquals(json.loads(response.content)['status'], 'missing')
+
+        ExhibitionArchive(self.exhibition).build()
+        self.assertEquals(len(os.listdir(self.archive_dir)), 1)
+        response = client.get(zip_url)
+        zip_file = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIn('// new code', zip_file.read('artwork%d.pde' % submission.id))
+
+    def test_update_dead_bytes(self):
+        archive = ExhibitionArchive(self.exhibition, base_url='http://testserver')
+        archive.build()
+        zip_file = zipfile.ZipFile(archive.path)
+        entries = sorted(zip_file.infolist(), key=lambda info: info.header_offset)
+        ends = [info.header_offset for info in entries[1:]] + [zip_file.start_dir]
+        sizes = dict((info.filename, end - info.header_offset) for (info, end) in zip(entries, ends))
+        (first, middle, last) = Submission.objects.order_by('id')
+
+        # Removing an entry leaves its bytes unused
+        middle.delete()
+        archive = ExhibitionArchive(self.exhibition)
+        archive.compact_ratio = 1
+        archive.build()
+        dead_bytes = sizes['artwork%d.pde' % middle.id]
+        self.assertEquals(json.loads(zipfile.ZipFile(archive.path).comment)['dead_bytes'], dead_bytes)
+
+        # Replacing the entry before it doesn't count them again
+        first.artwork.code = '// new code'
+        first.artwork.save()
+        archive = ExhibitionArchive(self.exhibition)
+        archive.compact_ratio = 1
+        archive.build()
+        dead_bytes += sizes['artwork%d.pde' % first.id]
+        zip_file = zipfile.ZipFile(archive.path)
+        self.assertIsNone(zip_file.testzip())
+        self.assertEquals(json.loads(zip_file.comment)['dead_bytes'], dead_bytes)
+
+    def test_update(self):
+        archive = ExhibitionArchive(self.exhibition, base_url='http://testserver')
+        archive.build()
+        zip_file = zipfile.ZipFile(archive.path)
+        offsets = dict((info.filename, info.header_offset) for info in zip_file.infolist())
+
+        # Change, remove and add submissions
+        (changed, removed, unchanged) = Submission.objects.order_by('id')
+        changed.artwork.code = '// new code'
+        changed.artwork.save()
+        removed.delete()
+        artwork = Artwork.objects.create(title='Artwork 3', code='// code 3', author=self.user)
+        added = Submission.objects.create(artwork=artwork, exhibition=self.exhibition, submitted_by=self.user)
+
+        archive = ExhibitionArchive(self.exhibition)
+        self.assertFalse(archive.exists())
+        archive.build()
+        self.assertTrue(archive.exists())
+        self.assertEquals(os.listdir(self.archive_dir), [os.path.basename(archive.path)])
+
+        # Only the new and changed entries were written
+        zip_file = zipfile.ZipFile(archive.path)
+        self.assertIsNone(zip_file.testzip())
+        filenames = ['artwork%d.pde' % submission.id for submission in (changed, unchanged, added)]
+        self.assertEquals(sorted(zip_file.namelist()), sorted(filenames))
+        unchanged_filename = 'artwork%d.pde' % unchanged.id
+        self.assertEquals(zip_file.getinfo(unchanged_filename).header_offset, offsets[unchanged_filename])
+        self.assertIn('// new code', zip_file.read('artwork%d.pde' % changed.id))
+        self.assertIn('// code 3', zip_file.read('artwork%d.pde' % added.id))
+
+        # The replaced entries are unused until compacted
+        state = json.loads(zip_file.comment)
+        self.assertEquals(state['base_url'], 'http://testserver')
+        self.assertTrue(state['dead_bytes'] > 0)
+
+        unchanged.delete()
+        archive = ExhibitionArchive(self.exhibition)
+        archive.compact_ratio = 0
+        archive.build()
+        zip_file = zipfile.ZipFile(archive.path)
+        self.assertEquals(len(zip_file.namelist()), 2)
+        self.assertEquals(json.loads(zip_file.comment)['dead_bytes'], 0)
+
@@ -1,13 +1,16 @@
 import os
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.http import FileResponse, JsonResponse
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.utils.decorators import method_decorator
 from csp.decorators import csp_update
 
 from django_adelaidex.util.mixins import TemplatePathMixin, LoggedInMixin, ObjectHasPermMixin, ModelHasPermMixin
+from django_adelaidex.util.context_processors import base_url
 from gallery.views import ShareView
 from exhibitions.models import Exhibition, ExhibitionForm
+from exhibitions.archive import ExhibitionArchive
 
 from submissions.views import ListSubmissionView
 
@@ -60,7 +63,7 @@ class ListExhibitionView(ExhibitionView, ListView):
             pk_list = pk_list.split(self.kwargs['separator'])
             qs = qs.filter(pk__in=pk_list)
 
-        return qs.order_by('-released_at', 'created_at')
+        return qs.order_by('-released_at', 'created_at').prefetch_related('image_variants')
 
 
 class ShowExhibitionView(ObjectHasPermMixin, ExhibitionView, DetailView):
@@ -127,3 +130,53 @@ class DeleteExhibitionView(LoggedInMixin, ModelHasPermMixin, ExhibitionView, Del
 
     def get_success_url(self):
         return self.get_error_url()
+
+
+class ExhibitionArchiveStatusView(LoggedInMixin, ModelHasPermMixin, ExhibitionView, DetailView):
+    '''Reports whether the exhibition's code archive is ready to download.'''
+
+    user_perm = 'can_save'
+    status_code = 200
+
+    def get_queryset(self):
+        qs = super(ExhibitionArchiveStatusView, self).get_queryset()
+        return self.get_model().can_see_queryset(qs, self.request.user)
+
+    def get_archive(self):
+        return ExhibitionArchive(
+            self.object,
+            base_url=base_url(self.request).get('BASE_URL', ''))
+
+    def get_status(self, archive):
+        return {
+            'status': archive.get_status(),
+            'url': reverse('exhibition-code-zip', kwargs={'pk': self.object.id}),
+            'status_url': reverse('exhibition-code-zip-status', kwargs={'pk': self.object.id}),
+        }
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return JsonResponse(self.get_status(self.get_archive()), status=self.status_code)
+
+
+class ExhibitionArchiveView(ExhibitionArchiveStatusView):
+    '''Downloads the code for all of the exhibition's submissions.
+
+       If the archive is not ready, starts building it and returns its status.
+    '''
+    status_code = 202
+    zip_filename = 'exhibition%d.zip'
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        archive = self.get_archive()
+        if archive.exists():
+            response = FileResponse(open(archive.path, 'rb'), content_type='application/zip')
+            response['Content-Length'] = os.path.getsize(archive.path)
+            response['Content-Disposition'] = 'attachment; filename="%s"' % (
+                self.zip_filename % self.object.id)
+            return response
+
+        if not archive.is_building():
+            archive.build_async()
+        return JsonResponse(self.get_status(archive), status=self.status_code)
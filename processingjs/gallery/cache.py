@@ -0,0 +1,186 @@
+"SQLite cache backend, shared by all processes on a single host."
+import os
+import time
+import sqlite3
+import itertools
+import threading
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+try:
+    from django.utils.six.moves import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class SQLiteCache(BaseCache):
+    '''Cache stored in a local SQLite file.
+
+       Unlike the locmem cache, entries are shared by all the wsgi daemon
+       processes, so a value cached (or invalidated) by one process is seen by
+       the others.  Writes take SQLite's write lock, which makes incr() atomic
+       across processes.
+
+       Entries can also be tagged on set(), and all entries with a given tag
+       removed using invalidate_tag().
+    '''
+
+    # Remove expired and excess entries after this many sets, per process
+    cull_interval = 100
+
+    def __init__(self, location, params):
+        super(SQLiteCache, self).__init__(params)
+        self._location = location
+        self._local = threading.local()
+        self._set_count = itertools.count(1)
+
+    def _connection(self):
+        # Connections can't be shared between threads, or forked processes
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self._location, timeout=30, isolation_level=None)
+            connection.text_factory = str
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_tag '
+                '(tag TEXT, key TEXT, PRIMARY KEY (tag, key))')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_tag_key ON cache_tag (key)')
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    @contextmanager
+    def _write(self):
+        '''Runs the enclosed statements in a transaction holding the write lock.'''
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+
+    def _key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _expired(expires, now=None):
+        return (expires is not None) and (expires <= (now or time.time()))
+
+    def _get(self, connection, key):
+        row = connection.execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or self._expired(row[1]):
+            return (False, None)
+        return (True, pickle.loads(str(row[0])))
+
+    def _set(self, connection, key, value, timeout, tags=None):
+        expires = self.get_backend_timeout(timeout)
+        connection.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), expires))
+        connection.execute('DELETE FROM cache_tag WHERE key = ?', (key,))
+        if tags:
+            connection.executemany('INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)',
+                [(tag, key) for tag in tags])
+
+    def _delete(self, connection, key):
+        connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        connection.execute('DELETE FROM cache_tag WHERE key = ?', (key,))
+
+    def _cull(self, connection):
+        now = time.time()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            if self._cull_frequency == 0:
+                connection.execute('DELETE FROM cache')
+            else:
+                # Remove the entries closest to expiry
+                connection.execute('DELETE FROM cache WHERE key IN '
+                    '(SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                    (count // self._cull_frequency,))
+        connection.execute('DELETE FROM cache_tag WHERE key NOT IN (SELECT key FROM cache)')
+
+    def get(self, key, default=None, version=None):
+        (found, value) = self._get(self._connection(), self._key(key, version))
+        return value if found else default
+
+    def get_many(self, keys, version=None):
+        connection = self._connection()
+        values = {}
+        for key in keys:
+            (found, value) = self._get(connection, self._key(key, version))
+            if found:
+                values[key] = value
+        return values
+
+    def has_key(self, key, version=None):
+        return self._get(self._connection(), self._key(key, version))[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, tags=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            self._set(connection, key, value, timeout, tags)
+            if next(self._set_count) % self.cull_interval == 0:
+                self._cull(connection)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, tags=None):
+        with self._write() as connection:
+            for (key, value) in data.items():
+                self._set(connection, self._key(key, version), value, timeout, tags)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, tags=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            if self._get(connection, key)[0]:
+                return False
+            self._set(connection, key, value, timeout, tags)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        '''Atomically increments the stored value, across all processes.'''
+        key = self._key(key, version)
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None or self._expired(row[1]):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(str(row[0])) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?',
+                (sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)), key))
+        return value
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            self._delete(connection, key)
+
+    def delete_many(self, keys, version=None):
+        with self._write() as connection:
+            for key in keys:
+                self._delete(connection, self._key(key, version))
+
+    def invalidate_tag(self, *tags):
+        '''Deletes all the entries set with any of the given tags.'''
+        with self._write() as connection:
+            for tag in tags:
+                connection.execute('DELETE FROM cache WHERE key IN '
+                    '(SELECT key FROM cache_tag WHERE tag = ?)', (tag,))
+                connection.execute('DELETE FROM cache_tag WHERE tag = ?', (tag,))
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+            connection.execute('DELETE FROM cache_tag')
+
+    def close(self, **kwargs):
+        # Connections are kept open for the life of the thread
+        pass
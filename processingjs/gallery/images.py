@@ -0,0 +1,145 @@
+import os
+import sys
+import tempfile
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+from PIL import Image
+
+
+JPEG_QUALITY = 85
+
+
+def has_transparency(image):
+    return (image.mode in ('RGBA', 'LA') or
+            (image.mode == 'P' and 'transparency' in image.info))
+
+
+def encode(image, out):
+    '''Saves the image to out, as PNG if it has transparency, otherwise as JPEG.
+       Returns the file extension used.
+    '''
+    if has_transparency(image):
+        image.convert('RGBA').save(out, 'PNG', optimize=True)
+        return 'png'
+    image.convert('RGB').save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return 'jpg'
+
+
+class UploadedImageField(forms.ImageField):
+    '''ImageField which validates uploads without decoding the whole image.
+
+       The format and dimensions are checked from the image header, so images
+       with too many pixels are rejected before they're decoded.  Images
+       wider or taller than max_size are re-encoded to fit, into a temporary
+       file which is only held in memory while small, and the re-encoded file
+       is returned in place of the upload.  JPEGs are decoded at the smallest
+       scale that fits; PNGs and GIFs can only be decoded in full, which
+       max_pixels bounds.
+    '''
+    formats = ('JPEG', 'PNG', 'GIF')
+
+    default_error_messages = {
+        'too_many_pixels': _('Image is too large: it may have up to %(max_pixels)s pixels.'),
+    }
+
+    def __init__(self, max_size=None, max_pixels=None, **kwargs):
+        self.max_size = max_size
+        self.max_pixels = max_pixels
+        super(UploadedImageField, self).__init__(**kwargs)
+
+    def get_max_size(self):
+        return self.max_size or settings.EXHIBITION_IMAGE_MAX_SIZE
+
+    def get_max_pixels(self):
+        return self.max_pixels or settings.EXHIBITION_IMAGE_MAX_PIXELS
+
+    def to_python(self, data):
+        # Skip ImageField.to_python, which reads in-memory uploads into another buffer
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+
+        # Temporary file uploads are opened by path, so closing the image closes
+        # its file; in-memory uploads are read in place, and left open.
+        if hasattr(data, 'temporary_file_path'):
+            source = data.temporary_file_path()
+        else:
+            source = data
+            data.seek(0)
+
+        try:
+            # Only reads the image header
+            image = Image.open(source)
+            if image.format not in self.formats:
+                raise ValueError('Unsupported image format %s' % image.format)
+        except Exception:
+            six.reraise(ValidationError, ValidationError(
+                self.error_messages['invalid_image'],
+                code='invalid_image',
+            ), sys.exc_info()[2])
+
+        try:
+            f = self.check(image, f)
+        finally:
+            if source is not data:
+                image.close()
+
+        if hasattr(f, 'seek') and callable(f.seek):
+            f.seek(0)
+        return f
+
+    def check(self, image, f):
+        '''Returns the upload f, with its verified image, or an UploadedFile
+           containing the image re-encoded to fit max_size.'''
+        (width, height) = image.size
+        if width * height > self.get_max_pixels():
+            raise ValidationError(
+                self.error_messages['too_many_pixels'],
+                code='too_many_pixels',
+                params={'max_pixels': self.get_max_pixels()},
+            )
+
+        try:
+            if max(width, height) > self.get_max_size():
+                return self.reencode(image, f.name)
+            image.verify()
+            f.content_type = Image.MIME.get(image.format)
+            f.image = image
+            return f
+        except Exception:
+            six.reraise(ValidationError, ValidationError(
+                self.error_messages['invalid_image'],
+                code='invalid_image',
+            ), sys.exc_info()[2])
+
+    def reencode(self, image, name):
+        '''Returns an UploadedFile containing the image, shrunk to fit max_size,
+           with the shrunk image as its image.'''
+        max_size = self.get_max_size()
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_size, max_size))
+        mode = 'RGBA' if has_transparency(image) else 'RGB'
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        # Resizes into a new image, so RGB and RGBA images aren't copied at full size
+        scale = float(max_size) / max(image.size)
+        image = image.resize(tuple(max(1, int(round(side * scale))) for side in image.size),
+                             Image.ANTIALIAS)
+
+        out = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        extension = encode(image, out)
+        size = out.tell()
+        out.seek(0)
+        f = UploadedFile(
+            file=out,
+            name='%s.%s' % (os.path.splitext(os.path.basename(name))[0], extension),
+            content_type='image/png' if extension == 'png' else 'image/jpeg',
+            size=size,
+        )
+        f.image = image
+        return f
@@ -0,0 +1,120 @@
+import os
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, When, Value, F, CharField
+
+from database_files.models import File
+from database_files.storage import DatabaseStorage
+from gallery.models import MediaAlias
+from gallery.storage import HashedFileSystemStorage
+from artwork.models import Artwork
+from exhibitions.models import Exhibition, ImageVariant
+
+
+class Command(BaseCommand):
+    help = ('Moves uploaded files from the database to HashedFileSystemStorage, '
+            'and renames them wherever they are used.  The previous names '
+            'redirect to the new ones.')
+
+    # (model, field) naming the uploaded files
+    fields = (
+        (Exhibition, 'image'),
+        (ImageVariant, 'image'),
+        (ImageVariant, 'source'),
+        (Artwork, 'preview'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+            help='Number of files to rename per update query')
+        parser.add_argument('--keep', action='store_true', default=False,
+            help='Keep the moved files in the database')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, HashedFileSystemStorage):
+            raise CommandError('Set [MEDIA] STORAGE=gallery.storage.HashedFileSystemStorage '
+                               'before moving files from the database')
+        self.verbosity = int(options['verbosity'])
+
+        source = DatabaseStorage()
+        names = self.get_names()
+        renamed = {}
+        for name in sorted(names):
+            moved = self.move(source, default_storage, name)
+            if moved:
+                renamed[name] = moved
+            elif self.verbosity > 1:
+                self.stderr.write('%s not found in the database' % name)
+
+        with transaction.atomic():
+            self.rename(renamed, options['batch_size'])
+            existing = set(MediaAlias.objects.filter(
+                name__in=renamed.keys()).values_list('name', flat=True))
+            MediaAlias.objects.bulk_create([
+                MediaAlias(name=name, target=target)
+                for (name, target) in renamed.items() if name not in existing
+            ], batch_size=options['batch_size'])
+
+        if not options['keep']:
+            self.delete(renamed.keys(), options['batch_size'])
+
+        sizes = [default_storage.size(name) for name in set(renamed.values())]
+        contents = set(default_storage.digest(name) for name in renamed.values())
+        self.stdout.write('Moved %d files, %d bytes, stored as %d distinct files' % (
+            len(renamed), sum(sizes), len(contents)))
+
+    def get_names(self):
+        '''Returns the names of the files used by the models, still stored in the database.'''
+        names = set()
+        for (model, field) in self.fields:
+            values = model.objects.exclude(**{field: ''}).exclude(
+                **{'%s__isnull' % field: True}).values_list(field, flat=True).distinct()
+            names.update(name for name in values if not default_storage.exists(name))
+        return names
+
+    def move(self, source, target, name):
+        '''Saves the named file to the target storage, returning its new name.
+
+           Returns None if the file isn't in the source storage.
+        '''
+        try:
+            content = source.open(name)
+        except ValueError:
+            # Not named by DatabaseStorage
+            content = None
+        if content is None:
+            return None
+        try:
+            new_name = target.save(name, content)
+        finally:
+            content.close()
+        if self.verbosity > 1:
+            self.stdout.write('%s -> %s' % (name, new_name))
+        return new_name
+
+    def rename(self, renamed, batch_size):
+        '''Updates the fields using each renamed file, a batch of files per query.'''
+        names = sorted(renamed)
+        for (model, field) in self.fields:
+            for start in range(0, len(names), batch_size):
+                batch = names[start:start + batch_size]
+                model.objects.filter(**{'%s__in' % field: batch}).update(**{
+                    field: Case(
+                        *[When(then=Value(renamed[name]), **{field: name}) for name in batch],
+                        default=F(field),
+                        output_field=CharField()
+                    )
+                })
+
+    def delete(self, names, batch_size):
+        '''Deletes the moved files from the database.'''
+        # DatabaseStorage names files by their database id
+        ids = []
+        for name in names:
+            try:
+                ids.append(int(os.path.splitext(os.path.basename(name))[0]))
+            except ValueError:
+                pass
+        for start in range(0, len(ids), batch_size):
+            File.objects.filter(id__in=ids[start:start + batch_size]).delete()
@@ -0,0 +1,122 @@
+import time
+import urllib2
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth import get_user_model, SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+
+from django_adelaidex.lti.models import Cohort
+from exhibitions.models import Exhibition
+
+
+class Command(BaseCommand):
+    help = ('Warms the caches of the running wsgi daemons, by requesting the most visited '
+            'pages for anonymous visitors, and for each cohort, logged in as one of its members.')
+
+    # Time of the last warm-up, shared by all hosts using the cache
+    last_run_key = 'gallery.warm_cache.last_run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+            help='Base URL of the running app, e.g. https://host/think.create.code/processingjs')
+        parser.add_argument('--repeat', type=int, default=1,
+            help='Number of times to request each page.  Any wsgi daemon process may serve '
+                 'each request, so repeating them makes it likelier that all are warmed.')
+        parser.add_argument('--on-release', action='store_true', default=False,
+            help='Only warm up if an exhibition has been released since the last run. '
+                 'Intended to be run every minute from cron.')
+
+    def handle(self, *args, **options):
+        if not options['url']:
+            raise CommandError("--url is required")
+        if options['on_release'] and isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise CommandError("--on-release needs a cache which outlasts each run, "
+                               "such as gallery.cache.SQLiteCache")
+        now = timezone.now()
+        if options['on_release'] and not self.released_since_last_run(now):
+            return
+        cache.set(self.last_run_key, now, None)
+
+        self.verbosity = int(options['verbosity'])
+        self.url = options['url'].rstrip('/')
+
+        start = time.time()
+        count = 0
+        for (cohort, session) in self.get_sessions():
+            try:
+                for path in self.get_paths(cohort):
+                    for i in range(options['repeat']):
+                        self.fetch(path, session)
+                        count += 1
+            finally:
+                if session:
+                    session.delete()
+        self.stdout.write('Warmed %d pages in %.2fs' % (count, time.time() - start))
+
+    def released_since_last_run(self, now):
+        last_run = cache.get(self.last_run_key)
+        if last_run is None:
+            return True
+        return Exhibition.objects.filter(released_at__gt=last_run, released_at__lte=now).exists()
+
+    def get_sessions(self):
+        '''Yields (cohort, session) for anonymous visitors, with no session, then
+           for each cohort with a member, logged in as that member.'''
+        yield (None, None)
+
+        User = get_user_model()
+        for cohort in Cohort.objects.all():
+            # Staff and superusers see every cohort's exhibitions
+            user = User.objects.filter(cohort=cohort, is_active=True,
+                                       is_staff=False, is_superuser=False).first()
+            if user is None:
+                continue
+            yield (cohort, self.login(user))
+
+    def login(self, user):
+        '''Returns a new session logged in as the user, as login() would, but
+           without recording a login.'''
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session
+
+    def get_paths(self, cohort):
+        '''Returns the paths of the pages to request for the cohort.'''
+        paths = [
+            reverse('home'),
+            reverse('artwork-shared-score'),
+            reverse('exhibition-list'),
+        ]
+
+        exhibition_ids = Exhibition.visible_ids(cohort)
+        for exhibition in Exhibition.objects.filter(
+                id__in=exhibition_ids).order_by('-released_at', 'created_at'):
+            paths.append(reverse('exhibition-view', kwargs={'pk': exhibition.id}))
+            paths.append(reverse('exhibition-view-score', kwargs={'pk': exhibition.id}))
+
+        return paths
+
+    def fetch(self, path, session):
+        url = '%s%s' % (self.url, path)
+        request = urllib2.Request(url)
+        if session:
+            request.add_header('Cookie', '%s=%s' % (settings.SESSION_COOKIE_NAME, session.session_key))
+        try:
+            response = urllib2.urlopen(request, timeout=60)
+            status = response.getcode()
+            response.read()
+        except urllib2.HTTPError as e:
+            status = e.code
+        except urllib2.URLError as e:
+            status = e.reason
+
+        if self.verbosity > 1:
+            self.stdout.write('%s %s' % (status, url))
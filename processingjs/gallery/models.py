@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class MediaAlias(models.Model):
+    '''Previous name of an uploaded file, whose URL redirects to the file's current name.'''
+    class Meta:
+        db_table = 'media_aliases'
+
+    name = models.CharField(max_length=255, unique=True)
+    target = models.CharField(max_length=255)
+
+    def __unicode__(self):
+        return self.name
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
@@ -40,6 +40,21 @@ DATABASES = {
     'default': dict(env_config.items('DATABASE'))
 }
 STATIC_URL = env_config.get('GENERAL', 'STATIC_URL')
+
+# Shared by the wsgi daemon processes
+CACHES = {
+    'default': {
+        'BACKEND': env_config.get('CACHE', 'BACKEND'),
+        'LOCATION': os.path.join(BASE_DIR, env_config.get('CACHE', 'LOCATION')),
+        'TIMEOUT': env_config.getint('CACHE', 'TIMEOUT'),
+        'OPTIONS': {
+            'MAX_ENTRIES': env_config.getint('CACHE', 'MAX_ENTRIES'),
+        },
+    }
+}
+if ENVIRONMENT == 'testing':
+    # Don't keep cached pages between test runs
+    CACHES['default']['BACKEND'] = 'django.core.cache.backends.locmem.LocMemCache'
 ALLOWED_HOSTS = env_config.get('GENERAL', 'ALLOWED_HOSTS').split()
 
 SHARE_URL = env_config.get('GALLERY', 'SHARE_URL')
@@ -47,6 +62,16 @@ ALLOW_ANALYTICS = env_config.getboolean('GALLERY', 'ALLOW_ANALYTICS')
 
 ARTWORK_CSP_SCRIPT_SRC = env_config.get('ARTWORK', 'CSP_SCRIPT_SRC').split()
 ARTWORK_CSP_STYLE_SRC = env_config.get('ARTWORK', 'CSP_STYLE_SRC').split()
+ARTWORK_CODE_STORE = env_config.getboolean('ARTWORK', 'CODE_STORE')
+ARTWORK_PREVIEW_SIZE = env_config.getint('ARTWORK', 'PREVIEW_SIZE')
+ARTWORK_PREVIEW_MAX_BYTES = env_config.getint('ARTWORK', 'PREVIEW_MAX_BYTES')
+
+EXHIBITION_ARCHIVE_DIR = os.path.join(BASE_DIR, env_config.get('EXHIBITIONS', 'ARCHIVE_DIR'))
+EXHIBITION_ARCHIVE_UPDATE = env_config.getboolean('EXHIBITIONS', 'ARCHIVE_UPDATE')
+EXHIBITION_IMAGE_WIDTHS = [int(width) for width in env_config.get('EXHIBITIONS', 'IMAGE_WIDTHS').split()]
+EXHIBITION_IMAGE_THREADS = env_config.getint('EXHIBITIONS', 'IMAGE_THREADS')
+EXHIBITION_IMAGE_MAX_SIZE = env_config.getint('EXHIBITIONS', 'IMAGE_MAX_SIZE')
+EXHIBITION_IMAGE_MAX_PIXELS = env_config.getint('EXHIBITIONS', 'IMAGE_MAX_PIXELS')
 
 # LTI settings
 ADELAIDEX_LTI = dict(env_config.items('ADELAIDEX_LTI'))
@@ -100,7 +125,11 @@ WSGI_APPLICATION = 'gallery.wsgi.application'
 
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
-DEFAULT_FILE_STORAGE = 'database_files.storage.DatabaseStorage'
+DEFAULT_FILE_STORAGE = env_config.get('MEDIA', 'STORAGE')
+# Write uploads larger than 256KB to temporary files, rather than holding them in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 262144
+MEDIA_CACHE_DIR = os.path.join(BASE_DIR, env_config.get('MEDIA', 'CACHE_DIR'))
+MEDIA_ROOT = os.path.join(BASE_DIR, env_config.get('MEDIA', 'ROOT'))
 
 
 # Internationalization
@@ -127,9 +156,10 @@ STATICFILES_DIRS = (
     os.path.join( BASE_DIR, 'static' ),
 )
 
-# Note: used only during testing.
-# In production, we simply serve the static dir as-is.
-STATIC_ROOT = os.path.join( BASE_DIR, 'static', 'test' )
+# Static files are collected here by ./manage.py collectstatic,
+# and served from here by httpd in production.
+STATIC_ROOT = os.path.join(BASE_DIR, env_config.get('GENERAL', 'STATIC_ROOT'))
+STATICFILES_STORAGE = env_config.get('GENERAL', 'STATIC_STORAGE')
 
 TEMPLATES = [
     {
@@ -0,0 +1,259 @@
+"Storage backends for uploaded media."
+import os
+import re
+import gzip
+import errno
+import shutil
+import hashlib
+import tempfile
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core import files
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
+
+from database_files.storage import DatabaseStorage
+
+
+# Names of the files saved by DatabaseStorage: <pk><ext>
+database_name_re = re.compile(r'^\d+(\.\w+)?$')
+
+
+class CachedDatabaseStorage(DatabaseStorage):
+    '''DatabaseStorage, with a read-through cache of the stored files on local disk.
+
+       Each file is cached as <cache_dir>/<name>/<sha1><ext>, so the content
+       hash is known without reading the database.  The cached copy is
+       removed when the file is deleted through the storage.
+    '''
+
+    def __init__(self, cache_dir=None):
+        super(CachedDatabaseStorage, self).__init__()
+        self._cache_dir = cache_dir
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir or settings.MEDIA_CACHE_DIR
+
+    def _cache_path(self, name):
+        '''Returns the named file's cache directory, or None if the name isn't
+           one DatabaseStorage saves.'''
+        name = os.path.basename(name)
+        if not database_name_re.match(name):
+            return None
+        return os.path.join(self.cache_dir, name)
+
+    def cached(self, name):
+        '''Returns the (path, sha1 digest) of the cached copy of the named file,
+           reading it from the database if it isn't cached yet.
+
+           Returns None if the file doesn't exist.
+        '''
+        directory = self._cache_path(name)
+        if directory is None:
+            return None
+        try:
+            for filename in os.listdir(directory):
+                if not filename.endswith('.tmp'):
+                    return (os.path.join(directory, filename), os.path.splitext(filename)[0])
+        except OSError:
+            pass
+
+        stored = super(CachedDatabaseStorage, self)._open(name)
+        if stored is None:
+            return None
+        content = stored.read()
+        digest = hashlib.sha1(content).hexdigest()
+        path = os.path.join(directory, digest + os.path.splitext(name)[1])
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file, so readers never see a partial file
+        (fd, tmp_path) = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+        return (path, digest)
+
+    def local_file(self, name):
+        return self.cached(name)
+
+    def evict(self, name):
+        '''Removes the cached copy of the named file, if any.'''
+        directory = self._cache_path(name)
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _open(self, name, mode='rb'):
+        cached = self.cached(name)
+        if cached is None:
+            return None
+        return files.File(open(cached[0], mode), name=name)
+
+    def delete(self, name):
+        super(CachedDatabaseStorage, self).delete(name)
+        self.evict(name)
+
+    def size(self, name):
+        cached = self.cached(name)
+        if cached is None:
+            return 0
+        return os.path.getsize(cached[0])
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    '''Stores files on local disk, named by the sha1 of their content.
+
+       Each distinct content is stored once, as .objects/<ab>/<cd>/<sha1>, and
+       every file saved with that content is a hard link to it, named
+       <ab>/<cd>/<sha1><ext>, or <sha1>_<random><ext> if that name is taken.
+       So identical uploads share disk space, but can be deleted separately;
+       the content is removed along with its last file.
+    '''
+    objects_dir = '.objects'
+    digest_re = re.compile(r'^([0-9a-f]{40})')
+
+    def digest(self, name):
+        '''Returns the sha1 of the named file's content, from its name.'''
+        match = self.digest_re.match(os.path.basename(name))
+        return match.group(1) if match else None
+
+    def hashed_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return '%s/%s/%s%s' % (digest[:2], digest[2:4], digest, extension)
+
+    def object_path(self, digest):
+        return self.path(os.path.join(self.objects_dir, digest[:2], digest[2:4], digest))
+
+    def _makedirs(self, directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _store_object(self, content):
+        '''Stores the content, unless it's already stored.
+
+           Returns the content's sha1 digest.
+        '''
+        directory = self.path(self.objects_dir)
+        self._makedirs(directory)
+        (fd, tmp_path) = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            sha1 = hashlib.sha1()
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in content.chunks():
+                    sha1.update(chunk)
+                    tmp_file.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+
+            digest = sha1.hexdigest()
+            object_path = self.object_path(digest)
+            self._makedirs(os.path.dirname(object_path))
+            try:
+                # Unlike rename, never replaces content already linked to
+                os.link(tmp_path, object_path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        finally:
+            os.remove(tmp_path)
+        return digest
+
+    def _save(self, name, content):
+        '''Links the given name to the content, which is stored first if needed.
+
+           The name is replaced by the content's hashed name.
+        '''
+        while True:
+            digest = self._store_object(content)
+            name = self.get_available_name(self.hashed_name(digest, name))
+            path = self.path(name)
+            self._makedirs(os.path.dirname(path))
+            try:
+                os.link(self.object_path(digest), path)
+                return name.replace('\\', '/')
+            except OSError as e:
+                # Retry if the name was taken, or the content deleted, meanwhile
+                if e.errno not in (errno.EEXIST, errno.ENOENT):
+                    raise
+
+    def local_file(self, name):
+        '''Returns the (path, sha1 digest) of the named file, or None if it doesn't exist.'''
+        digest = self.digest(name)
+        if not digest or not self.exists(name):
+            return None
+        return (self.path(name), digest)
+
+    def delete(self, name):
+        super(HashedFileSystemStorage, self).delete(name)
+
+        # Remove the content once no other file links to it
+        digest = self.digest(name)
+        if digest:
+            object_path = self.object_path(digest)
+            try:
+                if os.stat(object_path).st_nlink <= 1:
+                    os.remove(object_path)
+            except OSError:
+                pass
+
+    def url(self, name):
+        return reverse('database_file', kwargs={'name': name})
+
+
+class GzipManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''ManifestStaticFilesStorage which also writes a gzipped copy of each
+       collected text file, as <name>.gz, for the web server to send to
+       browsers which accept it.
+
+       Copies are made of both the original and the fingerprinted names, and
+       only kept if they're smaller.
+    '''
+    gzip_extensions = ('.css', '.js', '.html', '.txt', '.svg', '.eot', '.ttf', '.json', '.map')
+
+    def post_process(self, paths, dry_run=False, **options):
+        compress = []
+        for (name, hashed_name, processed) in super(GzipManifestStaticFilesStorage, self).post_process(
+                paths, dry_run, **options):
+            yield (name, hashed_name, processed)
+            if hashed_name and not isinstance(processed, Exception):
+                compress.extend([name, hashed_name])
+
+        if not dry_run:
+            for name in compress:
+                if self.gzip(name):
+                    yield (name, '%s.gz' % name, True)
+
+    def gzip(self, name):
+        '''Writes the gzipped copy of the named file, if it's worth keeping.'''
+        path = self.path(name)
+        if os.path.splitext(name)[1].lower() not in self.gzip_extensions:
+            return False
+
+        with open(path, 'rb') as original:
+            content = original.read()
+        (fd, tmp_path) = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                # mtime=0, so unchanged files are rebuilt identically
+                with gzip.GzipFile(filename='', mode='wb', fileobj=tmp_file,
+                                   compresslevel=9, mtime=0) as gzip_file:
+                    gzip_file.write(content)
+            if os.path.getsize(tmp_path) >= len(content):
+                os.remove(tmp_path)
+                if os.path.exists(path + '.gz'):
+                    os.remove(path + '.gz')
+                return False
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.rename(tmp_path, path + '.gz')
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
@@ -0,0 +1,122 @@
+import zipfile
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+def chunked_iterator(queryset, chunk_size=100):
+    '''Iterates over the queryset in pk order, fetching chunk_size objects at a time.
+
+       Each chunk starts after the last pk of the one before, rather than at an
+       offset, so each query costs the same, and no objects are skipped or
+       repeated if others are added or deleted meanwhile.
+    '''
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        for obj in chunk:
+            yield obj
+        if len(chunk) < chunk_size:
+            break
+        last_pk = chunk[-1].pk
+
+
+def zip_info(filename, date_time=None, compress_type=zipfile.ZIP_DEFLATED, comment=''):
+    '''Returns the ZipInfo for a regular file entry, modified at the given (or current) time.'''
+    if date_time is None:
+        date_time = timezone.localtime(timezone.now())
+    info = zipfile.ZipInfo(filename, date_time.timetuple()[:6])
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    info.comment = comment
+    return info
+
+
+class _ZipBuffer(object):
+    '''Write-only file object, which holds the bytes written since the last drain().'''
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ZipStream(object):
+    '''Builds a zip file incrementally, returning its bytes as each entry is added.'''
+
+    def __init__(self, compression=zipfile.ZIP_DEFLATED):
+        self.buffer = _ZipBuffer()
+        self.zip_file = zipfile.ZipFile(self.buffer, 'w', compression)
+
+    def add(self, filename, data, date_time=None, comment=''):
+        '''Adds a file entry, and returns the zip data to send.'''
+        info = zip_info(filename, date_time, self.zip_file.compression, comment)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.zip_file.writestr(info, data)
+        return self.buffer.drain()
+
+    def close(self, comment=''):
+        '''Writes the zip directory, and returns the remaining zip data to send.'''
+        if comment:
+            self.zip_file.comment = comment
+        self.zip_file.close()
+        return self.buffer.drain()
+
+
+class StreamingZipFileViewMixin(object):
+    '''Streams a zip file containing each object in a list view's current page,
+       or in its whole queryset if the 'all' query parameter is given.
+
+       Each entry is rendered by serializer_class, and sent to the client as
+       soon as it is ready, so memory use doesn't grow with the number of objects.
+    '''
+    serializer_class = None
+    object_filename = 'object%d.txt'
+    zip_filename = 'download.zip'
+    chunk_size = 100
+
+    def get_object_filename(self, obj):
+        return self.object_filename % obj.id
+
+    def get_serializer(self):
+        return self.serializer_class.for_request(self.request)
+
+    def get_zip_objects(self):
+        queryset = self.get_queryset()
+        page_size = self.get_paginate_by(queryset)
+        if page_size and not 'all' in self.request.GET:
+            (paginator, page, queryset, is_paginated) = self.paginate_queryset(queryset, page_size)
+            return iter(queryset)
+        return chunked_iterator(queryset, self.chunk_size)
+
+    def stream_zip(self, objects):
+        serializer = self.get_serializer()
+        zip_stream = ZipStream()
+        for obj in objects:
+            yield zip_stream.add(self.get_object_filename(obj), serializer.serialize(obj))
+        yield zip_stream.close()
+
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            self.stream_zip(self.get_zip_objects()),
+            content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="%s"' % self.zip_filename
+        return response
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from django.test import SimpleTestCase
+
+from gallery.cache import SQLiteCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    '''SQLiteCache backend tests'''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp_dir, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 10}})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('key', {'value': [1, 2, 3]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2, 3]})
+        self.assertTrue(self.cache.has_key('key'))
+
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('other', 'value'))
+        self.assertEqual(self.cache.get_many(['key', 'other', 'missing']),
+            {'key': {'value': [1, 2, 3]}, 'other': 'value'})
+
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('other'))
+
+    def test_expiry(self):
+        self.cache.set('key', 'value', 1)
+        self.cache.set('forever', 'value', None)
+        self.assertEqual(self.cache.get('key'), 'value')
+        time.sleep(1.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('forever'), 'value')
+
+    def test_shared(self):
+        # Separate backend instances share the same entries
+        self.cache.set('key', 'value')
+        other = SQLiteCache(self.location, {})
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_incr(self):
+        self.assertRaises(ValueError, self.cache.incr, 'counter')
+        self.cache.set('counter', 0)
+
+        def increment():
+            cache = SQLiteCache(self.location, {})
+            for i in range(50):
+                cache.incr('counter')
+        threads = [threading.Thread(target=increment) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.cache.decr('counter', 10), 190)
+
+    def test_versions(self):
+        self.cache.set('key', 'v1', version=1)
+        self.cache.set('key', 'v2', version=2)
+        self.assertEqual(self.cache.get('key', version=1), 'v1')
+        self.assertEqual(self.cache.get('key', version=2), 'v2')
+
+        self.cache.incr_version('key', version=2)
+        self.assertIsNone(self.cache.get('key', version=2))
+        self.assertEqual(self.cache.get('key', version=3), 'v2')
+
+    def test_tags(self):
+        self.cache.set('a', 1, tags=['exhibitions'])
+        self.cache.set('b', 2, tags=['exhibitions', 'cohort1'])
+        self.cache.set('c', 3, tags=['cohort1'])
+        self.cache.set('d', 4)
+
+        self.cache.invalidate_tag('exhibitions')
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'd']), {'c': 3, 'd': 4})
+
+        # Re-setting a key without tags removes its old tags
+        self.cache.set('c', 3)
+        self.cache.invalidate_tag('cohort1')
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_cull(self):
+        # Exceeding MAX_ENTRIES culls a third of the entries, like the db cache
+        keys = ['key%d' % i for i in range(SQLiteCache.cull_interval)]
+        for (i, key) in enumerate(keys):
+            self.cache.set(key, i)
+        self.assertEqual(len(self.cache.get_many(keys)),
+            SQLiteCache.cull_interval - SQLiteCache.cull_interval // 3)
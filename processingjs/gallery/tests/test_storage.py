@@ -0,0 +1,199 @@
+import os
+import gzip
+import shutil
+import tempfile
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from django_adelaidex.util.test import UserSetUp
+from database_files.models import File
+from database_files.storage import DatabaseStorage
+from gallery.storage import HashedFileSystemStorage
+from artwork.models import Artwork
+from exhibitions.models import Exhibition, ImageVariant
+
+
+class HashedFileSystemStorageTests(TestCase):
+
+    def setUp(self):
+        super(HashedFileSystemStorageTests, self).setUp()
+        self.location = tempfile.mkdtemp()
+        self.storage = HashedFileSystemStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        super(HashedFileSystemStorageTests, self).tearDown()
+
+    def test_save(self):
+        name = self.storage.save('images/Image.PNG', ContentFile('0123456789'))
+        digest = '87acec17cd9dcd20a716cc2cf67417b71c8a7016'
+        self.assertEquals(name, '87/ac/%s.png' % digest)
+        self.assertEquals(self.storage.digest(name), digest)
+        self.assertEquals(self.storage.open(name).read(), '0123456789')
+        self.assertEquals(self.storage.local_file(name), (self.storage.path(name), digest))
+        self.assertEquals(self.storage.url(name), '/media/%s' % name)
+
+    def test_dedupe(self):
+        name1 = self.storage.save('image.png', ContentFile('0123456789'))
+        name2 = self.storage.save('image.png', ContentFile('0123456789'))
+        other = self.storage.save('image.png', ContentFile('other'))
+
+        # Identical content shares the stored object
+        self.assertNotEquals(name1, name2)
+        self.assertEquals(self.storage.digest(name1), self.storage.digest(name2))
+        object_path = self.storage.object_path(self.storage.digest(name1))
+        self.assertEquals(os.stat(object_path).st_nlink, 3)
+        self.assertEquals(os.stat(self.storage.path(name2)).st_ino, os.stat(object_path).st_ino)
+        self.assertNotEquals(self.storage.digest(other), self.storage.digest(name1))
+
+        # The object is removed with its last file
+        self.storage.delete(name1)
+        self.assertFalse(self.storage.exists(name1))
+        self.assertEquals(self.storage.open(name2).read(), '0123456789')
+        self.assertEquals(os.stat(object_path).st_nlink, 2)
+
+        self.storage.delete(name2)
+        self.assertFalse(os.path.exists(object_path))
+        self.assertIsNone(self.storage.local_file(name2))
+        self.assertTrue(self.storage.exists(other))
+
+
+class GzipManifestStaticFilesStorageTests(TestCase):
+
+    def setUp(self):
+        super(GzipManifestStaticFilesStorageTests, self).setUp()
+        self.source = tempfile.mkdtemp()
+        self.static_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.source, 'js'))
+        with open(os.path.join(self.source, 'js', 'big.js'), 'wb') as js_file:
+            js_file.write('var code = "processing";\n' * 100)
+        with open(os.path.join(self.source, 'js', 'small.js'), 'wb') as js_file:
+            js_file.write('var x;')
+        with open(os.path.join(self.source, 'logo.png'), 'wb') as png_file:
+            png_file.write('not really a png ' * 100)
+        self.settings_override = override_settings(
+            STATICFILES_DIRS=[self.source],
+            STATIC_ROOT=self.static_root,
+            STATICFILES_STORAGE='gallery.storage.GzipManifestStaticFilesStorage',
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.static_root)
+        super(GzipManifestStaticFilesStorageTests, self).tearDown()
+
+    def test_collectstatic(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+        # Templates use the fingerprinted names
+        url = static('js/big.js')
+        self.assertRegexpMatches(url, r'^/static/js/big\.[0-9a-f]{12}\.js$')
+
+        # Both names have gzipped copies
+        hashed_path = os.path.join(self.static_root, url[len('/static/'):])
+        original_path = os.path.join(self.static_root, 'js', 'big.js')
+        for path in (hashed_path, original_path):
+            with open(path, 'rb') as original:
+                self.assertEquals(gzip.open(path + '.gz').read(), original.read())
+
+        # ..unless they're not smaller, or not text
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'js', 'small.js.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'logo.png.gz')))
+
+
+class MigrateDatabaseFilesTests(UserSetUp, TestCase):
+
+    def setUp(self):
+        super(MigrateDatabaseFilesTests, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.media_root)
+        super(MigrateDatabaseFilesTests, self).tearDown()
+
+    def hashed_storage(self):
+        return override_settings(
+            DEFAULT_FILE_STORAGE='gallery.storage.HashedFileSystemStorage',
+            MEDIA_ROOT=self.media_root,
+        )
+
+    def create_exhibition(self, name):
+        exhibition = Exhibition.objects.create(
+            author=self.user,
+            title='New Exhibition',
+            description='description goes here',
+            released_at=timezone.now(),
+        )
+        Exhibition.objects.filter(id=exhibition.id).update(image=name)
+        return Exhibition.objects.get(id=exhibition.id)
+
+    def test_migrate(self):
+        storage = DatabaseStorage()
+        image = storage.save('image.png', ContentFile('image data'))
+        duplicate = storage.save('image.png', ContentFile('image data'))
+        variant = storage.save('image-160w.jpg', ContentFile('variant data'))
+        preview = storage.save('artwork.png', ContentFile('preview data'))
+
+        exhibition1 = self.create_exhibition(image)
+        exhibition2 = self.create_exhibition(duplicate)
+        ImageVariant.objects.create(exhibition=exhibition1, source=image, image=image, width=10, height=10)
+        ImageVariant.objects.create(exhibition=exhibition1, source=image, image=variant, width=5, height=5)
+        artwork = Artwork.objects.create(title='Artwork', code='// code', author=self.user)
+        Artwork.objects.filter(id=artwork.id).update(preview=preview)
+        self.assertEquals(File.objects.count(), 4)
+
+        with self.hashed_storage():
+            out = StringIO()
+            call_command('migrate_database_files', stdout=out)
+            self.assertIn('Moved 4 files', out.getvalue())
+            self.assertIn('stored as 3 distinct files', out.getvalue())
+            self.assertEquals(File.objects.count(), 0)
+
+            # Names are rewritten, and identical files deduplicated
+            exhibition1 = Exhibition.objects.get(id=exhibition1.id)
+            exhibition2 = Exhibition.objects.get(id=exhibition2.id)
+            self.assertNotEquals(exhibition1.image.name, image)
+            self.assertEquals(exhibition1.image.read(), 'image data')
+            self.assertEquals(default_storage.digest(exhibition1.image.name),
+                              default_storage.digest(exhibition2.image.name))
+            self.assertEquals(os.stat(default_storage.path(exhibition1.image.name)).st_ino,
+                              os.stat(default_storage.path(exhibition2.image.name)).st_ino)
+
+            variants = list(exhibition1.image_variants.all())
+            self.assertEquals([v.source for v in variants], [exhibition1.image.name] * 2)
+            self.assertEquals(variants[1].image.name, exhibition1.image.name)
+            self.assertEquals(variants[0].image.read(), 'variant data')
+            self.assertEquals(Artwork.objects.get(id=artwork.id).preview.read(), 'preview data')
+
+            # Previous URLs redirect to the new names
+            client = Client()
+            response = client.get(exhibition1.image.url)
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(b''.join(response.streaming_content), 'image data')
+            response = client.get('/media/%s' % image)
+            self.assertEquals(response.status_code, 301)
+            self.assertTrue(response['Location'].endswith(exhibition1.image.url))
+
+            # Nothing left to move
+            out = StringIO()
+            call_command('migrate_database_files', stdout=out)
+            self.assertIn('Moved 0 files', out.getvalue())
+
+    def test_database_storage(self):
+        with self.assertRaises(CommandError):
+            call_command('migrate_database_files', stdout=StringIO())
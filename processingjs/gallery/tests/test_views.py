@@ -1,9 +1,24 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from django.test import TestCase, LiveServerTestCase
 from django.test.client import Client
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
-from django_adelaidex.util.test import TestOverrideSettings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.contrib.sessions.models import Session
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.six import StringIO
+from datetime import timedelta
+from django_adelaidex.util.test import TestOverrideSettings, UserSetUp
+from django_adelaidex.lti.models import Cohort
+from exhibitions.models import Exhibition
+from gallery.management.commands.warm_cache import Command as WarmCacheCommand
 
 
 class GalleryAuthTests(TestOverrideSettings, TestCase):
@@ -49,3 +64,183 @@ class ShareViewTest(TestCase):
         share_path = reverse('share')
         response = client.get(share_path)
         self.assertEqual(response.status_code, 200)
+
+
+class WarmCacheCommandTest(UserSetUp, LiveServerTestCase):
+
+    def warm_cache(self, **kwargs):
+        out = StringIO()
+        call_command('warm_cache', url=self.live_server_url, verbosity=2, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def assertRequested(self, out, path, count=1):
+        self.assertEquals(out.count('200 %s%s\n' % (self.live_server_url, path)), count, out)
+
+    def test_warm_cache(self):
+        released = Exhibition.objects.create(
+            title='Released',
+            description='description goes here',
+            author=self.staff_user,
+            released_at=timezone.now() + timedelta(hours=-1))
+        unreleased = Exhibition.objects.create(
+            title='Unreleased',
+            description='description goes here',
+            author=self.staff_user,
+            released_at=timezone.now() + timedelta(hours=1))
+
+        # Home, score, exhibition list, + 2 pages for the released exhibition
+        out = self.warm_cache()
+        self.assertIn('Warmed 5 pages', out)
+        self.assertRequested(out, reverse('home'))
+        self.assertRequested(out, reverse('exhibition-view', kwargs={'pk': released.id}))
+        self.assertRequested(out, reverse('exhibition-view-score', kwargs={'pk': released.id}))
+        self.assertNotIn(reverse('exhibition-view', kwargs={'pk': unreleased.id}), out)
+
+        out = self.warm_cache(repeat=2)
+        self.assertIn('Warmed 10 pages', out)
+        self.assertRequested(out, reverse('exhibition-view', kwargs={'pk': released.id}), 2)
+
+    def test_warm_cache_url(self):
+        with self.assertRaises(CommandError):
+            call_command('warm_cache', stdout=StringIO())
+
+    def test_warm_cache_cohorts(self):
+        cohort = Cohort.objects.create(
+            title='Cohort 1',
+            oauth_key='abc',
+            oauth_secret='abc',
+        )
+        # Cohorts without members aren't requested
+        Cohort.objects.create(
+            title='Cohort 2',
+            oauth_key='def',
+            oauth_secret='def',
+        )
+        student = get_user_model().objects.create(username='student', cohort=cohort)
+        shared = Exhibition.objects.create(
+            title='Shared',
+            description='description goes here',
+            author=self.staff_user,
+            released_at=timezone.now() + timedelta(hours=-1))
+        cohort_exhibition = Exhibition.objects.create(
+            title='Cohort 1',
+            description='description goes here',
+            author=self.staff_user,
+            cohort=cohort,
+            released_at=timezone.now() + timedelta(hours=-1))
+
+        # 3 pages + 2 per visible exhibition: 5 anonymous, 7 for cohort 1
+        out = self.warm_cache()
+        self.assertIn('Warmed 12 pages', out)
+        self.assertRequested(out, reverse('exhibition-view', kwargs={'pk': shared.id}), 2)
+
+        # Only visible to members of the cohort, so requested logged in as the student
+        self.assertRequested(out, reverse('exhibition-view', kwargs={'pk': cohort_exhibition.id}))
+
+        # Without recording a login, or leaving the session behind
+        self.assertIsNone(get_user_model().objects.get(id=student.id).last_login)
+        self.assertEquals(Session.objects.count(), 0)
+
+    def test_warm_cache_on_release(self):
+        Exhibition.objects.create(
+            title='Released',
+            description='description goes here',
+            author=self.staff_user,
+            released_at=timezone.now() + timedelta(hours=-1))
+
+        # The last run must outlast each process
+        with self.assertRaises(CommandError):
+            self.warm_cache(on_release=True)
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'gallery.cache.SQLiteCache',
+                'LOCATION': os.path.join(cache_dir, 'cache.sqlite3'),
+            }}):
+                self.assertIn('Warmed 5 pages', self.warm_cache(on_release=True))
+
+                # Nothing released since the last run
+                self.assertEqual(self.warm_cache(on_release=True), '')
+
+                # Warms again once an exhibition is released
+                cache.set(WarmCacheCommand.last_run_key, timezone.now() + timedelta(hours=-2), None)
+                self.assertIn('Warmed 5 pages', self.warm_cache(on_release=True))
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+class MediaViewTest(TestCase):
+
+    def setUp(self):
+        super(MediaViewTest, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+        self.name = default_storage.save('test.txt', ContentFile('0123456789'))
+        self.url = reverse('database_file', kwargs={'name': self.name})
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir)
+        super(MediaViewTest, self).tearDown()
+
+    def test_serve(self):
+        client = Client()
+        response = client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(b''.join(response.streaming_content), '0123456789')
+        self.assertEquals(response['Content-Type'], 'text/plain')
+        self.assertEquals(response['Content-Length'], '10')
+        self.assertEquals(len(os.listdir(self.cache_dir)), 1)
+
+        # Conditional requests
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, 304)
+        response = client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEquals(response.status_code, 304)
+        response = client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEquals(response.status_code, 200)
+
+    def test_range(self):
+        client = Client()
+        response = client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEquals(response.status_code, 206)
+        self.assertEquals(response.content, '2345')
+        self.assertEquals(response['Content-Range'], 'bytes 2-5/10')
+
+        response = client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEquals(response.status_code, 206)
+        self.assertEquals(response.content, '789')
+
+        response = client.get(self.url, HTTP_RANGE='bytes=8-')
+        self.assertEquals(response.content, '89')
+
+        response = client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEquals(response.status_code, 416)
+        self.assertEquals(response['Content-Range'], 'bytes */10')
+
+        # Range ignored if the file has changed
+        response = client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"other"')
+        self.assertEquals(response.status_code, 200)
+
+    def test_delete(self):
+        client = Client()
+        self.assertEquals(client.get(self.url).status_code, 200)
+        self.assertEquals(len(os.listdir(self.cache_dir)), 1)
+
+        default_storage.delete(self.name)
+        self.assertEquals(os.listdir(self.cache_dir), [])
+        self.assertEquals(client.get(self.url).status_code, 404)
+
+    def test_invalid_name(self):
+        client = Client()
+        for name in ['x/..', 'x/.', '..', 'test.txt', 'abc', '1/../2.txt']:
+            response = client.get(reverse('database_file', kwargs={'name': name}))
+            self.assertEquals(response.status_code, 404, name)
+        self.assertEquals(os.listdir(self.cache_dir), [])
+
+        # Not a stored file
+        response = client.get(reverse('database_file', kwargs={'name': '999999.txt'}))
+        self.assertEquals(response.status_code, 404)
+
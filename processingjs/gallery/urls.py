@@ -3,7 +3,6 @@ from django.core.urlresolvers import reverse_lazy
 from django.contrib.staticfiles.urls import static
 from django.contrib.auth import views as auth_views
 from django.conf import settings
-from database_files import views as database_files_views
 
 import gallery.views
 import artwork.views
@@ -86,6 +85,8 @@ urlpatterns = [
         name='artwork-clone'),
     url(r'^artwork/delete/(?P<pk>\d+)/$', artwork.views.DeleteArtworkView.as_view(),
         name='artwork-delete'),
+    url(r'^artwork/preview/(?P<pk>\d+)/$', artwork.views.ArtworkPreviewView.as_view(),
+        name='artwork-preview'),
 
     # Artwork detail views
     url(r'^a/(?P<pk>\d+)/$', artwork.views.UpdateArtworkView.as_view(),
@@ -96,6 +97,8 @@ urlpatterns = [
         name='artwork-render'),
     url(r'^artwork/render/$', artwork.views.RenderArtworkView.as_view(),
         name='artwork-render-create'),
+    url(r'^artwork/render/(?P<digest>[0-9a-f]+).html$', artwork.views.RenderShellArtworkView.as_view(),
+        name='artwork-render-shell'),
 
     url(r'^artwork/submit/(?P<artwork>\d+)/$', submissions.views.CreateSubmissionView.as_view(),
         name='artwork-submit'),
@@ -112,6 +115,10 @@ urlpatterns = [
     url(r'^e/(?P<pk>\d+)/$', exhibitions.views.ShowExhibitionView.as_view(),
         {'order': 'recent'},
         name='exhibition-view'),
+    url(r'^e/(?P<pk>\d+)/code.zip$', exhibitions.views.ExhibitionArchiveView.as_view(),
+        name='exhibition-code-zip'),
+    url(r'^e/(?P<pk>\d+)/code.zip/status$', exhibitions.views.ExhibitionArchiveStatusView.as_view(),
+        name='exhibition-code-zip-status'),
     url(r'^exhibition/new/$', exhibitions.views.CreateExhibitionView.as_view(),
         name='exhibition-add'),
     url(r'^exhibition/edit/(?P<pk>\d+)/$', exhibitions.views.UpdateExhibitionView.as_view(),
@@ -135,7 +142,7 @@ urlpatterns = [
     url(r'^vote/(?P<pk>\d+)$', votes.views.ShowVoteView.as_view(),
         name='vote-view'),
 
-    url(r'^media/(?P<name>.+)$', database_files_views.serve,
+    url(r'^media/(?P<name>.+)$', gallery.views.MediaView.as_view(),
         name='database_file'),
 ]
 
@@ -1,9 +1,19 @@
 import os.path
 import re
-from django.views.generic import TemplateView
+import mimetypes
+from django.views.generic import View, TemplateView
 from django.core.urlresolvers import reverse, get_script_prefix
+from django.core.files.storage import default_storage
 from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponsePermanentRedirect, FileResponse
+from django.utils.http import http_date, quote_etag
+from django.views.static import was_modified_since
 from django_adelaidex.util.mixins import TemplatePathMixin
+from database_files import views as database_files_views
+from database_files.models import File
+from database_files.storage import DatabaseStorage
+from gallery.models import MediaAlias
+from gallery.storage import database_name_re
 
 
 class ProbeView(TemplatePathMixin, TemplateView):
@@ -48,3 +58,95 @@ class ShareView(TemplatePathMixin, TemplateView):
         context = super(ShareView, self).get_context_data(**kwargs)
         context['script_prefix'] = get_script_prefix()
         return context
+
+
+class MediaView(View):
+    '''Serves uploaded media from local disk, for storages which keep it there.
+
+       Supports conditional requests using ETag (the content sha1) or
+       Last-Modified, and requests for a single byte range.  Files renamed
+       by the migrate_database_files command redirect to their new name.
+    '''
+    cache_max_age = 86400
+    range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+    def get_storage(self):
+        return default_storage
+
+    def get(self, request, name):
+        storage = self.get_storage()
+        if not hasattr(storage, 'local_file'):
+            return database_files_views.serve(request, name)
+
+        if isinstance(storage, DatabaseStorage) and not database_name_re.match(name):
+            raise Http404('File not found')
+        try:
+            local_file = storage.local_file(name)
+        except (ValueError, File.DoesNotExist):
+            raise Http404('File not found')
+        if local_file is None:
+            alias = MediaAlias.objects.filter(name=name).first()
+            if alias:
+                return HttpResponsePermanentRedirect(storage.url(alias.target))
+            raise Http404('File not found')
+        (path, digest) = local_file
+        stat = os.stat(path)
+        etag = quote_etag(digest)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match == '*'
+        else:
+            not_modified = not was_modified_since(
+                request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size)
+        if not_modified:
+            response = HttpResponseNotModified()
+        else:
+            response = self.get_response(request, path, stat.st_size, etag)
+            response['Content-Type'] = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'max-age=%d' % self.cache_max_age
+        return response
+
+    def get_range(self, request, size, etag):
+        '''Returns the (start, end) of the requested byte range, inclusive,
+           None if the whole file should be sent, or False if unsatisfiable.
+        '''
+        match = self.range_re.match(request.META.get('HTTP_RANGE', ''))
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not match or (if_range and if_range != etag):
+            return None
+
+        (start, end) = match.groups()
+        if not start:
+            if not end:
+                return None
+            # Suffix range: the last <end> bytes
+            start = max(size - int(end), 0)
+            end = size - 1
+        else:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        if start > end or start >= size:
+            return False
+        return (start, end)
+
+    def get_response(self, request, path, size, etag):
+        byte_range = self.get_range(request, size, etag)
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'))
+            response['Content-Length'] = size
+        elif byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+        else:
+            (start, end) = byte_range
+            with open(path, 'rb') as media_file:
+                media_file.seek(start)
+                response = HttpResponse(media_file.read(end - start + 1), status=206)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        return response
+
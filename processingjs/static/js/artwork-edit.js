@@ -70,4 +70,67 @@ $(document).ready(function() {
     if ($input.length && $input.val()) {
         editor.setValue($input.val(), -1);
     }
+
+    // Capture a still of the rendered artwork, and upload it as the
+    // artwork preview shown in lists.  Calls done when finished, or if
+    // the iframe doesn't respond.
+    var $form = $input.closest('form');
+    var previewUrl = $form.data('preview-url');
+
+    function capturePreview(done) {
+        var waiting = true;
+        var onPreview = function(evt, msg) {
+            if (msg['pk'] == artworkId) {
+                $(window).off('artwork.preview', onPreview);
+                if (!waiting) {
+                    return;
+                }
+                waiting = false;
+                if (msg['preview']) {
+                    $.post(previewUrl, {
+                        'preview': msg['preview'],
+                        'csrfmiddlewaretoken': $form.find('input[name=csrfmiddlewaretoken]').val()
+                    }).always(done);
+                } else {
+                    done();
+                }
+            }
+        };
+        $(window).on('artwork.preview', onPreview);
+        callFunc("captureArtwork"+artworkId);
+
+        setTimeout(function() {
+            if (waiting) {
+                waiting = false;
+                done();
+            }
+        }, 2000);
+    }
+
+    if (previewUrl) {
+        // Upload the preview before saving the artwork
+        var saving = false;
+        $form.on('submit', function() {
+            if (!saving) {
+                saving = true;
+                capturePreview(function() {
+                    $form.get(0).submit();
+                });
+                return false;
+            }
+        });
+
+        // Artwork without a preview gets one once it has been playing a while
+        if ($form.data('preview-missing')) {
+            var onAnimate = function(evt, msg) {
+                if (msg['pk'] == artworkId && msg['animate']) {
+                    $(window).off('artwork.update.animate', onAnimate);
+                    setTimeout(function() {
+                        capturePreview(function() {});
+                    }, 1000);
+                }
+            };
+            $(window).on('artwork.update.animate', onAnimate);
+        }
+    }
 });
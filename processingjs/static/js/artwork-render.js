@@ -41,6 +41,14 @@ function createArtworkIframe(args) {
                     $error.html(evt.data.error).show();
                 }
             }
+
+            // Pass captured stills on to listeners (e.g. artwork/edit)
+            if ('preview' in evt.data) {
+                $(window).trigger('artwork.preview', {
+                    'preview': evt.data.preview,
+                    'pk': artworkId
+                });
+            }
         }
     };
     if (window.addEventListener){
@@ -111,6 +119,15 @@ function createArtworkIframe(args) {
     }
     window['updateArtwork'+artworkId] = updateArtwork;
 
+    // Ask the iframe for a still of the canvas, sent back as an
+    // artwork.preview event.
+    window['captureArtwork'+artworkId] = function() {
+        $iframe.get(0).contentWindow.postMessage({
+            'capture': true,
+            'pk': artworkId
+        }, '*');
+    };
+
     // 4. Show the "paused" overlay and play link for existing artwork
     if (args['overlay']) {
 
@@ -130,8 +147,27 @@ function createArtworkIframe(args) {
                 return false;
             }
         };
-        $overlay.show();
-        $overlay.on('click', removeOverlay);
+        if (args['autoplay']) {
+            // Play as soon as the iframe can receive the code
+            $iframe.on('load', removeOverlay);
+        } else {
+            $overlay.show();
+            $overlay.on('click', removeOverlay);
+        }
         $(window).on('artwork.update.animate', removeOverlay);
     }
 }
+
+// Show the "paused" overlay over the artwork's preview image, and only
+// create the iframe, and play the artwork, when the overlay is clicked.
+function createArtworkStill(args) {
+
+    var $overlay = $(args['overlay']);
+    var play = function() {
+        $overlay.off('click', play);
+        createArtworkIframe($.extend({}, args, {'autoplay': true}));
+        return false;
+    };
+    $overlay.show();
+    $overlay.on('click', play);
+}
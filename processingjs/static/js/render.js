@@ -24,6 +24,17 @@ $(document).ready(function() {
     // it's ok to try to load the code.
     if (inIframe() && !getCookies() ) {
 
+        // The shared render shell gets its pk from the URL fragment
+        var $rendered = $('#artwork-rendered');
+        var hashPk = window.location.hash.replace(/^#/, '');
+        if (!$rendered.attr('pk') && hashPk) {
+            $('#error-').attr('id', 'error-' + hashPk);
+            $rendered.attr('pk', hashPk);
+        }
+
+        // Set once the code has been run, so there's something to capture
+        var rendered = false;
+
         function onMessage (evt) {
 
             // 0. Verify the pk
@@ -62,6 +73,7 @@ $(document).ready(function() {
                     try {
                         $error.empty().hide();
                         Processing.reload();
+                        rendered = true;
                     } catch(e) {
                         parent.postMessage({'error': e.message, 'pk': pk}, '*');
                         $error.html(e.message).show();
@@ -76,6 +88,19 @@ $(document).ready(function() {
                         instance.noLoop();
                     }
                 }
+                else if ('capture' in evt.data) {
+                    // Send a still of the canvas, to be stored as the artwork preview
+                    var preview = null;
+                    if (rendered) {
+                        try {
+                            preview = $canvas.get(0).toDataURL('image/png');
+                        } catch(e) {
+                            // e.g. the canvas is tainted by cross-origin images
+                            console.warn(e);
+                        }
+                    }
+                    parent.postMessage({'preview': preview, 'pk': pk}, '*');
+                }
             } else {
                 console.error(evt);
             }
@@ -83,20 +83,38 @@ registry.register('can_save', Submission)
 registry.register('can_vote', Submission)
 
 
+def update_archive(exhibition_id):
+    '''Update the exhibition's stored code archive, if enabled.'''
+    if settings.EXHIBITION_ARCHIVE_UPDATE:
+        from exhibitions.archive import ExhibitionArchive
+        ExhibitionArchive.update_on_commit(exhibition_id)
+
+
+@receiver(post_save, sender=Artwork)
+def artwork_post_save(sender, instance=None, **kwargs):
+    '''Update the code archives of exhibitions the artwork was submitted to'''
+    if instance and settings.EXHIBITION_ARCHIVE_UPDATE:
+        for exhibition_id in Submission.objects.filter(
+                artwork_id=instance.id).values_list('exhibition_id', flat=True):
+            update_archive(exhibition_id)
+
+
 @receiver(post_save, sender=Submission)
 def post_save(sender, instance=None, **kwargs):
-    '''Update artwork.shared to submission id'''
+    '''Update artwork.shared to submission id, and the exhibition code archive'''
     if instance:
         from artwork.models import Artwork
         Artwork.objects.filter(id__exact=instance.artwork_id).update(shared=instance.id)
+        update_archive(instance.exhibition_id)
 
 
 @receiver(post_delete, sender=Submission)
 def post_delete(sender, instance=None, **kwargs):
-    '''Decrement artwork.shared, and delete existing votes.'''
+    '''Decrement artwork.shared, delete existing votes, and update the exhibition code archive.'''
     if instance:
         from artwork.models import Artwork
         Artwork.objects.filter(id__exact=instance.artwork_id).update(shared=0)
+        update_archive(instance.exhibition_id)
 
 
 class SubmissionForm(forms.ModelForm):
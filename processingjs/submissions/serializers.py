@@ -0,0 +1,8 @@
+from artwork.serializers import ArtworkCodeSerializer
+
+
+class SubmissionCodeSerializer(ArtworkCodeSerializer):
+    '''Renders a submission's artwork as a .pde file, like the submissions/code.pde template.'''
+
+    def serialize(self, submission):
+        return self.serialize_artwork(submission.artwork, submission.get_absolute_url())
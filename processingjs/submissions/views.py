@@ -3,10 +3,12 @@ from django.views.generic import DetailView, ListView, CreateView, DeleteView
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 
 from django_adelaidex.util.mixins import TemplatePathMixin, PostOnlyMixin, LoggedInMixin, ObjectHasPermMixin
-from django_adelaidex.zipfile.mixins import ZipFileViewMixin
+from gallery.streaming import StreamingZipFileViewMixin
 from submissions.models import Submission, SubmissionForm
+from submissions.serializers import SubmissionCodeSerializer
 from artwork.models import Artwork
 from exhibitions.models import Exhibition
 from gallery.views import ShareView
@@ -20,14 +22,15 @@ class SubmissionView(TemplatePathMixin):
 
 
 class SubmissionCodeView(SubmissionView, DetailView):
-    template_name = SubmissionView.prepend_template_path('code.pde')
+    serializer_class = SubmissionCodeSerializer
     content_type = 'text/plain'
     content_disposition = 'attachment;'
     #method_user_perm = { 'GET': 'can_see' }
 
     def render_to_response(self, context, **response_kwargs):
-        response = super(SubmissionCodeView, self).render_to_response(
-                context, **response_kwargs)
+        serializer = self.serializer_class.for_request(self.request)
+        response = HttpResponse(serializer.serialize(self.object),
+                                content_type=self.content_type)
         response['Content-Disposition'] = self.content_disposition
         return response
 
@@ -110,8 +113,8 @@ class ListSubmissionView(SubmissionView, ListView):
         return context
 
 
-class ListSubmissionCodeZipFileView(ZipFileViewMixin, ListSubmissionView):
-    object_template_name = SubmissionCodeView.template_name
+class ListSubmissionCodeZipFileView(StreamingZipFileViewMixin, ListSubmissionView):
+    serializer_class = SubmissionCodeSerializer
     object_filename = 'artwork%d.pde'
     zip_filename = 'code.zip'
 
@@ -0,0 +1,158 @@
+'''Counts the redirects of each route and script prefix, and the unmapped pks.
+
+Counts are kept in memory, and appended to settings.REDIRECT_HITS_FILE in the
+background at most once every REDIRECT_HITS_FLUSH_INTERVAL seconds, one JSON
+object per line:
+
+    {"time": 1450000000, "prefix": "/think.create.code/gallery/", "route": "artwork-view", "hits": 12}
+    {"time": 1450000000, "prefix": "/think.create.code/gallery/", "model": "artwork.artwork", "pk": "99", "hits": 1}
+
+Once the file is larger than REDIRECT_HITS_MAX_BYTES, it's moved to
+REDIRECT_HITS_FILE.1, replacing the previous one.
+
+Redirects made by the rewrite rules from export_rewrite_maps never reach
+Django; httpd logs them to settings.REDIRECT_HITS_LOG instead, one per line:
+
+    1450000000 /think.create.code/gallery/ artwork-view
+'''
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import collections
+from django.conf import settings
+
+
+class HitCounter(object):
+
+    def __init__(self):
+        self._routes = collections.Counter()
+        self._unmapped = collections.Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_flush = None
+
+    def hit(self, script_prefix, route):
+        '''Counts a request to the named route.'''
+        if not settings.REDIRECT_HITS_FILE:
+            return
+        with self._lock:
+            self._routes[(script_prefix, route)] += 1
+        self.check()
+
+    def unmapped(self, script_prefix, model, pk):
+        '''Counts a request for a pk missing from the model's pk map.'''
+        if not settings.REDIRECT_HITS_FILE:
+            return
+        with self._lock:
+            self._unmapped[(script_prefix, model, pk)] += 1
+
+    def check(self):
+        '''Starts flushing the counts in the background, if they're due.
+           Returns the thread started, if any.
+        '''
+        now = time.time()
+        if self._next_flush is None:
+            self._next_flush = now + settings.REDIRECT_HITS_FLUSH_INTERVAL
+        if now < self._next_flush:
+            return None
+        with self._lock:
+            if now < self._next_flush:
+                return None
+            self._next_flush = now + settings.REDIRECT_HITS_FLUSH_INTERVAL
+
+        thread = threading.Thread(target=self.flush, name='redirect-hits-flush')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def clear(self):
+        '''Discards the counts, returning them as (route counts, unmapped pk counts).'''
+        with self._lock:
+            counts = (self._routes, self._unmapped)
+            self._routes = collections.Counter()
+            self._unmapped = collections.Counter()
+        return counts
+
+    def flush(self):
+        '''Appends the counts to REDIRECT_HITS_FILE, and clears them.
+           Returns the number of records written.
+        '''
+        path = settings.REDIRECT_HITS_FILE
+        if not path:
+            return 0
+        (routes, unmapped) = self.clear()
+        now = int(time.time())
+        records = [
+            {'time': now, 'prefix': prefix, 'route': route, 'hits': count}
+            for ((prefix, route), count) in routes.items()
+        ] + [
+            {'time': now, 'prefix': prefix, 'model': model, 'pk': pk, 'hits': count}
+            for ((prefix, model, pk), count) in unmapped.items()
+        ]
+        if not records:
+            return 0
+
+        # One write per flush, so the lines from each process aren't interleaved
+        data = ''.join('%s\n' % json.dumps(record, sort_keys=True) for record in records)
+        with self._flush_lock:
+            try:
+                directory = os.path.dirname(path)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                with open(path, 'a') as hits_file:
+                    hits_file.write(data)
+                self.rotate(path)
+            except (IOError, OSError):
+                logging.exception('Unable to write redirect hits to %s' % path)
+                return 0
+        return len(records)
+
+    def rotate(self, path):
+        '''Moves the hits file to path.1 once it's larger than
+           REDIRECT_HITS_MAX_BYTES, so the hits take at most about twice that.
+        '''
+        max_bytes = settings.REDIRECT_HITS_MAX_BYTES
+        if not max_bytes:
+            return
+        try:
+            if os.path.getsize(path) > max_bytes:
+                os.rename(path, '%s.1' % path)
+        except OSError:
+            # Already moved by another process
+            pass
+
+
+def rotated(path):
+    '''Returns the existing hits files for path: the previous one, then path.'''
+    return [filename for filename in ('%s.1' % path, path) if os.path.exists(filename)]
+
+
+def read(path):
+    '''Yields the records in a hits file.'''
+    with open(path) as hits_file:
+        for line in hits_file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Partly written
+                pass
+
+
+def read_log(path):
+    '''Yields the redirects in an httpd hits log, as records with one hit each.'''
+    with open(path) as log_file:
+        for line in log_file:
+            fields = line.split()
+            if len(fields) != 3 or not fields[0].isdigit():
+                # Partly written
+                continue
+            yield {'time': int(fields[0]), 'prefix': fields[1], 'route': fields[2], 'hits': 1}
+
+
+hits = HitCounter()
+
+# Write the remaining counts when the daemon process exits
+atexit.register(hits.flush)
@@ -0,0 +1,93 @@
+import timeit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import resolve, get_script_prefix, set_script_prefix
+from django.test.client import RequestFactory
+
+from redirect.hits import hits
+from redirect.pkmaps import pk_maps
+from redirect.routes import redirect_tables
+
+
+class Command(BaseCommand):
+    help = ('Measures redirects per second through the redirect views, '
+            'and through the compiled redirect table.')
+
+    paths = (
+        '/', '/help/', '/a/list/', '/unknown/path/',
+        '/a/%(artwork)s/', '/artwork/edit/%(artwork)s/', '/artwork%(artwork)s.pde',
+        '/a/by/%(user)s/', '/e/%(exhibition)s/', '/s/%(submission)s/',
+    )
+
+    models = (
+        ('artwork', 'artwork.artwork'),
+        ('exhibition', 'exhibitions.exhibition'),
+        ('submission', 'submissions.submission'),
+        ('user', 'lti.user'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='*',
+            help='Paths to redirect (default: a sample of each kind of URL)')
+        parser.add_argument('--script-prefix', default='/',
+            help='Script prefix, from REDIRECT_MAP, to redirect from (default: /)')
+        parser.add_argument('--requests', type=int, default=10000,
+            help='Number of redirects to time each way')
+
+    def handle(self, *args, **options):
+        script_prefix = options['script_prefix']
+        if script_prefix not in settings.REDIRECT_MAP:
+            raise CommandError('%s is not in REDIRECT_MAP' % script_prefix)
+
+        previous_prefix = get_script_prefix()
+        set_script_prefix(script_prefix)
+        try:
+            requests = self.get_requests(script_prefix, options['path'] or self.get_paths(script_prefix))
+            count = options['requests']
+
+            # Load the pk maps and tables, so they're not timed
+            for request in requests:
+                self.view_redirect(request)
+                self.table_redirect(request)
+
+            mismatched = [request.path for request in requests
+                          if self.view_redirect(request) != self.table_redirect(request)]
+            for path in mismatched:
+                self.stderr.write('%s redirects differently through the compiled table' % path)
+
+            view_rate = self.time(self.view_redirect, requests, count)
+            table_rate = self.time(self.table_redirect, requests, count)
+        finally:
+            set_script_prefix(previous_prefix)
+            # Don't record the benchmark's requests
+            hits.clear()
+
+        self.stdout.write('Views: %d redirects/s' % view_rate)
+        self.stdout.write('Compiled table: %d redirects/s (%.1fx)' % (table_rate, table_rate / view_rate))
+
+    def get_paths(self, script_prefix):
+        '''Returns the sample paths, using the first mapped pk of each model.'''
+        pks = {}
+        for (name, model) in self.models:
+            pk_map = pk_maps.get(script_prefix, model)
+            pks[name] = next(pk_map.items())[0] if len(pk_map) else 1
+        return [path % pks for path in self.paths]
+
+    def get_requests(self, script_prefix, paths):
+        factory = RequestFactory()
+        return [factory.get(path, SCRIPT_NAME=script_prefix.rstrip('/')) for path in paths]
+
+    def view_redirect(self, request):
+        match = resolve(request.path_info)
+        response = match.func(request, *match.args, **match.kwargs)
+        return response.get('Location')
+
+    def table_redirect(self, request):
+        return redirect_tables.get_redirect_url(request) or self.view_redirect(request)
+
+    def time(self, redirect, requests, count):
+        '''Returns the number of redirects per second.'''
+        def run():
+            for i in xrange(count):
+                redirect(requests[i % len(requests)])
+        return count / timeit.timeit(run, number=1)
@@ -0,0 +1,46 @@
+import os
+import glob
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from redirect.pkmaps import PkMap
+
+
+class Command(BaseCommand):
+    help = ('Converts <model>.map.json pk maps into <model>.map.bin files alongside, '
+            'which are read in place of the JSON files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+            help='Pk map files, or directories of them, to convert '
+                 '(default: the data directories in REDIRECT_MAP)')
+        parser.add_argument('--force', action='store_true', default=False,
+            help='Convert files with an up to date .map.bin file')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or sorted(set(settings.REDIRECT_MAP.values()))
+        json_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                json_paths.extend(sorted(glob.glob(os.path.join(path, '*.map.json'))))
+            elif path.endswith('.map.json') and os.path.exists(path):
+                json_paths.append(path)
+            else:
+                raise CommandError('Not a pk map file or directory: %s' % path)
+
+        converted = 0
+        for json_path in json_paths:
+            bin_path = '%s.bin' % json_path[:-len('.json')]
+            if (not options['force'] and os.path.exists(bin_path) and
+                    os.path.getmtime(bin_path) >= os.path.getmtime(json_path)):
+                continue
+            try:
+                pk_map = PkMap.load(json_path)
+            except ValueError as e:
+                raise CommandError('Unable to read %s: %s' % (json_path, e))
+            pk_map.save(bin_path)
+            converted += 1
+            if int(options['verbosity']) > 1:
+                self.stdout.write('%s: %d pks' % (bin_path, len(pk_map)))
+
+        self.stdout.write('Converted %d of %d pk maps' % (converted, len(json_paths)))
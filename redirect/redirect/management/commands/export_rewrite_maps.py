@@ -0,0 +1,180 @@
+import os
+import re
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from redirect.pkmaps import pk_maps
+from redirect.routes import RedirectTable, ObjectRoute, FixedRoute, PathRoute
+
+
+class Command(BaseCommand):
+    help = ('Writes the pk maps as httpd RewriteMap files, and the compiled '
+            'redirect table as RewriteRules which use them.  Paths the rules '
+            "can't redirect, including unmapped pks, are passed on to Django.  "
+            'The redirects the rules make are logged to REDIRECT_HITS_LOG.')
+
+    conf_name = 'redirect.conf'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir',
+            default=os.path.join(settings.BASE_DIR, 'rewrite'),
+            help='Directory to write the map files and %s to' % self.conf_name)
+        parser.add_argument('--script-prefix', action='append', dest='script_prefixes',
+            help='Script prefix from REDIRECT_MAP to export, may be repeated '
+                 '(default: all but /, which would match every URL)')
+        parser.add_argument('--rotatelogs', default='/usr/sbin/rotatelogs',
+            help='httpd rotatelogs program, which caps REDIRECT_HITS_LOG at '
+                 'REDIRECT_HITS_MAX_BYTES')
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])
+        script_prefixes = options['script_prefixes'] or [
+            prefix for prefix in settings.REDIRECT_MAP if prefix != '/']
+        for script_prefix in script_prefixes:
+            if script_prefix not in settings.REDIRECT_MAP:
+                raise CommandError('%s is not in REDIRECT_MAP' % script_prefix)
+
+        output_dir = os.path.abspath(options['output_dir'])
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        self.maps = {}
+        rules = []
+        # Longest first, in case one script prefix contains another
+        for script_prefix in sorted(script_prefixes, key=len, reverse=True):
+            rules.extend(self.get_rules(script_prefix, output_dir))
+
+        lines = [
+            '# Written by ./manage.py export_rewrite_maps; do not edit.',
+            '# Include in the server or virtual host config.',
+            'RewriteEngine On',
+        ]
+        for (map_name, (script_prefix, model, path)) in sorted(self.maps.items()):
+            count = self.write_map(pk_maps.get(script_prefix, model), path)
+            lines.append('RewriteMap %s txt:%s' % (map_name, path))
+            if self.verbosity > 1:
+                self.stdout.write('%s: %d pks' % (path, count))
+        lines.append('')
+        lines.extend(self.get_log(options['rotatelogs']))
+        lines.extend(rules)
+
+        conf_path = os.path.join(output_dir, self.conf_name)
+        self.write_file(conf_path, '\n'.join(lines) + '\n')
+        self.stdout.write('Wrote %d rewrite maps and %d rules to %s' % (
+            len(self.maps), len([line for line in rules if line.startswith('RewriteRule')]),
+            conf_path))
+
+    def get_map_name(self, script_prefix, model, output_dir):
+        '''Returns the name of the RewriteMap for the model's pk map, adding it
+           to the maps to write.  Script prefixes sharing a data directory share its maps.
+        '''
+        data_dir = os.path.basename(os.path.normpath(settings.REDIRECT_MAP[script_prefix]))
+        map_name = re.sub(r'[^\w.]+', '-', 'redirect-%s-%s' % (data_dir, model)).lower()
+        if map_name not in self.maps:
+            path = os.path.join(output_dir, data_dir, '%s.map.txt' % model)
+            self.maps[map_name] = (script_prefix, model, path)
+        return map_name
+
+    def get_log(self, rotatelogs):
+        '''Returns the CustomLog directive which logs the redirects made by the
+           rules to REDIRECT_HITS_LOG, as read by redirect_hits.
+        '''
+        path = settings.REDIRECT_HITS_LOG
+        if not path:
+            return []
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        max_bytes = settings.REDIRECT_HITS_MAX_BYTES
+        if max_bytes:
+            # Alternates between path and path.1, like REDIRECT_HITS_FILE
+            log = '"|%s -n 2 %s %dK"' % (rotatelogs, os.path.abspath(path), max(1, max_bytes // 1024))
+        else:
+            log = os.path.abspath(path)
+        return [
+            'CustomLog %s "%%{sec}t %%{redirect_prefix}e %%{redirect_route}e" env=redirect_route' % log,
+            '',
+        ]
+
+    def get_flags(self, script_prefix, route, flags):
+        '''Returns the flags of a redirecting RewriteRule, naming the route for the log.'''
+        return '[%s,E=redirect_prefix:%s,E=redirect_route:%s]' % (
+            flags, self.escape(script_prefix), self.escape(route.name))
+
+    def get_rules(self, script_prefix, output_dir):
+        '''Returns the RewriteRules for the script prefix's redirect table.'''
+        lines = ['# %s' % script_prefix]
+        redirect_only = 'RewriteCond %{REQUEST_METHOD} ^(GET|HEAD)$'
+        for route in RedirectTable(script_prefix).routes:
+            body = route.regex.pattern
+            if not body.startswith('^'):
+                # Left to Django, and so are the paths after it
+                lines.extend([
+                    '# Unable to compile %s' % body,
+                    'RewriteRule ^%s - [L]' % self.escape_pattern(script_prefix),
+                    '',
+                ])
+                break
+            pattern = '^%s(?:%s)' % (self.escape_pattern(script_prefix), body[1:])
+
+            if isinstance(route, ObjectRoute) and route.regex.groupindex['pk'] <= 9:
+                map_name = self.get_map_name(script_prefix, route.model, output_dir)
+                lines.extend([
+                    redirect_only,
+                    'RewriteCond ${%s:$%d} ^(.+)$' % (map_name, route.regex.groupindex['pk']),
+                    'RewriteRule %s %s%%1%s %s' % (
+                        pattern, self.escape(route.url_start), self.escape(route.url_end),
+                        self.get_flags(script_prefix, route, 'R=302,L,QSD')),
+                ])
+            elif isinstance(route, FixedRoute):
+                lines.extend([
+                    redirect_only,
+                    'RewriteRule %s %s %s' % (
+                        pattern, self.escape(route.url),
+                        self.get_flags(script_prefix, route, 'R=302,L,QSD')),
+                ])
+            elif isinstance(route, PathRoute):
+                # Redirects the whole path, keeping the query string
+                lines.extend([
+                    redirect_only,
+                    'RewriteRule ^%s((?:%s).*)$ %s %s' % (
+                        self.escape_pattern(script_prefix), body[1:],
+                        self.escape(os.path.join(settings.REDIRECT_BASE, '')) + '$1',
+                        self.get_flags(script_prefix, route, 'R=302,L')),
+                ])
+            # Anything else matching the pattern is left to Django
+            lines.extend(['RewriteRule %s - [L]' % pattern, ''])
+        return lines
+
+    def escape_pattern(self, path):
+        '''Escapes the regular expression characters in the path.'''
+        return re.sub(r'([.^$*+?{}\[\]\\|()])', r'\\\1', path)
+
+    def escape(self, url):
+        '''Escapes the characters RewriteRule substitutes.'''
+        return re.sub(r'([$%\\\s])', r'\\\1', url)
+
+    def write_map(self, pk_map, path):
+        '''Writes the pk map as a txt RewriteMap, returning the number of pks.
+           Unmapped pks are left out, so they're redirected by Django.
+        '''
+        lines = ['%d %d\n' % (old, new) for (old, new) in pk_map.items() if new]
+        self.write_file(path, ''.join(lines))
+        return len(lines)
+
+    def write_file(self, path, content):
+        '''Replaces the file in one step, so httpd never reads it half written.'''
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        (fd, temp_path) = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'w') as out:
+                out.write(content)
+            os.chmod(temp_path, 0644)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
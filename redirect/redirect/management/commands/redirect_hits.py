@@ -0,0 +1,75 @@
+import collections
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from redirect import hits
+
+
+class Command(BaseCommand):
+    help = ('Reports the most redirected legacy routes and script prefixes, '
+            'and the most requested unmapped pks, from REDIRECT_HITS_FILE and '
+            'the redirects httpd logs to REDIRECT_HITS_LOG.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.REDIRECT_HITS_FILE,
+            help='Hits file to report on (default: REDIRECT_HITS_FILE)')
+        parser.add_argument('--log', default=settings.REDIRECT_HITS_LOG,
+            help='httpd hits log to report on (default: REDIRECT_HITS_LOG)')
+        parser.add_argument('--top', type=int, default=20,
+            help='Number of routes and pks to list')
+        parser.add_argument('--script-prefix',
+            help='Only report on this script prefix')
+
+    def get_records(self, options):
+        '''Yields (source, record) for the hits in the files and their rotated copies.'''
+        for path in hits.rotated(options['file']) if options['file'] else []:
+            for record in hits.read(path):
+                yield ('django', record)
+        for path in hits.rotated(options['log']) if options['log'] else []:
+            for record in hits.read_log(path):
+                yield ('httpd', record)
+
+    def handle(self, *args, **options):
+        paths = [path for path in (options['file'], options['log']) if path]
+        if not any(hits.rotated(path) for path in paths):
+            raise CommandError('No hits file: %s' % ', '.join(paths))
+
+        sources = collections.Counter()
+        prefixes = collections.Counter()
+        routes = collections.Counter()
+        unmapped = collections.Counter()
+        (first, last) = (None, None)
+        for (source, record) in self.get_records(options):
+            if options['script_prefix'] and record['prefix'] != options['script_prefix']:
+                continue
+            first = min(first or record['time'], record['time'])
+            last = max(last, record['time'])
+            if 'route' in record:
+                sources[source] += record['hits']
+                prefixes[record['prefix']] += record['hits']
+                routes[(record['prefix'], record['route'])] += record['hits']
+            else:
+                unmapped[(record['prefix'], record['model'], record['pk'])] += record['hits']
+
+        if first is None:
+            self.stdout.write('No hits recorded')
+            return
+        self.stdout.write('%d hits, %d redirected by httpd, recorded between %s and %s' % (
+            sum(prefixes.values()), sources['httpd'],
+            self.format_time(first), self.format_time(last)))
+
+        self.stdout.write('\nScript prefixes:')
+        for (prefix, count) in prefixes.most_common():
+            self.stdout.write('%10d  %s' % (count, prefix))
+
+        self.stdout.write('\nTop routes:')
+        for ((prefix, route), count) in routes.most_common(options['top']):
+            self.stdout.write('%10d  %s  %s' % (count, prefix, route))
+
+        self.stdout.write('\nTop unmapped pks:')
+        for ((prefix, model, pk), count) in unmapped.most_common(options['top']):
+            self.stdout.write('%10d  %s  %s %s' % (count, prefix, model, pk))
+
+    def format_time(self, timestamp):
+        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
@@ -0,0 +1,23 @@
+from django.http import HttpResponseRedirect
+from django.core.urlresolvers import get_script_prefix
+
+from redirect.hits import hits
+from redirect.routes import redirect_tables
+
+
+class CompiledRedirectMiddleware(object):
+    '''Redirects requests using the compiled redirect table, before their URL
+       is resolved.  Requests the table can't redirect are passed on to the views.
+    '''
+
+    def process_request(self, request):
+        url = redirect_tables.get_redirect_url(request)
+        if url:
+            return HttpResponseRedirect(url)
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Count the requests left to the views
+        match = request.resolver_match
+        hits.hit(get_script_prefix(), match.url_name or match.func.__name__)
+        return None
@@ -0,0 +1,374 @@
+'''Process-wide store of the pk maps used by ObjectRedirectView.
+
+Each map is read once per process from <REDIRECT_MAP[script_prefix]>/<model>.map.bin,
+or <model>.map.json if there's no .bin file, and shared by all threads and
+requests, until its file changes.
+
+The .map.bin files are written by migrate_data/load_data.py, or converted from
+.map.json files by ./manage.py convert_pk_maps.  They hold a header, then the
+old pks in ascending order, then their new pks, as little-endian signed
+integers of the header's itemsize:
+
+    'PKMP', version (uint16), itemsize (uint16), count (uint64)
+'''
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import time
+import bisect
+import hashlib
+import logging
+import tempfile
+import itertools
+import threading
+from django.conf import settings
+
+
+MAGIC = 'PKMP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ')
+
+# Array typecodes by itemsize
+TYPECODES = dict((array.array(typecode).itemsize, typecode) for typecode in 'il')
+
+
+def read_header(data):
+    '''Returns the (typecode, count) of the binary pk map, checking its length.'''
+    if len(data) < HEADER.size:
+        raise ValueError('Not a binary pk map')
+    (magic, version, itemsize, count) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or itemsize not in TYPECODES:
+        raise ValueError('Not a binary pk map')
+    if len(data) != HEADER.size + 2 * count * itemsize:
+        raise ValueError('Binary pk map has %d bytes, expected %d' % (
+            len(data), HEADER.size + 2 * count * itemsize))
+    return (TYPECODES[itemsize], count)
+
+
+def read_array(typecode, data, start=0, end=None):
+    '''Returns the little-endian integers in data[start:end] as an array.'''
+    values = array.array(typecode)
+    values.fromstring(data[start:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def get_int_pks(pks):
+    '''Yields (pk, position) for each of the pks which is an integer.'''
+    for (position, pk) in enumerate(pks):
+        try:
+            yield (int(pk), position)
+        except (TypeError, ValueError):
+            pass
+
+
+class PkMap(object):
+    '''Maps old pks to new pks.
+
+       Stored as two arrays of integers, sorted by old pk, and searched by
+       bisection, which takes a fraction of the memory of a dict of strings.
+    '''
+
+    def __init__(self, pairs=()):
+        pairs = sorted((int(old), int(new)) for (old, new) in pairs)
+        largest = max([abs(pk) for pair in pairs for pk in pair] or [0])
+        typecode = TYPECODES[4] if largest < 2 ** 31 else TYPECODES[8]
+        self.old_pks = array.array(typecode, [old for (old, new) in pairs])
+        self.new_pks = array.array(typecode, [new for (old, new) in pairs])
+
+    @classmethod
+    def load(cls, path):
+        '''Reads the map from a <model>.map.bin file, or a <model>.map.json file,
+           of {"<old pk>": <new pk>}.'''
+        with open(path, 'rb') as map_file:
+            return cls.loads(map_file.read())
+
+    @classmethod
+    def loads(cls, data):
+        '''Returns the map in the binary or JSON data.'''
+        if not data.startswith(MAGIC):
+            return cls(json.loads(data).items())
+        (typecode, count) = read_header(data)
+        pk_map = cls()
+        size = count * array.array(typecode).itemsize
+        pk_map.old_pks = read_array(typecode, data, HEADER.size, HEADER.size + size)
+        pk_map.new_pks = read_array(typecode, data, HEADER.size + size)
+        return pk_map
+
+    def dumps(self):
+        '''Returns the map in the binary format.'''
+        columns = [array.array(self.old_pks.typecode, self.old_pks),
+                   array.array(self.new_pks.typecode, self.new_pks)]
+        if sys.byteorder == 'big':
+            for column in columns:
+                column.byteswap()
+        return HEADER.pack(MAGIC, VERSION, self.old_pks.itemsize, len(self)) + ''.join(
+            column.tostring() for column in columns)
+
+    def save(self, path):
+        '''Writes the map to a <model>.map.bin file, replacing it in one step, so
+           it's never read half written.'''
+        directory = os.path.dirname(os.path.abspath(path))
+        (fd, temp_path) = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(self.dumps())
+            os.chmod(temp_path, 0644)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def __len__(self):
+        return len(self.old_pks)
+
+    def __contains__(self, pk):
+        return self.get(pk) is not None
+
+    def __getitem__(self, pk):
+        new_pk = self.get(pk)
+        if new_pk is None:
+            raise KeyError(pk)
+        return new_pk
+
+    def items(self):
+        '''Yields the (old pk, new pk) pairs, in old pk order.'''
+        return itertools.izip(self.old_pks, self.new_pks)
+
+    def get(self, pk, default=None):
+        '''Returns the new pk for the given old pk, or default if not mapped.'''
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return default
+        index = bisect.bisect_left(self.old_pks, pk)
+        if index < len(self.old_pks) and self.old_pks[index] == pk:
+            return self.new_pks[index]
+        return default
+
+    def get_many(self, pks, default=None):
+        '''Returns a list of the new pks for the given old pks.'''
+        (old_pks, new_pks, count, bisect_left) = (
+            self.old_pks, self.new_pks, len(self.old_pks), bisect.bisect_left)
+        result = [default] * len(pks)
+        for (pk, position) in get_int_pks(pks):
+            index = bisect_left(old_pks, pk)
+            if index < count and old_pks[index] == pk:
+                result[position] = new_pks[index]
+        return result
+
+
+class MappedPkMap(object):
+    '''Maps old pks to new pks from a memory mapped <model>.map.bin file, so
+       the processes using it share its pages, and it's only read as it's used.
+
+       Only every block_size-th old pk is kept in memory, to find the block
+       of the file to search.
+    '''
+
+    block_size = 256
+
+    def __init__(self, path):
+        with open(path, 'rb') as map_file:
+            self._data = mmap.mmap(map_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (self.typecode, self.count) = read_header(self._data)
+        self.itemsize = array.array(self.typecode).itemsize
+        self._new_start = HEADER.size + self.count * self.itemsize
+        self._index = array.array(self.typecode, [
+            self._read(HEADER.size, i, i + 1)[0]
+            for i in xrange(0, self.count, self.block_size)])
+
+    def _read(self, start, first, last):
+        return read_array(self.typecode, self._data,
+                          start + first * self.itemsize, start + last * self.itemsize)
+
+    def _read_block(self, block):
+        '''Returns the first index of the block, and its old pks.'''
+        first = block * self.block_size
+        last = min(first + self.block_size, self.count)
+        return (first, self._read(HEADER.size, first, last))
+
+    def close(self):
+        self._data.close()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, pk):
+        return self.get(pk) is not None
+
+    def __getitem__(self, pk):
+        new_pk = self.get(pk)
+        if new_pk is None:
+            raise KeyError(pk)
+        return new_pk
+
+    def items(self):
+        '''Yields the (old pk, new pk) pairs, in old pk order.'''
+        for block in xrange(len(self._index)):
+            (first, old_pks) = self._read_block(block)
+            new_pks = self._read(self._new_start, first, first + len(old_pks))
+            for pair in itertools.izip(old_pks, new_pks):
+                yield pair
+
+    def get(self, pk, default=None):
+        '''Returns the new pk for the given old pk, or default if not mapped.'''
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return default
+        block = bisect.bisect_right(self._index, pk) - 1
+        if block < 0:
+            return default
+        (first, old_pks) = self._read_block(block)
+        index = bisect.bisect_left(old_pks, pk)
+        if index < len(old_pks) and old_pks[index] == pk:
+            return self._read(self._new_start, first + index, first + index + 1)[0]
+        return default
+
+    def get_many(self, pks, default=None):
+        '''Returns a list of the new pks for the given old pks, looking them up
+           in ascending order, so each block of the file is read once.'''
+        new_pks = [default] * len(pks)
+        (block, first, old_pks) = (None, 0, ())
+        for (pk, position) in sorted(get_int_pks(pks)):
+            pk_block = bisect.bisect_right(self._index, pk) - 1
+            if pk_block < 0:
+                continue
+            if pk_block != block:
+                block = pk_block
+                (first, old_pks) = self._read_block(block)
+            index = bisect.bisect_left(old_pks, pk)
+            if index < len(old_pks) and old_pks[index] == pk:
+                new_pks[position] = self._read(self._new_start, first + index, first + index + 1)[0]
+        return new_pks
+
+
+class PkMapStore(object):
+    '''Loads each (script prefix, model) pk map on first use, and keeps it.
+
+       At most once every REDIRECT_MAP_RELOAD_INTERVAL seconds, the loaded map
+       files are checked in the background, and any which have changed are
+       rebuilt and swapped in.  Requests keep using the previous maps meanwhile.
+
+       If REDIRECT_MAP_MMAP is set, .map.bin files are memory mapped rather
+       than read, so the daemon processes share them.
+    '''
+
+    def __init__(self):
+        self._maps = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._next_check = 0
+
+    def get_path(self, script_prefix, model):
+        '''Returns the model's .map.bin file, or its .map.json file if there's
+           no .map.bin file.'''
+        data_dir = settings.REDIRECT_MAP.get(script_prefix)
+        if not data_dir:
+            return None
+        path = os.path.join(data_dir, '%s.map.bin' % model)
+        json_path = os.path.join(data_dir, '%s.map.json' % model)
+        if not os.path.exists(path) and os.path.exists(json_path):
+            return json_path
+        return path
+
+    def read(self, path):
+        '''Returns the PkMap in the file, and its version: (mtime, size, sha1 digest).'''
+        stat = os.stat(path)
+        with open(path, 'rb') as map_file:
+            data = map_file.read()
+        version = (stat.st_mtime, stat.st_size, hashlib.sha1(data).hexdigest())
+        if settings.REDIRECT_MAP_MMAP and data.startswith(MAGIC):
+            return (MappedPkMap(path), version)
+        return (PkMap.loads(data), version)
+
+    def load(self, script_prefix, model):
+        path = self.get_path(script_prefix, model)
+        if not path:
+            return (None, None)
+        try:
+            return self.read(path)
+        except (IOError, OSError, ValueError):
+            # The pk map file doesn't exist, or is unreadable
+            logging.debug('Unable to read pk map %s' % path)
+            return (PkMap(), None)
+
+    def get(self, script_prefix, model):
+        '''Returns the PkMap for the model under the given script prefix,
+           or None if the script prefix isn't in settings.REDIRECT_MAP.
+        '''
+        self.check()
+        key = (script_prefix, model)
+        try:
+            return self._maps[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._maps:
+                (self._maps[key], self._versions[key]) = self.load(script_prefix, model)
+            return self._maps[key]
+
+    def check(self):
+        '''Starts reloading the changed maps in the background, if they're due
+           to be checked.  Returns the thread started, if any.
+        '''
+        interval = settings.REDIRECT_MAP_RELOAD_INTERVAL
+        if not interval or time.time() < self._next_check:
+            return None
+        with self._lock:
+            now = time.time()
+            if now < self._next_check:
+                return None
+            self._next_check = now + interval
+
+        thread = threading.Thread(target=self.reload, name='pk-map-reload')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def reload(self):
+        '''Rebuilds the loaded maps whose files have changed, and swaps them in.
+
+           Files which are missing or can't be read, e.g. while they're being
+           written, keep their previous map until the next check.
+        '''
+        if not self._reload_lock.acquire(False):
+            return
+        try:
+            for (key, version) in self._versions.items():
+                path = self.get_path(*key)
+                if not path:
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if version and (stat.st_mtime, stat.st_size) == version[:2]:
+                        continue
+                    (pk_map, new_version) = self.read(path)
+                except (IOError, OSError, ValueError):
+                    logging.debug('Unable to reload pk map %s' % path)
+                    continue
+
+                with self._lock:
+                    if key not in self._versions:
+                        # Cleared meanwhile
+                        continue
+                    if not (version and version[2] == new_version[2]):
+                        self._maps[key] = pk_map
+                        logging.info('Reloaded pk map %s' % path)
+                    self._versions[key] = new_version
+        finally:
+            self._reload_lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._maps = {}
+            self._versions = {}
+
+
+pk_maps = PkMapStore()
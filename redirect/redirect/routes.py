@@ -0,0 +1,192 @@
+'''Compiled redirect table, built from redirect.urls and settings.REDIRECT_MAP.
+
+Each URL pattern is compiled once per script prefix into the URL it redirects
+to, or, for ObjectRedirectView, into a template that the mapped pk is
+substituted into.  So requests are redirected without resolving and reversing
+their URLs.
+
+Patterns which can't be compiled are left to the views.
+'''
+import os
+import threading
+from django.conf import settings
+from django.core.urlresolvers import (get_resolver, get_script_prefix, set_script_prefix,
+                                      reverse, RegexURLPattern, NoReverseMatch)
+
+from redirect.hits import hits
+from redirect.pkmaps import pk_maps
+from redirect.views import PathRedirectView, WildcardRedirectView, ObjectRedirectView
+
+
+# Stands in for the new pk when reversing object URLs into templates
+PK_PLACEHOLDER = 918273645546372819
+
+
+class Route(object):
+    '''A URL pattern which is handled by its view.'''
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.name = None
+
+    def get_redirect_url(self, request, match):
+        return None
+
+
+class FixedRoute(Route):
+    '''Redirects to the same URL, whatever the path.'''
+
+    def __init__(self, regex, url):
+        super(FixedRoute, self).__init__(regex)
+        self.url = url
+
+    def get_redirect_url(self, request, match):
+        return self.url
+
+
+class PathRoute(Route):
+    '''Redirects the full path to REDIRECT_BASE, like PathRedirectView.'''
+
+    def __init__(self, regex, script_prefix):
+        super(PathRoute, self).__init__(regex)
+        self.script_prefix = script_prefix
+
+    def get_redirect_url(self, request, match):
+        path = request.get_full_path()
+        if path.startswith(self.script_prefix):
+            path = path[len(self.script_prefix):]
+        return os.path.join(settings.REDIRECT_BASE, path)
+
+
+class ObjectRoute(Route):
+    '''Redirects to the URL of the mapped pk, like ObjectRedirectView.
+
+       Unmapped pks redirect to home_url.
+    '''
+
+    def __init__(self, regex, script_prefix, model, home_url, template):
+        super(ObjectRoute, self).__init__(regex)
+        self.script_prefix = script_prefix
+        self.model = model
+        self.home_url = home_url
+        (self.url_start, self.url_end) = template
+
+    def get_redirect_url(self, request, match):
+        pk_map = pk_maps.get(self.script_prefix, self.model)
+        pk = pk_map.get(match.group('pk')) if pk_map is not None else None
+        if not pk:
+            hits.unmapped(self.script_prefix, self.model, match.group('pk'))
+            return self.home_url
+        return '%s%s%s' % (self.url_start, pk, self.url_end)
+
+
+class RedirectTable(object):
+    '''The compiled routes for a script prefix, in redirect.urls order.'''
+
+    methods = ('GET', 'HEAD')
+
+    def __init__(self, script_prefix, urlconf=None):
+        self.script_prefix = script_prefix
+        previous_prefix = get_script_prefix()
+        set_script_prefix(script_prefix)
+        try:
+            self.routes = []
+            for pattern in get_resolver(urlconf).url_patterns:
+                route = self.compile(pattern)
+                route.name = getattr(pattern, 'name', None) or pattern.regex.pattern
+                self.routes.append(route)
+        finally:
+            set_script_prefix(previous_prefix)
+
+    def compile(self, pattern):
+        '''Returns the Route for the url pattern.'''
+        regex = pattern.regex
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if not isinstance(pattern, RegexURLPattern) or view_class is None:
+            return Route(regex)
+
+        default_args = pattern.default_args
+        try:
+            if view_class is PathRedirectView:
+                return PathRoute(regex, self.script_prefix)
+
+            if view_class is WildcardRedirectView:
+                return FixedRoute(regex, view_class().get_redirect_url(**default_args))
+
+            if view_class is ObjectRedirectView:
+                # Unmapped pks and patterns without pks redirect home
+                home_url = view_class().get_redirect_url(**default_args)
+                if 'pk' not in regex.groupindex:
+                    return FixedRoute(regex, home_url)
+                if not default_args.get('model'):
+                    return FixedRoute(regex, home_url)
+
+                # Other arguments must be fixed by the pattern's defaults
+                if 'pk' in default_args or not set(regex.groupindex).issubset(
+                        set(default_args) | set(['pk'])):
+                    return Route(regex)
+
+                url_kwargs = dict(default_args, pk=PK_PLACEHOLDER)
+                path = reverse(pattern.name, kwargs=url_kwargs)
+                template = view_class().get_redirect_from_path(path).split(str(PK_PLACEHOLDER))
+                if len(template) != 2:
+                    return Route(regex)
+                return ObjectRoute(regex, self.script_prefix, default_args['model'],
+                                   home_url, template)
+        except NoReverseMatch:
+            pass
+        return Route(regex)
+
+    def get_redirect_url(self, request):
+        '''Returns the URL to redirect the request to, or None to leave it to the views.'''
+        if request.method not in self.methods:
+            return None
+        path = request.path_info[1:]
+        for route in self.routes:
+            match = route.regex.search(path)
+            if match:
+                url = route.get_redirect_url(request, match)
+                if url:
+                    hits.hit(self.script_prefix, route.name)
+                return url
+        return None
+
+
+class RedirectTableStore(object):
+    '''Builds the RedirectTable for each script prefix in REDIRECT_MAP on first use.'''
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, script_prefix):
+        '''Returns the RedirectTable for the script prefix, or None if it isn't in REDIRECT_MAP.'''
+        try:
+            return self._tables[script_prefix]
+        except KeyError:
+            pass
+        with self._lock:
+            if script_prefix not in self._tables:
+                if script_prefix in settings.REDIRECT_MAP:
+                    self._tables[script_prefix] = RedirectTable(script_prefix)
+                else:
+                    self._tables[script_prefix] = None
+            return self._tables[script_prefix]
+
+    def load(self):
+        '''Builds the tables for all the script prefixes in REDIRECT_MAP.'''
+        for script_prefix in settings.REDIRECT_MAP:
+            self.get(script_prefix)
+
+    def clear(self):
+        with self._lock:
+            self._tables = {}
+
+    def get_redirect_url(self, request):
+        table = self.get(get_script_prefix())
+        if table is None:
+            return None
+        return table.get_redirect_url(request)
+
+
+redirect_tables = RedirectTableStore()
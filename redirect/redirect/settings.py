@@ -19,6 +19,12 @@ INSTALLED_APPS = (
     'redirect',
 )
 
+MIDDLEWARE_CLASSES = (
+    'redirect.middleware.CompiledRedirectMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+)
+
 ALLOWED_HOSTS = '*'
 
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -32,4 +38,25 @@ REDIRECT_MAP = {
         os.path.join(BASE_DIR, 'data', 'production-3T2015'),
 }
 
+# Seconds between checks for changed pk map files, or None to never reload them
+REDIRECT_MAP_RELOAD_INTERVAL = 60
+
+# Memory map the .map.bin pk map files, rather than reading a copy into each process
+REDIRECT_MAP_MMAP = False
+
+# Where to append the number of redirects of each route, and of unmapped pks,
+# every REDIRECT_HITS_FLUSH_INTERVAL seconds, or None to not count them
+REDIRECT_HITS_FILE = os.path.join(BASE_DIR, 'hits', 'hits.jsonl')
+REDIRECT_HITS_FLUSH_INTERVAL = 60
+
+# Hits files larger than this are moved to <file>.1, replacing the previous one,
+# or None to let them grow
+REDIRECT_HITS_MAX_BYTES = 10 * 1024 * 1024
+
+# Where httpd logs the redirects made by the exported rewrite rules, or None to
+# not log them.  Read by redirect_hits, along with REDIRECT_HITS_FILE.
+REDIRECT_HITS_LOG = os.path.join(BASE_DIR, 'hits', 'httpd.log')
+if os.environ.get('DJANGO_GALLERY_ENVIRONMENT') == 'testing':
+    REDIRECT_HITS_FILE = None
+
 REDIRECT_BASE = 'https://lti-adx.adelaide.edu.au/think.create.code/processingjs'
@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import tempfile
+from django.test import SimpleTestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.six import StringIO
+
+from redirect.hits import hits, HitCounter
+from redirect.pkmaps import pk_maps
+from redirect.routes import redirect_tables
+
+
+class HitsTests(SimpleTestCase):
+    '''Redirect hit counting tests'''
+
+    def setUp(self):
+        super(HitsTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.data_dir, 'artwork.artwork.map.json'), 'w') as map_file:
+            json.dump({'1': 101}, map_file)
+        self.hits_file = os.path.join(self.data_dir, 'hits', 'hits.jsonl')
+        self.hits_log = os.path.join(self.data_dir, 'hits', 'httpd.log')
+        self.settings_override = override_settings(
+            REDIRECT_MAP={'/': self.data_dir},
+            REDIRECT_HITS_FILE=self.hits_file,
+            REDIRECT_HITS_LOG=self.hits_log,
+            REDIRECT_HITS_MAX_BYTES=None,
+            REDIRECT_HITS_FLUSH_INTERVAL=60,
+        )
+        self.settings_override.enable()
+        pk_maps.clear()
+        redirect_tables.clear()
+        hits.clear()
+
+    def tearDown(self):
+        hits.clear()
+        pk_maps.clear()
+        redirect_tables.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+        super(HitsTests, self).tearDown()
+
+    def read(self):
+        with open(self.hits_file) as hits_file:
+            return sorted((json.loads(line) for line in hits_file),
+                          key=lambda record: (record.get('route'), record.get('pk')))
+
+    def test_flush(self):
+        counter = HitCounter()
+        self.assertEquals(counter.flush(), 0)
+        self.assertFalse(os.path.exists(self.hits_file))
+
+        counter.hit('/', 'artwork-view')
+        counter.hit('/', 'artwork-view')
+        counter.unmapped('/', 'artwork.artwork', '5')
+        self.assertEquals(counter.flush(), 2)
+        self.assertEquals(counter.flush(), 0)
+        records = self.read()
+        self.assertEquals(records[0]['pk'], '5')
+        self.assertEquals(records[0]['hits'], 1)
+        self.assertEquals(records[1]['route'], 'artwork-view')
+        self.assertEquals(records[1]['hits'], 2)
+
+        # Appended
+        counter.hit('/', 'help')
+        counter.flush()
+        self.assertEquals(len(self.read()), 3)
+
+    def test_check(self):
+        counter = HitCounter()
+        counter.hit('/', 'help')
+        self.assertIsNone(counter.check())
+        self.assertFalse(os.path.exists(self.hits_file))
+
+        counter._next_flush = 0
+        counter.check().join()
+        self.assertEquals(self.read()[0]['route'], 'help')
+
+    @override_settings(REDIRECT_HITS_FILE=None)
+    def test_disabled(self):
+        counter = HitCounter()
+        counter.hit('/', 'help')
+        self.assertEquals(counter.clear(), ({}, {}))
+
+    def test_requests(self):
+        client = Client()
+        client.get('/a/1/')
+        client.get('/a/1/')
+        client.get('/a/2/')
+        client.get('/help/')
+        client.post('/share/', {'path': '/a/1/'})
+        hits.flush()
+
+        records = self.read()
+        self.assertEquals([(record.get('route'), record.get('pk'), record['hits']) for record in records], [
+            (None, '2', 1),
+            ('artwork-view', None, 3),
+            ('help', None, 1),
+            ('share', None, 1),
+        ])
+
+        out = StringIO()
+        call_command('redirect_hits', stdout=out)
+        self.assertIn('5 hits', out.getvalue())
+        self.assertIn('         3  /  artwork-view', out.getvalue())
+        self.assertIn('         1  /  artwork.artwork 2', out.getvalue())
+
+    @override_settings(REDIRECT_HITS_MAX_BYTES=200)
+    def test_rotate(self):
+        counter = HitCounter()
+        counter.hit('/', 'help')
+        counter.flush()
+        self.assertFalse(os.path.exists('%s.1' % self.hits_file))
+
+        # Moved aside once larger than REDIRECT_HITS_MAX_BYTES, replacing the previous file
+        counter.hit('/', 'artwork-view')
+        counter.hit('/', 'terms')
+        counter.flush()
+        self.assertFalse(os.path.exists(self.hits_file))
+        counter.hit('/', 'share')
+        counter.flush()
+        self.assertEquals([record['route'] for record in self.read()], ['share'])
+
+        out = StringIO()
+        call_command('redirect_hits', stdout=out)
+        self.assertIn('4 hits', out.getvalue())
+
+    def test_report_log(self):
+        counter = HitCounter()
+        counter.hit('/', 'artwork-view')
+        counter.flush()
+        with open('%s.1' % self.hits_log, 'w') as log_file:
+            log_file.write('1450000000 / artwork-view\n')
+        with open(self.hits_log, 'w') as log_file:
+            log_file.write('1450000060 / artwork-view\n1450000120 / help\n1450000')
+
+        out = StringIO()
+        call_command('redirect_hits', stdout=out)
+        self.assertIn('4 hits, 3 redirected by httpd', out.getvalue())
+        self.assertIn('         3  /  artwork-view', out.getvalue())
+        self.assertIn('         1  /  help', out.getvalue())
+
+        # The log alone
+        os.remove(self.hits_file)
+        out = StringIO()
+        call_command('redirect_hits', stdout=out)
+        self.assertIn('3 hits, 3 redirected by httpd', out.getvalue())
+
+    def test_report_missing(self):
+        with self.assertRaises(CommandError):
+            call_command('redirect_hits', stdout=StringIO())
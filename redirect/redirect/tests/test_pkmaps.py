@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from StringIO import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from redirect.pkmaps import PkMap, MappedPkMap, PkMapStore, pk_maps
+
+
+class PkMapTests(SimpleTestCase):
+    '''PkMap tests'''
+
+    def test_get(self):
+        pk_map = PkMap({'10': 3, '2': 1, '7': 2}.items())
+        self.assertEquals(len(pk_map), 3)
+        self.assertEquals(pk_map.get('2'), 1)
+        self.assertEquals(pk_map.get(7), 2)
+        self.assertEquals(pk_map.get('10'), 3)
+        self.assertIsNone(pk_map.get('1'))
+        self.assertIsNone(pk_map.get('11'))
+        self.assertIsNone(pk_map.get('abc'))
+        self.assertEquals(pk_map.get('5', 0), 0)
+
+    def test_large_pks(self):
+        pk_map = PkMap([('3000000000', 4000000000)])
+        self.assertEquals(pk_map.get('3000000000'), 4000000000)
+
+    def test_empty(self):
+        pk_map = PkMap()
+        self.assertEquals(len(pk_map), 0)
+        self.assertIsNone(pk_map.get('1'))
+
+    def test_mapping(self):
+        pk_map = PkMap({'10': 3, '2': 1}.items())
+        self.assertEquals(pk_map['10'], 3)
+        self.assertIn('2', pk_map)
+        self.assertNotIn('3', pk_map)
+        self.assertRaises(KeyError, lambda: pk_map['3'])
+        self.assertEquals(list(pk_map.items()), [(2, 1), (10, 3)])
+
+    def test_get_many(self):
+        pk_map = PkMap({'10': 3, '2': 1, '7': 2}.items())
+        self.assertEquals(pk_map.get_many(['7', 'abc', 2, '5', '10', '7']), [2, None, 1, None, 3, 2])
+        self.assertEquals(pk_map.get_many(['5', '11'], 0), [0, 0])
+        self.assertEquals(pk_map.get_many([]), [])
+
+    def test_binary(self):
+        pk_map = PkMap({'10': 3, '2': 1, '7': 2}.items())
+        data = pk_map.dumps()
+        self.assertEquals(len(data), 16 + 2 * 3 * 4)
+        loaded = PkMap.loads(data)
+        self.assertEquals(list(loaded.items()), list(pk_map.items()))
+
+        # Large pks use 8 bytes each
+        loaded = PkMap.loads(PkMap([('3000000000', 4000000000)]).dumps())
+        self.assertEquals(loaded.get('3000000000'), 4000000000)
+
+        self.assertEquals(len(PkMap.loads(PkMap().dumps())), 0)
+
+        # JSON is still read
+        self.assertEquals(PkMap.loads(json.dumps({'2': 1})).get('2'), 1)
+
+    def test_binary_truncated(self):
+        data = PkMap({'10': 3, '2': 1}.items()).dumps()
+        self.assertRaises(ValueError, PkMap.loads, data[:-1])
+        self.assertRaises(ValueError, PkMap.loads, data[:10])
+
+
+class SmallBlockPkMap(MappedPkMap):
+    block_size = 4
+
+
+class MappedPkMapTests(SimpleTestCase):
+    '''MappedPkMap tests'''
+
+    def setUp(self):
+        super(MappedPkMapTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'artwork.artwork.map.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        super(MappedPkMapTests, self).tearDown()
+
+    def get_map(self, pairs):
+        PkMap(pairs).save(self.path)
+        return SmallBlockPkMap(self.path)
+
+    def test_get(self):
+        pairs = [(str(pk * 3), pk + 100) for pk in range(1, 11)]
+        pk_map = self.get_map(pairs)
+        self.assertEquals(len(pk_map), 10)
+        for (old, new) in pairs:
+            self.assertEquals(pk_map.get(old), new)
+            self.assertEquals(pk_map[old], new)
+        for pk in ['0', '1', '4', '31', 'abc']:
+            self.assertIsNone(pk_map.get(pk))
+            self.assertNotIn(pk, pk_map)
+        self.assertEquals(pk_map.get('2', 0), 0)
+        self.assertEquals(list(pk_map.items()), list(PkMap(pairs).items()))
+        pk_map.close()
+
+    def test_get_many(self):
+        pairs = [(str(pk * 3), pk + 100) for pk in range(1, 11)]
+        pk_map = self.get_map(pairs)
+        pks = ['30', '1', '3', 'abc', '15', '16', '3', '33']
+        self.assertEquals(pk_map.get_many(pks), PkMap(pairs).get_many(pks))
+        pk_map.close()
+
+    def test_empty(self):
+        pk_map = self.get_map([])
+        self.assertEquals(len(pk_map), 0)
+        self.assertIsNone(pk_map.get('1'))
+        self.assertEquals(pk_map.get_many(['1']), [None])
+        self.assertEquals(list(pk_map.items()), [])
+        pk_map.close()
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as map_file:
+            map_file.write(PkMap([('1', 2)]).dumps()[:-1])
+        self.assertRaises(ValueError, MappedPkMap, self.path)
+
+
+class PkMapStoreTests(SimpleTestCase):
+    '''PkMapStore tests'''
+
+    def setUp(self):
+        super(PkMapStoreTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.data_dir, 'artwork.artwork.map.json'), 'w') as map_file:
+            json.dump({'1': 101, '2': 102}, map_file)
+        self.settings_override = override_settings(REDIRECT_MAP={
+            '/': self.data_dir,
+        })
+        self.settings_override.enable()
+        pk_maps.clear()
+
+    def tearDown(self):
+        pk_maps.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+        super(PkMapStoreTests, self).tearDown()
+
+    def test_get(self):
+        store = PkMapStore()
+        pk_map = store.get('/', 'artwork.artwork')
+        self.assertEquals(pk_map.get('2'), 102)
+
+        # Loaded only once
+        os.remove(os.path.join(self.data_dir, 'artwork.artwork.map.json'))
+        self.assertIs(store.get('/', 'artwork.artwork'), pk_map)
+
+        # Reloaded once cleared
+        store.clear()
+        self.assertEquals(len(store.get('/', 'artwork.artwork')), 0)
+
+    def test_binary(self):
+        PkMap([('2', 202)]).save(os.path.join(self.data_dir, 'artwork.artwork.map.bin'))
+        store = PkMapStore()
+        pk_map = store.get('/', 'artwork.artwork')
+        self.assertIsInstance(pk_map, PkMap)
+        self.assertEquals(pk_map.get('2'), 202)
+        self.assertIsNone(pk_map.get('1'))
+
+    @override_settings(REDIRECT_MAP_MMAP=True)
+    def test_mmap(self):
+        PkMap([('2', 202)]).save(os.path.join(self.data_dir, 'artwork.artwork.map.bin'))
+        store = PkMapStore()
+        pk_map = store.get('/', 'artwork.artwork')
+        self.assertIsInstance(pk_map, MappedPkMap)
+        self.assertEquals(pk_map.get('2'), 202)
+
+        # JSON files are read
+        with open(os.path.join(self.data_dir, 'lti.user.map.json'), 'w') as map_file:
+            json.dump({'1': 11}, map_file)
+        self.assertIsInstance(store.get('/', 'lti.user'), PkMap)
+        self.assertEquals(store.get('/', 'lti.user').get('1'), 11)
+
+    def test_missing(self):
+        store = PkMapStore()
+        self.assertIsNone(store.get('/unknown/', 'artwork.artwork'))
+        self.assertEquals(len(store.get('/', 'lti.user')), 0)
+
+    def test_threads(self):
+        store = PkMapStore()
+        loaded = []
+        def run():
+            loaded.append(store.get('/', 'artwork.artwork'))
+        threads = [threading.Thread(target=run) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(set(id(pk_map) for pk_map in loaded)), 1)
+
+    def write_map(self, pk_map, mtime):
+        path = os.path.join(self.data_dir, 'artwork.artwork.map.json')
+        with open(path, 'w') as map_file:
+            map_file.write(pk_map)
+        os.utime(path, (mtime, mtime))
+
+    def test_reload(self):
+        store = PkMapStore()
+        pk_map = store.get('/', 'artwork.artwork')
+        mtime = os.stat(os.path.join(self.data_dir, 'artwork.artwork.map.json')).st_mtime
+
+        # Same content, touched
+        self.write_map(json.dumps({'1': 101, '2': 102}), mtime + 10)
+        store.reload()
+        self.assertIs(store.get('/', 'artwork.artwork'), pk_map)
+
+        # Partly written
+        self.write_map('{"1": 101, "2"', mtime + 20)
+        store.reload()
+        self.assertIs(store.get('/', 'artwork.artwork'), pk_map)
+
+        # Changed
+        self.write_map(json.dumps({'1': 101, '2': 202, '3': 203}), mtime + 30)
+        store.reload()
+        self.assertEquals(store.get('/', 'artwork.artwork').get('2'), 202)
+        self.assertEquals(store.get('/', 'artwork.artwork').get('3'), 203)
+
+        # Created
+        self.assertIsNone(store.get('/', 'lti.user').get('1'))
+        with open(os.path.join(self.data_dir, 'lti.user.map.json'), 'w') as map_file:
+            json.dump({'1': 11}, map_file)
+        store.reload()
+        self.assertEquals(store.get('/', 'lti.user').get('1'), 11)
+
+        # Converted
+        PkMap([('1', 12)]).save(os.path.join(self.data_dir, 'lti.user.map.bin'))
+        store.reload()
+        self.assertEquals(store.get('/', 'lti.user').get('1'), 12)
+
+    @override_settings(REDIRECT_MAP_RELOAD_INTERVAL=60)
+    def test_check(self):
+        store = PkMapStore()
+        store.get('/', 'artwork.artwork')
+        self.write_map(json.dumps({'2': 302}), time.time() + 10)
+
+        # Checked at most once per interval
+        store._next_check = time.time() + 60
+        self.assertIsNone(store.check())
+        self.assertEquals(store.get('/', 'artwork.artwork').get('2'), 102)
+
+        store._next_check = 0
+        store.check().join()
+        self.assertEquals(store.get('/', 'artwork.artwork').get('2'), 302)
+        self.assertIsNone(store.check())
+
+    @override_settings(REDIRECT_MAP_RELOAD_INTERVAL=None)
+    def test_no_reload(self):
+        store = PkMapStore()
+        store.get('/', 'artwork.artwork')
+        self.assertIsNone(store.check())
+
+    def test_redirect(self):
+        client = Client()
+        response = client.get('/a/2/')
+        self.assertEquals(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith('/processingjs/a/102/'))
+
+        # Unmapped pks redirect home
+        response = client.get('/a/3/')
+        self.assertEquals(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith('/processingjs/'))
+
+
+class ConvertPkMapsTests(SimpleTestCase):
+    '''convert_pk_maps command tests'''
+
+    def setUp(self):
+        super(ConvertPkMapsTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        for (model, pks) in [('artwork.artwork', {'1': 101, '2': 102}), ('lti.user', {'5': 6})]:
+            with open(os.path.join(self.data_dir, '%s.map.json' % model), 'w') as map_file:
+                json.dump(pks, map_file, indent=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        super(ConvertPkMapsTests, self).tearDown()
+
+    def convert(self, *args, **options):
+        out = StringIO()
+        call_command('convert_pk_maps', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_convert(self):
+        out = self.convert(self.data_dir)
+        self.assertIn('Converted 2 of 2 pk maps', out)
+        pk_map = PkMap.load(os.path.join(self.data_dir, 'artwork.artwork.map.bin'))
+        self.assertEquals(list(pk_map.items()), [(1, 101), (2, 102)])
+        self.assertEquals(PkMap.load(os.path.join(self.data_dir, 'lti.user.map.bin')).get('5'), 6)
+
+        # Up to date files are skipped
+        self.assertIn('Converted 0 of 2 pk maps', self.convert(self.data_dir))
+        self.assertIn('Converted 2 of 2 pk maps', self.convert(self.data_dir, force=True))
+
+        # Single files
+        path = os.path.join(self.data_dir, 'lti.user.map.json')
+        self.assertIn('Converted 1 of 1 pk maps', self.convert(path, force=True))
+
+    def test_invalid(self):
+        self.assertRaises(CommandError, self.convert, os.path.join(self.data_dir, 'missing'))
+        with open(os.path.join(self.data_dir, 'lti.user.map.json'), 'w') as map_file:
+            map_file.write('{"5": ')
+        self.assertRaises(CommandError, self.convert, self.data_dir)
+
+    def test_default(self):
+        with override_settings(REDIRECT_MAP={'/': self.data_dir, '/other/': self.data_dir}):
+            self.assertIn('Converted 2 of 2 pk maps', self.convert())
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import shutil
+import tempfile
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.core.management import call_command
+from django.core.urlresolvers import resolve, get_script_prefix, set_script_prefix
+from django.utils.six import StringIO
+
+from redirect.pkmaps import pk_maps
+from redirect.routes import redirect_tables
+from redirect.tests import test_routes
+
+
+class ExportRewriteMapsTests(SimpleTestCase):
+    '''export_rewrite_maps tests'''
+
+    prefixes = ('/think.create.code/gallery/', '/think.create.code/3t2015/gallery/')
+
+    def setUp(self):
+        super(ExportRewriteMapsTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        for (data_dir, maps) in (('2T2015', {'artwork.artwork': {'1': 101, '2': 0}}),
+                                 ('3T2015', {'lti.user': {'1': 21}})):
+            os.makedirs(os.path.join(self.data_dir, data_dir))
+            for (model, pk_map) in maps.items():
+                path = os.path.join(self.data_dir, data_dir, '%s.map.json' % model)
+                with open(path, 'w') as map_file:
+                    json.dump(pk_map, map_file)
+        self.hits_log = os.path.join(self.output_dir, 'hits', 'httpd.log')
+        self.settings_override = override_settings(
+            REDIRECT_MAP={
+                '/': os.path.join(self.data_dir, '2T2015'),
+                '/think.create.code/gallery/': os.path.join(self.data_dir, '2T2015'),
+                '/think.create.code/3t2015/gallery/': os.path.join(self.data_dir, '3T2015'),
+            },
+            REDIRECT_HITS_LOG=self.hits_log,
+            REDIRECT_HITS_MAX_BYTES=1024 * 1024,
+        )
+        self.settings_override.enable()
+        pk_maps.clear()
+        redirect_tables.clear()
+        self.script_prefix = get_script_prefix()
+
+    def tearDown(self):
+        set_script_prefix(self.script_prefix)
+        pk_maps.clear()
+        redirect_tables.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+        shutil.rmtree(self.output_dir)
+        super(ExportRewriteMapsTests, self).tearDown()
+
+    def export(self):
+        out = StringIO()
+        call_command('export_rewrite_maps', output_dir=self.output_dir, stdout=out)
+        with open(os.path.join(self.output_dir, 'redirect.conf')) as conf:
+            return (out.getvalue(), conf.read())
+
+    def rewrite(self, conf, method, url):
+        '''Emulates the mod_rewrite rules in conf, returning the redirect
+           location, or None if the request is passed on.
+        '''
+        maps = {}
+        conds = []
+        (path, _, query) = url.partition('?')
+        for line in conf.splitlines():
+            if line.startswith('RewriteMap '):
+                (name, source) = line.split()[1:]
+                with open(source[len('txt:'):]) as map_file:
+                    maps[name] = dict(map_line.split() for map_line in map_file)
+            elif line.startswith('RewriteCond '):
+                conds.append(line.split()[1:])
+            elif line.startswith('RewriteRule '):
+                (pattern, substitution, flags) = line.split()[1:]
+                match = re.search(pattern, path)
+                matched = match is not None
+                cond_match = None
+                for (test, cond_pattern) in conds:
+                    if not matched:
+                        break
+                    test = test.replace('%{REQUEST_METHOD}', method)
+                    test = re.sub(r'\$\{([^:]+):\$(\d)\}',
+                                  lambda m: maps[m.group(1)].get(match.group(int(m.group(2))), ''), test)
+                    cond_match = re.search(cond_pattern, test)
+                    matched = cond_match is not None
+                conds = []
+                if not matched:
+                    continue
+                if substitution == '-':
+                    return None
+                location = re.sub(r'\$(\d)', lambda m: match.group(int(m.group(1))), substitution)
+                location = re.sub(r'%(\d)', lambda m: cond_match.group(int(m.group(1))), location)
+                if query and 'QSD' not in flags:
+                    location = '%s?%s' % (location, query)
+                return location
+        return None
+
+    def test_export(self):
+        (out, conf) = self.export()
+        self.assertIn('Wrote 8 rewrite maps', out)
+        with open(os.path.join(self.output_dir, '2T2015', 'artwork.artwork.map.txt')) as map_file:
+            self.assertEquals(map_file.read(), '1 101\n')
+        with open(os.path.join(self.output_dir, '3T2015', 'lti.user.map.txt')) as map_file:
+            self.assertEquals(map_file.read(), '1 21\n')
+
+        # The testing prefix would match every URL
+        self.assertNotIn('# /\n', conf)
+
+    def test_same_as_views(self):
+        (out, conf) = self.export()
+        factory = RequestFactory()
+        for script_prefix in self.prefixes:
+            for path in test_routes.RedirectTableTests.paths:
+                url = '%s%s' % (script_prefix.rstrip('/'), path)
+                location = self.rewrite(conf, 'GET', url)
+                if location is None:
+                    continue
+                set_script_prefix(script_prefix)
+                request = factory.get(path, SCRIPT_NAME=script_prefix.rstrip('/'))
+                match = resolve(request.path_info)
+                response = match.func(request, *match.args, **match.kwargs)
+                self.assertEquals(location, response['Location'], url)
+
+        # Mapped pks are redirected by httpd, unmapped pks and other methods by Django
+        self.assertTrue(self.rewrite(conf, 'GET', '/think.create.code/gallery/a/1/').endswith('/a/101/'))
+        self.assertIsNone(self.rewrite(conf, 'GET', '/think.create.code/gallery/a/2/'))
+        self.assertIsNone(self.rewrite(conf, 'GET', '/think.create.code/gallery/a/3/'))
+        self.assertIsNone(self.rewrite(conf, 'POST', '/think.create.code/gallery/a/1/'))
+        self.assertIsNone(self.rewrite(conf, 'GET', '/think.create.code/gallery/share/'))
+        self.assertTrue(self.rewrite(conf, 'GET', '/think.create.code/3t2015/gallery/a/by/1/').endswith('/a/by/21/'))
+        self.assertIsNone(self.rewrite(conf, 'GET', '/think.create.code/processingjs/a/1/'))
+
+    def test_hits_log(self):
+        (out, conf) = self.export()
+        self.assertIn('CustomLog "|/usr/sbin/rotatelogs -n 2 %s 1024K" '
+                      '"%%{sec}t %%{redirect_prefix}e %%{redirect_route}e" env=redirect_route\n' % self.hits_log,
+                      conf)
+        self.assertTrue(os.path.isdir(os.path.dirname(self.hits_log)))
+
+        # Redirecting rules name their route; rules passing requests on to Django don't
+        redirects = [line for line in conf.splitlines()
+                     if line.startswith('RewriteRule ') and not line.split()[2] == '-']
+        self.assertTrue(redirects)
+        for line in redirects:
+            self.assertRegexpMatches(line, r',E=redirect_prefix:/[\w./]+/,E=redirect_route:[\w-]+\]$')
+        self.assertIn('E=redirect_prefix:/think.create.code/3t2015/gallery/,E=redirect_route:artwork-author-list]', conf)
+        self.assertNotIn('E=redirect', '\n'.join(line for line in conf.splitlines() if line.endswith(' - [L]')))
+
+        with override_settings(REDIRECT_HITS_MAX_BYTES=None):
+            (out, conf) = self.export()
+            self.assertIn('CustomLog %s "' % self.hits_log, conf)
+
+        with override_settings(REDIRECT_HITS_LOG=None):
+            (out, conf) = self.export()
+            self.assertNotIn('CustomLog', conf)
@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import tempfile
+from django.test import SimpleTestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.core.urlresolvers import resolve, get_script_prefix, set_script_prefix
+
+from redirect.pkmaps import pk_maps
+from redirect.routes import redirect_tables, RedirectTable, ObjectRoute, PathRoute, FixedRoute
+
+
+class RedirectTableTests(SimpleTestCase):
+    '''RedirectTable tests'''
+
+    paths = (
+        '/', '/admin/', '/lti/launch/?x=1', '/auth/login/?next=/a/1/', '/logout/',
+        '/help', '/terms/', '/artwork/studio/',
+        '/a', '/a/', '/a/score/', '/a/list/',
+        '/a/by/1/', '/a/by/1/0/', '/a/by/1/code.zip', '/a/by/2/0/code.zip', '/a/by/3/',
+        '/s1.pde', '/s2.pde', '/artwork/new/',
+        '/artwork/edit/1/', '/artwork/clone/2/', '/artwork/delete/3/',
+        '/a/1/', '/a/2/', '/a/3/', '/a/0/', '/a/1/?q=1', '/artwork1.pde', '/artwork2.pde',
+        '/artwork/render/1/', '/artwork/render/', '/artwork/submit/1/',
+        '/e', '/e/1/score/', '/e/list/1,2/', '/e/list/', '/e/1/', '/e/9/',
+        '/exhibition/new/', '/exhibition/edit/1/', '/exhibition/delete/2/',
+        '/s/1/', '/s/3/', '/submission/delete/2/',
+        '/unknown/path/',
+    )
+
+    prefixes = ('/', '/think.create.code/gallery/')
+
+    def setUp(self):
+        super(RedirectTableTests, self).setUp()
+        self.data_dir = tempfile.mkdtemp()
+        maps = {
+            'artwork.artwork': {'1': 101, '2': 102, '0': 100},
+            'exhibitions.exhibition': {'1': 11},
+            'lti.user': {'1': 21, '2': 22},
+            'submissions.submission': {'1': 31, '2': 0},
+        }
+        for (model, pk_map) in maps.items():
+            with open(os.path.join(self.data_dir, '%s.map.json' % model), 'w') as map_file:
+                json.dump(pk_map, map_file)
+        self.settings_override = override_settings(REDIRECT_MAP=dict(
+            (prefix, self.data_dir) for prefix in self.prefixes
+        ))
+        self.settings_override.enable()
+        pk_maps.clear()
+        redirect_tables.clear()
+        self.script_prefix = get_script_prefix()
+
+    def tearDown(self):
+        set_script_prefix(self.script_prefix)
+        pk_maps.clear()
+        redirect_tables.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.data_dir)
+        super(RedirectTableTests, self).tearDown()
+
+    def get_request(self, script_prefix, path):
+        set_script_prefix(script_prefix)
+        return RequestFactory().get(path, SCRIPT_NAME=script_prefix.rstrip('/'))
+
+    def test_routes(self):
+        table = RedirectTable('/')
+        routes = dict((route.regex.pattern, route) for route in table.routes)
+        self.assertIsInstance(routes[r'^a/(?P<pk>\d+)/$'], ObjectRoute)
+        self.assertIsInstance(routes[r'^help/?$'], PathRoute)
+        self.assertIsInstance(routes[r'^.*/$'], FixedRoute)
+        self.assertIsInstance(routes[r'^e/list/(?P<pk_list>[\d,]+)?/?$'], FixedRoute)
+        self.assertEquals(type(routes[r'^share/?$']).__name__, 'Route')
+
+    def test_same_as_views(self):
+        for script_prefix in self.prefixes:
+            for path in self.paths:
+                request = self.get_request(script_prefix, path)
+                match = resolve(request.path_info)
+                response = match.func(request, *match.args, **match.kwargs)
+                self.assertEquals(redirect_tables.get_redirect_url(request), response['Location'],
+                                  '%s%s' % (script_prefix, path))
+
+    def test_fallback(self):
+        # ShareView isn't a redirect
+        request = self.get_request('/', '/share/')
+        self.assertIsNone(redirect_tables.get_redirect_url(request))
+
+        # Nor are other methods
+        set_script_prefix('/')
+        request = RequestFactory().post('/a/1/')
+        self.assertIsNone(redirect_tables.get_redirect_url(request))
+
+        # Nor script prefixes not in REDIRECT_MAP
+        request = self.get_request('/other/', '/a/1/')
+        self.assertIsNone(redirect_tables.get_redirect_url(request))
+
+    def test_middleware(self):
+        client = Client()
+        response = client.get('/a/1/')
+        self.assertEquals(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith('/processingjs/a/101/'))
+
+        response = client.get('/share/')
+        self.assertEquals(response.status_code, 200)
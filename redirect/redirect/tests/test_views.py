@@ -1,8 +1,8 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 from django.test.client import Client
 from django.core.urlresolvers import reverse
 
-class ShareViewTests(TestCase):
+class ShareViewTests(SimpleTestCase):
     '''ShareView tests'''
 
     def test_share(self):
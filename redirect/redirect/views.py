@@ -1,6 +1,5 @@
 import os
 import re
-import json
 import logging
 from django.conf import settings
 from django.http import JsonResponse
@@ -9,6 +8,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.core.urlresolvers import get_script_prefix, reverse, resolve, Resolver404, NoReverseMatch
 
+from redirect.hits import hits
+from redirect.pkmaps import pk_maps
+
 
 class PathRedirectView(RedirectView):
 
@@ -68,10 +70,6 @@ class WildcardRedirectView(PathRedirectView):
 
 class ObjectRedirectView(PathRedirectView):
 
-    def __init__(self, *args, **kwargs):
-        super(ObjectRedirectView, self).__init__(*args, **kwargs)
-        self.model_pk_map = {}
-
     def get_redirect_url(self, path=None, *args, **kwargs):
         if not path:
             path = reverse('home')
@@ -107,24 +105,13 @@ class ObjectRedirectView(PathRedirectView):
         logging.debug('   script_prefix: %s' % script_prefix)
         logging.debug('   pk: %s' % pk)
         logging.debug('   model: %s' % model)
-        if pk and model and (script_prefix in settings.REDIRECT_MAP):
-            data_dir = settings.REDIRECT_MAP[script_prefix]
-            logging.debug('   data_dir: %s' % data_dir)
-        else:
+        if not (pk and model):
             return None
 
-        if not (script_prefix in self.model_pk_map):
-            self.model_pk_map[script_prefix] = {}
-
-        if not (model in self.model_pk_map[script_prefix]):
-            try:
-                data_file = os.path.join(data_dir, '%s.map.json' % model)
-                fp = open(data_file)
-                self.model_pk_map[script_prefix][model] = json.load(fp)
-                fp.close()
-            except IOError:
-                # The pk map file doesn't exist, or is unreadable
-                logging.debug('   IOError')
-                self.model_pk_map[script_prefix][model] = {}
-
-        return self.model_pk_map[script_prefix][model].get(pk)
+        pk_map = pk_maps.get(script_prefix, model)
+        if pk_map is None:
+            return None
+        new_pk = pk_map.get(pk)
+        if not new_pk:
+            hits.unmapped(script_prefix, model, pk)
+        return new_pk